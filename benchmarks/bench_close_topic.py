@@ -0,0 +1,69 @@
+"""
+Задержка закрытия темы в зависимости от общего числа связей сообщений.
+
+Запуск: python -m benchmarks.bench_close_topic
+
+Сравнивает текущий remove_topic (связи принадлежат теме, O(k)) со старым
+проходом по плоскому словарю g2u с эвристикой ±1000 (O(всех связей)).
+"""
+import os
+import random
+import time
+
+from benchmarks.common import setup_env, fmt_us
+
+workdir = setup_env()
+
+from bot.utils.storage import MemoryStorage  # noqa: E402
+
+LINKS_PER_TOPIC = 20
+TOTALS = (10_000, 100_000, 1_000_000)
+CLOSES = 200
+LEGACY_CLOSES = 10
+
+
+def build(total: int) -> MemoryStorage:
+    s = MemoryStorage(path=os.path.join(workdir, f"bench_{total}.json"))
+    msg_id = 1
+    for n in range(total // LINKS_PER_TOPIC):
+        topic_id = msg_id
+        s.set_topic(str(1_000_000 + n), topic_id)
+        for _ in range(LINKS_PER_TOPIC):
+            msg_id += 1
+            s.link_user_message(msg_id, msg_id, topic_id)
+        msg_id += 1
+    return s
+
+
+def legacy_cleanup(g2u: dict, u2g: dict, topic_id: int):
+    """Старая реализация _cleanup_message_links для сравнения."""
+    to_remove = [(g, u) for g, u in g2u.items() if abs(g - topic_id) < 1000]
+    for g, u in to_remove:
+        g2u.pop(g, None)
+        u2g.pop(u, None)
+
+
+def main():
+    print(f"{'связей':>10} | {'remove_topic':>14} | {'старый скан':>14}")
+    for total in TOTALS:
+        s = build(total)
+        users = random.sample(list(s.user_topics.items()), CLOSES + LEGACY_CLOSES)
+
+        start = time.perf_counter()
+        for uid, _ in users[:CLOSES]:
+            s.remove_topic(uid)
+        current = (time.perf_counter() - start) / CLOSES
+
+        # Старый формат — плоские словари всех связей
+        g2u = dict(s.links.g2u.items())
+        u2g = {u: g for g, u in g2u.items()}
+        start = time.perf_counter()
+        for _, tid in users[CLOSES:]:
+            legacy_cleanup(g2u, u2g, tid)
+        legacy = (time.perf_counter() - start) / LEGACY_CLOSES
+
+        print(f"{total:>10} | {fmt_us(current):>14} | {fmt_us(legacy):>14}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+"""
+Сквозной бенчмарк пересылки: пользователь → тема → поддержка → пользователь.
+
+Запуск: python -m benchmarks.bench_e2e [--users N] [--messages N] [--latency мс]
+        [--rate апдейтов/с] [--throttle доля] [--backend json|journal|sqlite] [--out файл.json]
+        [--baseline файл.json] [--tolerance 0.1]
+
+Поднимает fake_api в том же процессе, собирает настоящие Bot и Dispatcher
+из bot/main.py (middleware, роутеры, outbox, хранилище) и подаёт им
+синтетические апдейты через dp.feed_update — как приёмник вебхуков,
+каждый апдейт отдельной задачей. Этапы:
+1. users — каждый пользователь пишет --messages сообщений (первое создаёт тему);
+2. support — поддержка отвечает в каждой теме;
+3. edits — каждый пользователь правит своё первое сообщение.
+
+Задержка пересылки — от подачи апдейта до успешного copyMessage на fake_api
+(включая повторы после 429). --rate задаёт равномерный поток апдейтов,
+без него всё подаётся сразу и задержка показывает очередь при насыщении.
+Лимиты Bot API по умолчанию сняты, чтобы мерить сам бот (--limits
+оставляет настоящие).
+
+Результат — JSON в stdout (и в --out). С --baseline сравнивает с прошлым
+прогоном и завершается с кодом 1, если метрика ухудшилась больше --tolerance.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks.common import setup_env
+
+API_PORT = 18281
+
+parser = argparse.ArgumentParser(description="Сквозной бенчмарк пересылки")
+parser.add_argument("--users", type=int, default=200)
+parser.add_argument("--messages", type=int, default=5, help="сообщений от каждого пользователя")
+parser.add_argument("--concurrency", type=int, default=256, help="апдейтов в обработке одновременно")
+parser.add_argument("--rate", type=float, default=0.0, help="апдейтов в секунду (0 — без паузы)")
+parser.add_argument("--latency", type=float, default=5.0, help="задержка ответа fake_api, мс")
+parser.add_argument("--jitter", type=float, default=5.0, help="случайная добавка к задержке, мс")
+parser.add_argument("--throttle", type=float, default=0.0, help="доля ответов 429")
+parser.add_argument("--backend", choices=("json", "journal", "sqlite"), default="json")
+parser.add_argument("--limits", action="store_true", help="не снимать лимиты Bot API")
+parser.add_argument("--timeout", type=float, default=300.0, help="ожидание доставки на этап, сек")
+parser.add_argument("--out", help="записать результат в файл")
+parser.add_argument("--baseline", help="сравнить с результатом прошлого прогона")
+parser.add_argument("--tolerance", type=float, default=0.1, help="допустимое ухудшение, доля")
+args = parser.parse_args()
+
+workdir = setup_env()
+os.environ.update({
+    "TELEGRAM_API_SERVER": f"http://127.0.0.1:{API_PORT}",
+    "STORAGE_BACKEND": args.backend,
+    # Этап правок меряет обработку, а не окно объединения правок
+    "EDIT_SYNC_WINDOW": "0",
+})
+if not args.limits:
+    os.environ.update({
+        "RATE_LIMIT_GLOBAL": "1000000",
+        "RATE_LIMIT_PRIVATE": "1000000",
+        "RATE_LIMIT_GROUP": "1000000",
+    })
+
+from aiogram import types  # noqa: E402
+
+from benchmarks.fake_api import FakeBotAPI  # noqa: E402
+from bot.main import build_dispatcher, create_bot, start_background_tasks  # noqa: E402
+from bot.utils.edits import edits  # noqa: E402
+from bot.utils.outbox import outbox  # noqa: E402
+from bot.utils.storage import storage  # noqa: E402
+
+GROUP_ID = int(os.environ["SUPPORT_GROUP_ID"])
+AGENT = {"id": 555, "is_bot": False, "first_name": "Agent"}
+
+# Метрика -> True, если больше — лучше
+COMPARED = {
+    "msgs_per_s": True,
+    "p50_ms": False,
+    "p99_ms": False,
+    "topics_per_s": True,
+    "edits_per_s": True,
+    "storage_bytes_per_msg": False,
+}
+
+
+def private_message(message_id: int, user_id: int, text: str) -> dict:
+    return {
+        "message_id": message_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private", "first_name": "Bench"},
+        "from": {"id": user_id, "is_bot": False, "first_name": "Bench"},
+        "text": text,
+    }
+
+
+def support_message(message_id: int, topic_id: int) -> dict:
+    return {
+        "message_id": message_id,
+        "date": int(time.time()),
+        "chat": {"id": GROUP_ID, "type": "supergroup", "title": "Support", "is_forum": True},
+        "from": AGENT,
+        "message_thread_id": topic_id,
+        "is_topic_message": True,
+        "text": "Ответ поддержки",
+    }
+
+
+def percentile(values: list[float], share: float) -> float:
+    ordered = sorted(values)
+    return ordered[round(share * (len(ordered) - 1))]
+
+
+class Driver:
+    def __init__(self, api: FakeBotAPI):
+        self.api = api
+        self.bot = create_bot()
+        self.dp = build_dispatcher()
+        self.update_id = 0
+        self.tasks: set[asyncio.Task] = set()
+        self.semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def feed(self, kind: str, message: dict):
+        """Подаёт апдейт отдельной задачей, как приёмник вебхуков."""
+        await self.semaphore.acquire()
+        self.update_id += 1
+        update = types.Update.model_validate({"update_id": self.update_id, kind: message})
+        task = asyncio.create_task(self.dp.feed_update(self.bot, update))
+        self.tasks.add(task)
+        task.add_done_callback(lambda t: (self.tasks.discard(t), self.semaphore.release()))
+
+    async def wait_delivered(self, sent: dict[tuple[int, int], float]) -> list[float]:
+        """Ждёт копий всех сообщений и возвращает задержки, сек."""
+        deadline = time.monotonic() + args.timeout
+        while any(key not in self.api.delivered for key in sent):
+            if time.monotonic() > deadline:
+                missing = sum(1 for key in sent if key not in self.api.delivered)
+                raise TimeoutError(f"не доставлено {missing} из {len(sent)}")
+            await asyncio.sleep(0.01)
+        return [self.api.delivered[key] - at for key, at in sent.items()]
+
+    async def wait_calls(self, method: str, target: int):
+        deadline = time.monotonic() + args.timeout
+        while self.api.counters[method] - self.api.counters[f"{method}:429"] < target:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"{method} не дошёл до {target}")
+            await asyncio.sleep(0.01)
+
+    async def relay(self, stream: list[tuple[str, dict]]) -> tuple[list[float], float]:
+        """Подаёт поток сообщений и ждёт их доставки. Возвращает задержки и длительность."""
+        sent: dict[tuple[int, int], float] = {}
+        start = time.perf_counter()
+        for n, (kind, message) in enumerate(stream):
+            if args.rate:
+                await asyncio.sleep(max(0.0, start + n / args.rate - time.perf_counter()))
+            sent[(message["chat"]["id"], message["message_id"])] = time.perf_counter()
+            await self.feed(kind, message)
+        latencies = await self.wait_delivered(sent)
+        return latencies, time.perf_counter() - start
+
+    async def run(self) -> dict:
+        users = [100_000 + n for n in range(args.users)]
+        message_id = 0
+
+        # Этап 1: сообщения пользователей по кругу — все диалоги активны одновременно
+        stream = []
+        first_ids = {}
+        for m in range(args.messages):
+            for user_id in users:
+                message_id += 1
+                first_ids.setdefault(user_id, message_id)
+                stream.append(("message", private_message(message_id, user_id, f"Сообщение {m}")))
+        topics_before = self.api.counters["createForumTopic"]
+        user_latencies, user_elapsed = await self.relay(stream)
+        topics = self.api.counters["createForumTopic"] - self.api.counters["createForumTopic:429"] - topics_before
+
+        # Этап 2: поддержка отвечает в каждой теме
+        stream = []
+        for user_id in users:
+            message_id += 1
+            stream.append(("message", support_message(message_id, storage.get_topic(str(user_id)))))
+        support_latencies, support_elapsed = await self.relay(stream)
+
+        # Этап 3: правки первых сообщений пользователей
+        edits_before = self.api.counters["editMessageText"] - self.api.counters["editMessageText:429"]
+        start = time.perf_counter()
+        for user_id in users:
+            edited = private_message(first_ids[user_id], user_id, "Сообщение 0 (исправлено)")
+            edited["edit_date"] = int(time.time())
+            await self.feed("edited_message", edited)
+        await self.wait_calls("editMessageText", edits_before + len(users))
+        edits_elapsed = time.perf_counter() - start
+
+        if self.tasks:
+            await asyncio.gather(*self.tasks)
+        storage.flush()
+
+        latencies = user_latencies + support_latencies
+        total = len(latencies)
+        return {
+            "messages": total,
+            "msgs_per_s": round(total / (user_elapsed + support_elapsed), 1),
+            "user_msgs_per_s": round(len(user_latencies) / user_elapsed, 1),
+            "support_msgs_per_s": round(len(support_latencies) / support_elapsed, 1),
+            "p50_ms": round(percentile(latencies, 0.5) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+            "max_ms": round(max(latencies) * 1000, 2),
+            "topics": topics,
+            "topics_per_s": round(topics / user_elapsed, 1),
+            "edits_per_s": round(len(users) / edits_elapsed, 1),
+            "throttled": sum(v for k, v in self.api.counters.items() if k.endswith(":429")),
+            "storage_writes": storage.writes,
+            "storage_bytes": storage.bytes_written,
+            "storage_bytes_per_msg": round(storage.bytes_written / total, 1),
+        }
+
+    async def close(self):
+        await edits.flush()
+        await outbox.stop()
+        await storage.close_async()
+        await self.bot.session.close()
+
+
+def commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(result: dict, baseline: dict) -> bool:
+    """Печатает изменения относительно прошлого прогона; False — есть регрессия."""
+    if baseline.get("params") != result["params"]:
+        print(f"⚠️ Параметры прогонов различаются: {baseline.get('params')}", file=sys.stderr)
+    ok = True
+    for name, higher_better in COMPARED.items():
+        old, new = baseline["results"].get(name), result["results"].get(name)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        worse = -change if higher_better else change
+        regressed = worse > args.tolerance
+        ok &= not regressed
+        print(
+            f"{'РЕГРЕССИЯ' if regressed else 'ok':>9} {name:>22}: {old} → {new} ({change:+.1%})",
+            file=sys.stderr,
+        )
+    return ok
+
+
+async def main() -> dict:
+    api = FakeBotAPI(
+        latency=args.latency / 1000, jitter=args.jitter / 1000,
+        throttle=args.throttle, seed=1,
+    )
+    await api.start(port=API_PORT)
+    driver = Driver(api)
+    start_background_tasks(driver.bot)
+    try:
+        results = await driver.run()
+    finally:
+        await driver.close()
+        await api.stop()
+    return {
+        "commit": commit(),
+        "params": {
+            name: getattr(args, name)
+            for name in ("users", "messages", "concurrency", "rate", "latency", "jitter", "throttle", "backend", "limits")
+        },
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    result = asyncio.run(main())
+    payload = json.dumps(result, ensure_ascii=False, indent=2)
+    print(payload)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(payload + "\n")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            if not compare(result, json.load(f)):
+                sys.exit(1)
@@ -0,0 +1,175 @@
+"""
+Объединение быстрых правок: запросы editMessageText с окном и без.
+
+Запуск: python -m benchmarks.bench_edit_sync [пользователей] [правок подряд] [окно, сек]
+
+Каждый пользователь пишет сообщение и правит его несколько раз подряд
+(интервал 50 мс), затем ещё раз отправляет ту же правку — как двойное
+сохранение. Прогон идёт через настоящий Dispatcher против fake_api, который,
+как Telegram, отвечает 400 «message is not modified» на правку тем же текстом.
+Сравниваются прежняя логика (запрос на каждую правку), окно 0 (сразу, но без
+повторов) и заданное окно.
+В конце правки ставятся и сразу вызывается edits.flush(), как при остановке,
+— у получателя должен оказаться последний текст.
+"""
+import asyncio
+import os
+import sys
+import time
+
+from benchmarks.common import setup_env
+
+API_PORT = 18581
+EDIT_INTERVAL = 0.05
+
+setup_env()
+os.environ.update({
+    "TELEGRAM_API_SERVER": f"http://127.0.0.1:{API_PORT}",
+    "RATE_LIMIT_GLOBAL": "1000000",
+    "RATE_LIMIT_PRIVATE": "1000000",
+    "RATE_LIMIT_GROUP": "1000000",
+})
+
+from aiogram import types  # noqa: E402
+
+from benchmarks.fake_api import FakeBotAPI  # noqa: E402
+from bot.main import build_dispatcher, create_bot, start_background_tasks  # noqa: E402
+from bot.utils.edits import edits  # noqa: E402
+from bot.utils.outbox import outbox  # noqa: E402
+from bot.utils.storage import storage  # noqa: E402
+
+GROUP_ID = int(os.environ["SUPPORT_GROUP_ID"])
+
+
+def private_message(message_id: int, user_id: int, text: str, edited: bool = False) -> dict:
+    message = {
+        "message_id": message_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private", "first_name": "Bench"},
+        "from": {"id": user_id, "is_bot": False, "first_name": "Bench"},
+        "text": text,
+    }
+    if edited:
+        message["edit_date"] = int(time.time())
+    return message
+
+
+async def legacy_edit(bot, chat_id: int, message_id: int, *, text=None, caption=None, context=None):
+    """Прежняя логика хендлеров: запрос к API на каждую правку."""
+    try:
+        await bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=text)
+    except Exception:
+        pass
+
+
+class Runner:
+    def __init__(self, api: FakeBotAPI):
+        self.api = api
+        self.bot = create_bot()
+        self.dp = build_dispatcher()
+        self.update_id = 0
+
+    async def feed(self, kind: str, message: dict):
+        self.update_id += 1
+        update = types.Update.model_validate({"update_id": self.update_id, kind: message})
+        await self.dp.feed_update(self.bot, update)
+
+    async def storm(self, users: list[int], count: int):
+        """
+        Сообщение и count правок подряд от каждого пользователя, затем повтор
+        последней. ID сообщения = ID пользователя: связи ищутся по ID сообщения.
+        """
+        await asyncio.gather(*(
+            self.feed("message", private_message(user_id, user_id, "v0")) for user_id in users
+        ))
+        for n in range(1, count + 1):
+            await asyncio.gather(*(
+                self.feed("edited_message", private_message(user_id, user_id, f"v{n}", edited=True))
+                for user_id in users
+            ))
+            await asyncio.sleep(EDIT_INTERVAL)
+        await asyncio.gather(*(
+            self.feed("edited_message", private_message(user_id, user_id, f"v{count}", edited=True))
+            for user_id in users
+        ))
+
+    def synced(self, users: list[int], text: str) -> bool:
+        """У всех копий в группе последний текст."""
+        for user_id in users:
+            group_msg_id = storage.get_group_msg_by_user_msg(user_id)
+            if group_msg_id is None or self.api.texts.get((GROUP_ID, group_msg_id)) != text:
+                return False
+        return True
+
+    async def run(self, users: list[int], count: int, window: float | None) -> dict:
+        """window=None — прежняя логика без EditSync."""
+        legacy_tasks = []
+        if window is None:
+            edits.schedule = lambda *a, **kw: legacy_tasks.append(asyncio.create_task(legacy_edit(*a, **kw)))
+        else:
+            edits.window = window
+        before = dict(self.api.counters)
+        start = time.perf_counter()
+        try:
+            await self.storm(users, count)
+            await asyncio.gather(*legacy_tasks)
+            while edits.pending or edits._tasks:
+                await asyncio.sleep(0.01)
+        finally:
+            edits.__dict__.pop("schedule", None)
+        elapsed = time.perf_counter() - start
+        return {
+            "mode": "прежняя" if window is None else f"окно {window:g}с",
+            "edit_updates": len(users) * (count + 1),
+            "edit_calls": self.api.counters["editMessageText"] - before.get("editMessageText", 0),
+            "not_modified": (
+                self.api.counters["editMessageText:not_modified"]
+                - before.get("editMessageText:not_modified", 0)
+            ),
+            "seconds": elapsed,
+        }
+
+
+async def main(users_count: int, count: int, window: float):
+    api = FakeBotAPI()
+    await api.start(port=API_PORT)
+    runner = Runner(api)
+    start_background_tasks(runner.bot)
+    try:
+        results = []
+        # У прогонов разные пользователи, чтобы темы и связи не пересекались
+        for n, w in enumerate((None, 0.0, window)):
+            users = [100_000 + n * users_count + i for i in range(users_count)]
+            results.append(await runner.run(users, count, w))
+
+        # Остановка: правки поставлены, окно не истекло — flush отправляет их сразу
+        users = [200_000 + i for i in range(users_count)]
+        edits.window = 60
+        await runner.storm(users, count)
+        start = time.perf_counter()
+        await edits.flush()
+        flush_time = time.perf_counter() - start
+        flushed = runner.synced(users, f"v{count}")
+    finally:
+        await outbox.stop()
+        await storage.close_async()
+        await runner.bot.session.close()
+        await api.stop()
+
+    print(f"пользователей: {users_count}, правок подряд: {count} (+1 повтор), интервал {EDIT_INTERVAL * 1000:.0f} мс")
+    print(f"{'':>9} | {'правок':>7} | {'запросов':>8} | {'not modified':>12} | {'время':>7}")
+    for r in results:
+        print(
+            f"{r['mode']:>9} | {r['edit_updates']:>7} | {r['edit_calls']:>8} | "
+            f"{r['not_modified']:>12} | {r['seconds']:>6.2f}с"
+        )
+    print(f"flush при остановке: {flush_time * 1000:.0f} мс, последний текст у всех: {'OK' if flushed else 'FAIL'}")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    asyncio.run(main(
+        int(args[0]) if args else 50,
+        int(args[1]) if len(args) > 1 else 5,
+        float(args[2]) if len(args) > 2 else 1.0,
+    ))
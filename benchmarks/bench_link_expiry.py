@@ -0,0 +1,71 @@
+"""
+Истечение связей сообщений по часовым корзинам при долгой работе.
+
+Запуск: python -m benchmarks.bench_link_expiry [связей в час] [дней]
+
+Модельное время: связи создаются равномерно, раз в час идёт очистка
+(в боте — run_sweeper), срок хранения — LINK_RETENTION_DAYS. Показывает,
+что число связей в памяти выходит на плато (retention × поток), и сколько
+стоит одна очистка: удаление из общего индекса только связей истёкших
+корзин против прежнего прохода по каждой связи с пересборкой словарей.
+"""
+import sys
+import time
+
+from benchmarks.common import setup_env, fmt_us
+
+setup_env()
+
+from bot.config import LINK_RETENTION_DAYS  # noqa: E402
+from bot.utils.linkmap import MessageLinks  # noqa: E402
+
+HOUR = 3600
+START = 1_800_000_000
+
+
+def main(per_hour: int, days: int):
+    retention = LINK_RETENTION_DAYS * 24 * HOUR
+    links = MessageLinks(retention)
+    legacy_g2u: dict[int, int] = {}
+    legacy_created: dict[int, float] = {}
+
+    msg_id = 1
+    peak = 0
+    sweeps: list[float] = []
+    legacy_sweeps: list[float] = []
+    print(f"срок хранения: {LINK_RETENTION_DAYS} дн., связей в час: {per_hour}, модельных дней: {days}")
+    for hour in range(days * 24):
+        now = START + hour * HOUR
+        for n in range(per_hour):
+            created = now + n * HOUR / per_hour
+            links.add(msg_id, msg_id, None, created)
+            legacy_g2u[msg_id] = msg_id
+            legacy_created[msg_id] = created
+            msg_id += 1
+        peak = max(peak, len(links))
+
+        now += HOUR
+        start = time.perf_counter()
+        links.expire(now)
+        sweeps.append(time.perf_counter() - start)
+
+        # Прежний подход: проверить возраст каждой связи и собрать словари заново
+        start = time.perf_counter()
+        cutoff = now - retention
+        legacy_g2u = {g: u for g, u in legacy_g2u.items() if legacy_created[g] > cutoff}
+        legacy_created = {g: legacy_created[g] for g in legacy_g2u}
+        legacy_sweeps.append(time.perf_counter() - start)
+
+        if hour % 24 == 23:
+            print(f"день {hour // 24 + 1:>3}: связей {len(links):>9}, корзин {len(links.buckets):>4}")
+
+    steady = sweeps[-24:]
+    legacy_steady = legacy_sweeps[-24:]
+    print(f"пик связей: {peak}, предел retention × поток: {LINK_RETENTION_DAYS * 24 * per_hour}")
+    print(f"очистка (корзины):      {fmt_us(sum(steady) / len(steady))}")
+    print(f"очистка (каждая связь): {fmt_us(sum(legacy_steady) / len(legacy_steady))}")
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:]]
+    main(args[0] if args else 2000, args[1] if len(args) > 1 else 10)
@@ -0,0 +1,165 @@
+"""
+Память и скорость связей сообщений: LinkMap против прежних dict.
+
+Запуск: python -m benchmarks.bench_link_memory [связей] [связей в час,...]
+        (по умолчанию 1 000 000 и 500,2000)
+
+Строит одинаковый набор связей (g2u, u2g и связи по темам, как в корзине MemoryStorage)
+двумя способами и меряет через tracemalloc, сколько байт приходится на одну
+связь. Затем тот же набор проходит через MemoryStorage, как в боте: связи
+создаются равномерно с заданным потоком в час (модельное время), раз в час
+идёт очистка (run_sweeper), ID связей раскладываются по часовым корзинам.
+Если байт на связь в хранилище заметно больше, чем у одной LinkMap, —
+индекс хранилища не упаковывается в колонки. Поиск в хранилище должен
+стоить как у одной LinkMap, сколько бы корзин ни было.
+Затем сравнивает поиск по случайным ключам, вставку новых связей
+и проверяет, что после сохранения и загрузки снимка ключи остаются int.
+"""
+import os
+import random
+import sys
+import time
+import tracemalloc
+from array import array
+
+from benchmarks.common import setup_env, fmt_us
+
+workdir = setup_env()
+
+from bot.utils.linkmap import LinkMap  # noqa: E402
+from bot.utils.storage import MemoryStorage  # noqa: E402
+
+LINKS_PER_TOPIC = 20
+LOOKUPS = 200_000
+HOUR = 3600
+START = 1_800_000_000
+
+# Во сколько раз хранилище может тратить больше одной LinkMap (корзины с ID по темам)
+STORAGE_OVERHEAD = 1.25
+
+
+def link_ids(total: int) -> list[tuple[int, int, int]]:
+    """(group_msg_id, user_msg_id, topic_id) — ID растут, как в Telegram."""
+    links = []
+    for n in range(total):
+        topic_id = 1_000_000 + n // LINKS_PER_TOPIC
+        links.append((5_000_000 + n, 100_000 + n, topic_id))
+    return links
+
+
+def build_dicts(links):
+    g2u, u2g, topic_links = {}, {}, {}
+    for gid, uid, tid in links:
+        g2u[gid] = uid
+        u2g[uid] = gid
+        topic_links.setdefault(tid, set()).add(gid)
+    return g2u, u2g, topic_links
+
+
+def build_linkmaps(links):
+    g2u, u2g, topic_links = LinkMap(), LinkMap(), {}
+    for gid, uid, tid in links:
+        g2u[gid] = uid
+        u2g[uid] = gid
+        ids = topic_links.get(tid)
+        if ids is None:
+            ids = topic_links[tid] = array("q")
+        ids.append(gid)
+    return g2u, u2g, topic_links
+
+
+def build_storage(links, per_hour: int) -> MemoryStorage:
+    """Связи через MemoryStorage с модельным временем и ежечасной очисткой."""
+    s = MemoryStorage(path=os.path.join(workdir, "links.json"), flush_interval=0, retention_days=10 ** 4)
+    swept = START
+    for n, (gid, uid, tid) in enumerate(links):
+        created_at = START + n * HOUR / per_hour
+        if created_at - swept >= HOUR:
+            swept = created_at
+            s.links.expire(swept)
+        s._add_link(gid, uid, tid, created_at)
+    return s
+
+
+def measure(build, links) -> tuple[object, int, float]:
+    """Память под tracemalloc, время — отдельным прогоном без него."""
+    start = time.perf_counter()
+    build(links)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    result = build(links)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size, elapsed
+
+
+def lookup_time(g2u, keys) -> float:
+    # У хранилища поиск — get_user_msg_by_group_msg
+    get = getattr(g2u, "get_user_msg_by_group_msg", None) or g2u.get
+    start = time.perf_counter()
+    for key in keys:
+        get(key)
+    return (time.perf_counter() - start) / len(keys)
+
+
+def check_reload(total: int):
+    """Снимок → загрузка: ключи снова int, поиск по int находит связи."""
+    path = os.path.join(workdir, "reload.json")
+    s = MemoryStorage(path=path, flush_interval=0)
+    count = min(total, 100_000)
+    s.set_topic("42", 7)
+    for n in range(count):
+        s.link_messages(5_000_000 + n, 100_000 + n, 7)
+    s.flush()
+
+    reloaded = MemoryStorage(path=path, flush_interval=0)
+    ok = (
+        reloaded.get_user_msg_by_group_msg(5_000_000) == 100_000
+        and reloaded.get_group_msg_by_user_msg(100_000 + count - 1) == 5_000_000 + count - 1
+        and reloaded.get_last_activity(7) is not None
+        and len(reloaded.links) == count
+    )
+    print(f"после перезагрузки поиск по int: {'OK' if ok else 'FAIL'}")
+
+
+def main(total: int, rates: list[int]):
+    links = link_ids(total)
+    # Прогрев: первая аллокация массивов не должна попасть в замер dict
+    build_linkmaps(links[:1000])
+
+    (d_g2u, _, _), dict_bytes, dict_build = measure(build_dicts, links)
+    (l_g2u, l_u2g, _), map_bytes, map_build = measure(build_linkmaps, links)
+
+    keys = random.sample([gid for gid, _, _ in links], min(LOOKUPS, total))
+    dict_lookup = lookup_time(d_g2u, keys)
+    map_lookup = lookup_time(l_g2u, keys)
+    missing = [k + 10 * total for k in keys]
+    map_miss = lookup_time(l_g2u, missing)
+
+    print(f"связей: {total:,}".replace(",", " "))
+    print(f"{'':>14} | {'байт/связь':>10} | {'всего, МБ':>9} | {'вставка':>10} | {'поиск':>10}")
+    print(
+        f"{'dict + set':>14} | {dict_bytes / total:>10.1f} | {dict_bytes / 2**20:>9.1f} | "
+        f"{fmt_us(dict_build / total):>10} | {fmt_us(dict_lookup):>10}"
+    )
+    print(
+        f"{'LinkMap':>14} | {map_bytes / total:>10.1f} | {map_bytes / 2**20:>9.1f} | "
+        f"{fmt_us(map_build / total):>10} | {fmt_us(map_lookup):>10}"
+    )
+    for per_hour in rates:
+        s, storage_bytes, storage_build = measure(lambda l: build_storage(l, per_hour), links)
+        print(
+            f"{f'storage {per_hour}/ч':>14} | {storage_bytes / total:>10.1f} | {storage_bytes / 2**20:>9.1f} | "
+            f"{fmt_us(storage_build / total):>10} | {fmt_us(lookup_time(s, keys)):>10}"
+        )
+        if storage_bytes > map_bytes * STORAGE_OVERHEAD:
+            print(f"⚠️ хранилище тратит в {storage_bytes / map_bytes:.1f} раза больше LinkMap: индекс не упакован")
+    print(f"LinkMap, промах поиска: {fmt_us(map_miss)}; колонки g2u+u2g: {(l_g2u.nbytes() + l_u2g.nbytes()) / 2**20:.1f} МБ")
+    check_reload(total)
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000,
+        [int(rate) for rate in sys.argv[2].split(",")] if len(sys.argv) > 2 else [500, 2000],
+    )
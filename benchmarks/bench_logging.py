@@ -0,0 +1,110 @@
+"""
+Стоимость строки лога для event loop: print() против очереди логов.
+
+Запуск: python -m benchmarks.bench_logging [записей] [задержка stdout, мс]
+
+stdout подменяется потоком, каждая запись в который ждёт заданное время —
+так ведёт себя journald, когда не успевает. Меряется время вызова в
+вызывающем потоке: прежний print() с strftime, logger.info через
+NonBlockingQueueHandler (JSON), вызов при выключенном уровне (как есть
+и под isEnabledFor, как в хендлерах) и прореженная категория. Затем, пока очередь переполнена, пишутся предупреждения — ни одно
+не должно потеряться. В конце проверяется, что поток записи выдал
+корректный JSON.
+"""
+import datetime
+import io
+import json
+import logging
+import sys
+import time
+
+from benchmarks.common import setup_env, fmt_us
+
+setup_env()
+
+from bot.utils import logs  # noqa: E402
+
+
+class SlowStream(io.StringIO):
+    """stdout, который блокирует каждую запись на delay секунд."""
+
+    def __init__(self, delay: float):
+        super().__init__()
+        self.delay = delay
+
+    def write(self, text: str) -> int:
+        time.sleep(self.delay)
+        return super().write(text)
+
+
+def per_call(fn, count: int) -> float:
+    start = time.perf_counter()
+    for n in range(count):
+        fn(n)
+    return (time.perf_counter() - start) / count
+
+
+def main(count: int, delay_ms: float):
+    stream = SlowStream(delay_ms / 1000)
+    real_stdout, sys.stdout = sys.stdout, stream
+    try:
+        def legacy(n):
+            now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            print(f"{now} | INFO     | №{n}: 📩 {n} написал сообщение.")
+
+        # print блокирует на каждой строке — хватит небольшой выборки
+        legacy_cost = per_call(legacy, min(count, 200))
+
+        listener = logs.setup_logging("INFO", "json", {"relay": 10})
+        logger = logging.getLogger("bench")
+
+        def queued(n):
+            logger.info("📩 %s написал сообщение.", n, extra={"category": "topic", "topic_id": n, "user_id": n})
+
+        def disabled(n):
+            logger.debug("📩 %s написал сообщение.", n, extra={"category": "topic", "topic_id": n, "user_id": int(str(n))})
+
+        def guarded(n):
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("📩 %s написал сообщение.", n, extra={"category": "topic", "topic_id": n, "user_id": int(str(n))})
+
+        def sampled(n):
+            logger.info("📩 %s написал сообщение.", n, extra={"category": "relay", "topic_id": n, "user_id": n})
+
+        queued_cost = per_call(queued, count)
+        disabled_cost = per_call(disabled, count)
+        guarded_cost = per_call(guarded, count)
+        sampled_cost = per_call(sampled, count)
+
+        # Очередь ещё полна INFO — предупреждения всё равно должны дойти
+        def warning(n):
+            logger.warning("⚠️ Ошибка при пересылке сообщения: %s", n, extra={"topic_id": n})
+
+        warnings = min(count, 1000)
+        warning_cost = per_call(warning, warnings)
+        dropped = sum(logs.LOG_DROPPED.values.values())
+        stream.delay = 0
+        listener.stop()
+    finally:
+        sys.stdout = real_stdout
+
+    lines = stream.getvalue().splitlines()
+    records = [json.loads(line) for line in lines if line.startswith("{")]
+    ok = all("topic_id" in r and "ts" in r for r in records)
+    warnings_written = sum(1 for r in records if r["level"] == "WARNING")
+
+    print(f"записей: {count}, задержка stdout: {delay_ms} мс")
+    print(f"print() + strftime:        {fmt_us(legacy_cost)}")
+    print(f"очередь, JSON:             {fmt_us(queued_cost)}")
+    print(f"уровень выключен:          {fmt_us(disabled_cost)}")
+    print(f"  то же под isEnabledFor:  {fmt_us(guarded_cost)}")
+    print(f"прореживание relay=10:     {fmt_us(sampled_cost)}")
+    print(f"WARNING при полной очереди: {fmt_us(warning_cost)}")
+    print(f"отброшено при переполнении: {dropped} (только INFO)")
+    print(f"записано WARNING: {warnings_written} из {warnings}")
+    print(f"записано строк JSON: {len(records)}, поле topic_id: {'OK' if ok else 'FAIL'}")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 20_000, float(args[1]) if len(args) > 1 else 1.0)
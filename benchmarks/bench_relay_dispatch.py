@@ -0,0 +1,115 @@
+"""
+Стоимость выбора способа пересылки для одного сообщения.
+
+Запуск: python -m benchmarks.bench_relay_dispatch
+
+Сравнивает старую цепочку if/elif из handle_support_message (проверка
+has_content + выбор send_* по типу) с build_relay_job (copy_message для
+всего, кроме NOT_COPYABLE) на одинаковой смеси сообщений разных типов.
+Сеть не участвует — меряется только подготовка задания для outbox
+(проверка + RelayJob). В смеси есть история (story) — её должен копировать
+и новый путь — и служебное сообщение, которое не пересылается.
+"""
+import time
+
+from benchmarks.common import setup_env, fmt_us
+
+setup_env()
+
+from aiogram import types  # noqa: E402
+from bot.utils.outbox import RelayJob  # noqa: E402
+from bot.utils.senders import build_relay_job  # noqa: E402
+
+ROUNDS = 200_000
+CHAT = {"id": -1001000000000, "type": "supergroup"}
+USER = {"id": 42, "is_bot": False, "first_name": "Bench"}
+FILE = {"file_id": "AAA", "file_unique_id": "a"}
+
+SAMPLES = [
+    {"text": "Здравствуйте! Чем можем помочь?"},
+    {"photo": [dict(FILE, width=90, height=90), dict(FILE, width=800, height=800)], "caption": "скрин"},
+    {"document": dict(FILE), "caption": "лог"},
+    {"video": dict(FILE, width=640, height=480, duration=3)},
+    {"voice": dict(FILE, duration=2)},
+    {"sticker": dict(FILE, type="regular", width=512, height=512, is_animated=False, is_video=False)},
+    {"location": {"latitude": 55.75, "longitude": 37.61}},
+    {"story": {"chat": {"id": 42, "type": "private"}, "id": 1}},
+    {"forum_topic_created": {"name": "Тема", "icon_color": 0}},
+]
+# Сколько сообщений смеси можно переслать (всё, кроме служебного)
+RELAYABLE = len(SAMPLES) - 1
+
+
+def make_messages() -> list[types.Message]:
+    messages = []
+    for n, extra in enumerate(SAMPLES, start=1):
+        data = {"message_id": n, "date": 0, "chat": CHAT, "from": USER, "message_thread_id": 7, **extra}
+        messages.append(types.Message.model_validate(data))
+    return messages
+
+
+def legacy_dispatch(message: types.Message, user_id: int):
+    """Старая логика из handle_support_message для сравнения."""
+    has_content = (
+        message.text or
+        message.caption or
+        message.photo or
+        message.document or
+        message.video or
+        message.audio or
+        message.voice or
+        message.sticker or
+        message.animation
+    )
+    if not has_content:
+        return None
+
+    kwargs = {"chat_id": user_id, "reply_to_message_id": None}
+    if message.text:
+        method, params = "send_message", {"text": message.text}
+    elif message.photo:
+        method, params = "send_photo", {"photo": message.photo[-1].file_id, "caption": message.caption or ""}
+    elif message.document:
+        method, params = "send_document", {"document": message.document.file_id, "caption": message.caption or ""}
+    elif message.video:
+        method, params = "send_video", {"video": message.video.file_id, "caption": message.caption or ""}
+    else:
+        method, params = "copy_message", {"from_chat_id": message.chat.id, "message_id": message.message_id}
+
+    return RelayJob(
+        f"{message.chat.id}:{message.message_id}",
+        method,
+        {**kwargs, **params},
+        direction="to_user",
+        source_msg_id=message.message_id,
+        topic_id=7,
+    )
+
+
+def copy_dispatch(message: types.Message, user_id: int):
+    return build_relay_job(message, user_id, to_user=True, topic_id=7)
+
+
+def measure(fn, messages: list[types.Message]) -> float:
+    n = len(messages)
+    start = time.perf_counter()
+    for i in range(ROUNDS):
+        fn(messages[i % n], 42)
+    return (time.perf_counter() - start) / ROUNDS
+
+
+def main():
+    messages = make_messages()
+    legacy = measure(legacy_dispatch, messages)
+    current = measure(copy_dispatch, messages)
+    # Покрытие типов: location и story прежняя логика не пересылала
+    covered = sum(legacy_dispatch(m, 42) is not None for m in messages)
+    copied = sum(copy_dispatch(m, 42) is not None for m in messages)
+
+    print(f"Сообщений в смеси: {len(messages)}, повторов: {ROUNDS}")
+    print(f"if/elif (старое):       {fmt_us(legacy)} на сообщение, пересылается {covered}/{RELAYABLE} типов")
+    print(f"copy_message (текущее): {fmt_us(current)} на сообщение, пересылается {copied}/{RELAYABLE} типов")
+
+
+if __name__ == "__main__":
+    main()
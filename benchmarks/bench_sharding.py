@@ -0,0 +1,195 @@
+"""
+Пропускная способность BOT_MODE=sharded в зависимости от числа воркеров.
+
+Запуск: python -m benchmarks.bench_sharding [воркеры...]   (по умолчанию 1 2 4)
+
+Поднимает fake_api отдельным процессом, затем для каждого числа воркеров
+запускает run.py в режиме sharded (приёмник + воркеры, общая база SQLite)
+и прогоняет два этапа:
+1. пользователи пишут в личку — создание тем и пересылка в группу;
+2. поддержка отвечает в каждой теме — приёмник находит владельца темы
+   в общей базе, ответ должен уйти именно этому пользователю.
+Время этапа — до последнего вызова copyMessage на поддельном API.
+Лимиты Bot API отключены, чтобы мерить сам бот.
+"""
+import asyncio
+import json
+import os
+import signal
+import sqlite3
+import subprocess
+import sys
+import time
+
+import aiohttp
+
+from benchmarks.common import setup_env
+
+workdir = setup_env()
+
+API_PORT = 18181
+INGRESS_PORT = 18180
+BASE_PORT = 18190
+SECRET = "bench-secret"
+GROUP_ID = int(os.environ["SUPPORT_GROUP_ID"])
+
+USERS = 200
+MESSAGES_PER_USER = 5
+CONCURRENCY = 64
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def private_update(update_id: int, user_id: int, text: str) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private", "first_name": "Bench"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Bench"},
+            "text": text,
+        },
+    }
+
+
+def support_update(update_id: int, topic_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": GROUP_ID, "type": "supergroup", "title": "Support", "is_forum": True},
+            "from": {"id": 555, "is_bot": False, "first_name": "Agent"},
+            "message_thread_id": topic_id,
+            "is_topic_message": True,
+            "text": "Ответ поддержки",
+        },
+    }
+
+
+async def api_stats(http: aiohttp.ClientSession) -> dict:
+    async with http.get(f"http://127.0.0.1:{API_PORT}/stats") as resp:
+        return await resp.json()
+
+
+async def wait_counter(http: aiohttp.ClientSession, name: str, target: int, timeout: float = 300):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if (await api_stats(http)).get(name, 0) >= target:
+            return
+        await asyncio.sleep(0.05)
+    raise TimeoutError(f"{name} не дошёл до {target}")
+
+
+async def post_all(http: aiohttp.ClientSession, streams: list[list[dict]]):
+    """Шлёт потоки апдейтов параллельно; внутри потока — по порядку."""
+    url = f"http://127.0.0.1:{INGRESS_PORT}/webhook"
+    headers = {"X-Telegram-Bot-Api-Secret-Token": SECRET}
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def run(stream: list[dict]):
+        async with semaphore:
+            for update in stream:
+                async with http.post(url, json=update, headers=headers) as resp:
+                    assert resp.status == 200, resp.status
+
+    await asyncio.gather(*(run(stream) for stream in streams))
+
+
+async def wait_port(port: int, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise TimeoutError(f"порт {port} не открылся")
+
+
+async def run_once(workers: int) -> dict:
+    db_path = os.path.join(workdir, f"shard_{workers}.db")
+    env = dict(
+        os.environ,
+        BOT_MODE="sharded",
+        SHARD_COUNT=str(workers),
+        SHARD_BASE_PORT=str(BASE_PORT),
+        WEBHOOK_URL=f"http://127.0.0.1:{INGRESS_PORT}",
+        WEBHOOK_PORT=str(INGRESS_PORT),
+        WEBHOOK_SECRET=SECRET,
+        TELEGRAM_API_SERVER=f"http://127.0.0.1:{API_PORT}",
+        STORAGE_BACKEND="sqlite",
+        SQLITE_FILE=db_path,
+        OUTBOX_FILE=os.path.join(workdir, f"outbox_{workers}.json"),
+        RATE_LIMIT_GLOBAL="1000000",
+        RATE_LIMIT_PRIVATE="1000000",
+        RATE_LIMIT_GROUP="1000000",
+    )
+    bot = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "run.py")],
+        env=env, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    result = {"workers": workers}
+    try:
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=CONCURRENCY)) as http:
+            await wait_port(INGRESS_PORT)
+            base = await api_stats(http)
+
+            # Этап 1: пользователи → темы в группе
+            update_id = workers * 1_000_000
+            streams = []
+            for n in range(USERS):
+                user_id = 10_000 + n
+                stream = []
+                for m in range(MESSAGES_PER_USER):
+                    update_id += 1
+                    stream.append(private_update(update_id, user_id, f"Сообщение {m}"))
+                streams.append(stream)
+            total = USERS * MESSAGES_PER_USER
+
+            start = time.perf_counter()
+            await post_all(http, streams)
+            await wait_counter(http, "copyMessage:group", base.get("copyMessage:group", 0) + total)
+            elapsed = time.perf_counter() - start
+            result["user_msgs_per_s"] = round(total / elapsed, 1)
+
+            # Этап 2: поддержка отвечает в каждой теме
+            db = sqlite3.connect(db_path)
+            topics = [row[0] for row in db.execute("SELECT topic_id FROM topics")]
+            db.close()
+            streams = []
+            for topic_id in topics:
+                update_id += 1
+                streams.append([support_update(update_id, topic_id)])
+
+            start = time.perf_counter()
+            await post_all(http, streams)
+            await wait_counter(http, "copyMessage:private", base.get("copyMessage:private", 0) + len(topics))
+            elapsed = time.perf_counter() - start
+            result["topics"] = len(topics)
+            result["support_msgs_per_s"] = round(len(topics) / elapsed, 1)
+    finally:
+        bot.send_signal(signal.SIGTERM)
+        bot.wait(60)
+    return result
+
+
+async def main(worker_counts: list[int]):
+    api = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.fake_api", str(API_PORT)],
+        cwd=ROOT, stdout=subprocess.DEVNULL,
+    )
+    try:
+        await wait_port(API_PORT)
+        print(f"CPU: {os.cpu_count()}, пользователей: {USERS}, сообщений от каждого: {MESSAGES_PER_USER}")
+        for workers in worker_counts:
+            print(json.dumps(await run_once(workers), ensure_ascii=False))
+    finally:
+        api.terminate()
+        api.wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(main([int(n) for n in sys.argv[1:]] or [1, 2, 4]))
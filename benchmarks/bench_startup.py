@@ -0,0 +1,83 @@
+"""
+Время запуска хранилища: бинарный снимок (mmap) против JSON.
+
+Запуск: python -m benchmarks.bench_startup [связей...]   (по умолчанию 10000 100000 1000000)
+
+Для каждого размера строит MemoryStorage со связями, разложенными по
+часовым корзинам за последние двое суток (по 20 связей на тему), сохраняет
+его в обоих форматах и меряет загрузку (конструктор MemoryStorage целиком:
+чтение, разбор, очистка истёкших корзин), размер файла и стоимость
+поиска сразу после загрузки — у mmap страницы подгружаются при обращении.
+"""
+import gc
+import os
+import random
+import shutil
+import sys
+import time
+
+from benchmarks.common import setup_env, fmt_us
+
+workdir = setup_env()
+
+from bot.utils.storage import MemoryStorage, Ticket  # noqa: E402
+
+LINKS_PER_TOPIC = 20
+HOURS = 48
+LOOKUPS = 10_000
+REPEATS = 3
+
+
+def build(total: int, path: str, snapshot_format: str) -> list[int]:
+    s = MemoryStorage(path=path, flush_interval=0, snapshot_format=snapshot_format)
+    now = time.time()
+    msg_id = 1_000_000
+    group_ids = []
+    for n in range(total // LINKS_PER_TOPIC):
+        topic_id = 10_000 + n
+        s.set_topic(str(100_000 + n), topic_id)
+        s.set_ticket(topic_id, Ticket("Пользователь", "user", now, None))
+        created = now - HOURS * 3600 * (1 - n * LINKS_PER_TOPIC / total)
+        for _ in range(LINKS_PER_TOPIC):
+            msg_id += 1
+            s._add_link(msg_id, msg_id + 7, topic_id, created)
+            group_ids.append(msg_id)
+    s.flush()
+    return group_ids
+
+
+def measure(path: str, snapshot_format: str, keys: list[int]) -> dict:
+    size = os.path.getsize(os.path.splitext(path)[0] + ".snap" if snapshot_format == "binary" else path)
+    best = float("inf")
+    for _ in range(REPEATS):
+        gc.collect()
+        start = time.perf_counter()
+        s = MemoryStorage(path=path, flush_interval=0, snapshot_format=snapshot_format)
+        best = min(best, time.perf_counter() - start)
+    start = time.perf_counter()
+    found = sum(1 for key in keys if s.get_user_msg_by_group_msg(key) is not None)
+    lookup = (time.perf_counter() - start) / len(keys)
+    assert found == len(keys), f"{snapshot_format}: найдено {found} из {len(keys)}"
+    return {"load": best, "size": size, "lookup": lookup}
+
+
+def main(totals: list[int]):
+    print(f"{'связей':>9} | {'формат':>6} | {'загрузка':>10} | {'файл, МБ':>8} | {'поиск после':>11}")
+    for total in totals:
+        directory = os.path.join(workdir, str(total))
+        os.makedirs(directory)
+        results = {}
+        for snapshot_format in ("json", "binary"):
+            path = os.path.join(directory, f"{snapshot_format}.json")
+            keys = random.sample(build(total, path, snapshot_format), min(LOOKUPS, total))
+            results[snapshot_format] = measure(path, snapshot_format, keys)
+        for snapshot_format, r in results.items():
+            print(
+                f"{total:>9} | {snapshot_format:>6} | {r['load'] * 1000:>7.1f} мс | "
+                f"{r['size'] / 2**20:>8.2f} | {fmt_us(r['lookup']):>11}"
+            )
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main([int(n) for n in sys.argv[1:]] or [10_000, 100_000, 1_000_000])
@@ -0,0 +1,26 @@
+"""
+Общие настройки для бенчмарков.
+
+Бенчмарки запускаются из корня репозитория: python -m benchmarks.<имя>
+До импорта bot.* нужно вызвать setup_env(), чтобы конфиг не требовал
+настоящий .env, а хранилище и очередь не трогали рабочие файлы.
+"""
+import logging
+import os
+import tempfile
+
+
+def setup_env() -> str:
+    """Подставляет тестовые переменные окружения и возвращает временную папку."""
+    logging.basicConfig(level=logging.ERROR)
+    workdir = tempfile.mkdtemp(prefix="tg-support-bench-")
+    os.environ.setdefault("BOT_TOKEN", "123456:BENCHMARK")
+    os.environ.setdefault("SUPPORT_GROUP_ID", "-1001000000000")
+    os.environ.setdefault("STORAGE_FILE", os.path.join(workdir, "storage.json"))
+    os.environ.setdefault("SQLITE_FILE", os.path.join(workdir, "storage.db"))
+    os.environ.setdefault("OUTBOX_FILE", os.path.join(workdir, "outbox.json"))
+    return workdir
+
+
+def fmt_us(seconds: float) -> str:
+    return f"{seconds * 1_000_000:.1f} µs"
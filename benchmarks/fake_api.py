@@ -0,0 +1,199 @@
+"""
+Поддельный сервер Bot API для локальных проверок и бенчмарков.
+
+Отвечает на методы, которые вызывает бот, правдоподобными объектами
+(сообщения, темы форума, MessageId) и записывает все вызовы в calls.
+Бот подключается к нему через TELEGRAM_API_SERVER=http://host:port.
+GET /stats — счётчики вызовов (для проверок из другого процесса).
+
+latency (+ случайная добавка до jitter) — задержка ответа, сек; throttle —
+доля запросов в чаты, на которые отвечаем 429 с retry_after. Правка тем же
+текстом получает 400 «message is not modified», как в Telegram. Время успешной
+копии каждого исходного сообщения пишется в delivered — по нему бенчмарки
+считают задержку пересылки.
+
+Отдельный запуск: python -m benchmarks.fake_api [порт] [задержка, мс] [доля 429]
+"""
+import asyncio
+import itertools
+import json
+import random
+import sys
+import time
+from collections import Counter
+
+from aiohttp import web
+
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "Support", "username": "support_bot"}
+
+
+class FakeBotAPI:
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        throttle: float = 0.0,
+        retry_after: int = 1,
+        seed: int | None = None,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle = throttle
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self.calls: list[tuple[str, dict]] = []
+        self.counters: Counter[str] = Counter()
+        # (исходный чат, исходное сообщение) -> time.perf_counter() успешной копии
+        self.delivered: dict[tuple[int, int], float] = {}
+        # (чат, сообщение) -> последний текст или подпись после правки
+        self.texts: dict[tuple[int, int], str] = {}
+        self._ids = itertools.count(1000)
+        self._waiters: list[tuple[str, int, asyncio.Future]] = []
+        self.app = web.Application()
+        self.app.router.add_route("*", "/bot{token}/{method}", self.handle)
+        self.app.router.add_get("/stats", self.stats)
+        self._runner: web.AppRunner | None = None
+
+    # -------- Запуск --------
+    async def start(self, host: str = "127.0.0.1", port: int = 8081):
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    # -------- Проверки --------
+    def count(self, method: str) -> int:
+        return sum(1 for name, _ in self.calls if name == method)
+
+    async def wait_for(self, method: str, count: int = 1, timeout: float = 5.0):
+        """Ждёт, пока метод будет вызван count раз."""
+        if self.count(method) >= count:
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((method, count, future))
+        await asyncio.wait_for(future, timeout)
+
+    def _notify(self):
+        for waiter in list(self._waiters):
+            method, count, future = waiter
+            if not future.done() and self.count(method) >= count:
+                future.set_result(None)
+                self._waiters.remove(waiter)
+
+    # -------- Методы API --------
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = {}
+        for key, value in (await request.post()).items():
+            try:
+                params[key] = json.loads(value)
+            except (TypeError, ValueError):
+                params[key] = value
+
+        self.calls.append((method, params))
+        self.counters[method] += 1
+        if "chat_id" in params:
+            # Отдельно считаем вызовы в личные чаты и в группу
+            side = "private" if int(params["chat_id"]) > 0 else "group"
+            self.counters[f"{method}:{side}"] += 1
+        self._notify()
+
+        if method == "getUpdates":
+            # В режиме вебхука сюда не ходят; для polling — пустой long poll
+            await asyncio.sleep(min(float(params.get("timeout", 0) or 0), 1.0))
+            return web.json_response({"ok": True, "result": []})
+
+        if self.latency or self.jitter:
+            await asyncio.sleep(self.latency + self._random.random() * self.jitter)
+
+        if self.throttle and "chat_id" in params and not method.startswith("get"):
+            if self._random.random() < self.throttle:
+                self.counters[f"{method}:429"] += 1
+                return web.json_response({
+                    "ok": False,
+                    "error_code": 429,
+                    "description": f"Too Many Requests: retry after {self.retry_after}",
+                    "parameters": {"retry_after": self.retry_after},
+                }, status=429)
+
+        if method in ("editMessageText", "editMessageCaption"):
+            key = (int(params["chat_id"]), int(params["message_id"]))
+            value = params.get("text", params.get("caption"))
+            if self.texts.get(key) == value:
+                self.counters[f"{method}:not_modified"] += 1
+                return web.json_response({
+                    "ok": False,
+                    "error_code": 400,
+                    "description": "Bad Request: message is not modified: specified new message content "
+                                   "and reply markup are exactly the same as a current content and reply "
+                                   "markup of the message",
+                }, status=400)
+            self.texts[key] = value
+
+        result = self.result(method, params)
+        if method in ("copyMessage", "copyMessages"):
+            self._mark_delivered(params)
+        return web.json_response({"ok": True, "result": result})
+
+    def _mark_delivered(self, params: dict):
+        now = time.perf_counter()
+        chat_id = int(params["from_chat_id"])
+        for message_id in params.get("message_ids") or [params["message_id"]]:
+            self.delivered.setdefault((chat_id, int(message_id)), now)
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.counters)
+
+    def result(self, method: str, params: dict):
+        if method == "getMe":
+            return BOT_USER
+        if method == "getChat":
+            return {
+                "id": int(params["chat_id"]), "type": "supergroup", "title": "Support",
+                "is_forum": True, "accent_color_id": 0, "max_reaction_count": 11,
+            }
+        if method == "createForumTopic":
+            return {"message_thread_id": next(self._ids), "name": params.get("name", ""), "icon_color": 7322096}
+        if method == "copyMessage":
+            return {"message_id": next(self._ids)}
+        if method == "copyMessages":
+            return [{"message_id": next(self._ids)} for _ in params.get("message_ids", [])]
+        if method.startswith("send") or method.startswith("edit"):
+            return self.message(params)
+        return True
+
+    def message(self, params: dict) -> dict:
+        chat_id = int(params.get("chat_id", 0))
+        message = {
+            "message_id": next(self._ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"},
+            "from": BOT_USER,
+        }
+        if "message_thread_id" in params:
+            message["message_thread_id"] = int(params["message_thread_id"])
+        if "text" in params:
+            message["text"] = params["text"]
+        return message
+
+
+async def _serve(port: int, latency_ms: float, throttle: float):
+    api = FakeBotAPI(latency=latency_ms / 1000, throttle=throttle)
+    await api.start(port=port)
+    print(f"Fake Bot API: http://127.0.0.1:{port}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    try:
+        asyncio.run(_serve(
+            int(args[0]) if args else 8081,
+            float(args[1]) if len(args) > 1 else 0.0,
+            float(args[2]) if len(args) > 2 else 0.0,
+        ))
+    except KeyboardInterrupt:
+        pass
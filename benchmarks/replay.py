@@ -0,0 +1,244 @@
+"""
+Воспроизведение записанных апдейтов (RECORD_FILE) против поддельного Bot API.
+
+Запуск: python -m benchmarks.replay <файл.jsonl.gz>... [--speed 1|N|max]
+        [--latency мс] [--throttle доля] [--limits] [--profile файл.prof] [--out файл.json]
+
+Файлы воркеров (updates.0.jsonl.gz, updates.1.jsonl.gz...) сливаются по
+времени получения. Апдейты подаются в настоящий Dispatcher из bot/main.py
+отдельными задачами с исходными интервалами, делёнными на --speed
+(max — без пауз). Сообщения группы поддержки переносятся в темы, созданные
+при повторе (по обезличенному владельцу темы из записи); темы, открытые
+до начала записи, заводятся в хранилище как есть.
+
+Результат — JSON: апдейты по типам, длительность, отставание от расписания,
+время хендлеров по роутерам (из метрик), вызовы Bot API и записи хранилища.
+--profile снимает cProfile за весь прогон и печатает самые дорогие функции
+бота (user_message_handler, close_topic_system и т.д.) в stderr.
+
+Автозакрытие по неактивности идёт по реальным часам и при ускоренном
+повторе не срабатывает.
+"""
+import argparse
+import asyncio
+import cProfile
+import gzip
+import heapq
+import json
+import os
+import pstats
+import sys
+import time
+import zlib
+from collections import Counter
+
+from benchmarks.common import setup_env
+
+API_PORT = 18381
+
+# Сколько ждать тему, которую повтор ещё создаёт, сек
+TOPIC_WAIT = 30
+
+
+def read_records(path: str):
+    """Записи файла по порядку; оборванный хвост (авария при записи) пропускается."""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        try:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if "update" in record:
+                    yield record
+        except (EOFError, zlib.error, OSError):
+            return
+
+
+def read_header(path: str) -> dict:
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return json.loads(f.readline())["header"]
+
+
+parser = argparse.ArgumentParser(description="Воспроизведение записанных апдейтов")
+parser.add_argument("files", nargs="+")
+parser.add_argument("--speed", default="1", help="ускорение: 1, N или max")
+parser.add_argument("--concurrency", type=int, default=1024, help="апдейтов в обработке одновременно")
+parser.add_argument("--latency", type=float, default=5.0, help="задержка ответа fake_api, мс")
+parser.add_argument("--jitter", type=float, default=5.0, help="случайная добавка к задержке, мс")
+parser.add_argument("--throttle", type=float, default=0.0, help="доля ответов 429")
+parser.add_argument("--limits", action="store_true", help="не снимать лимиты Bot API")
+parser.add_argument("--timeout", type=float, default=300.0, help="ожидание очереди пересылок в конце, сек")
+parser.add_argument("--profile", help="сохранить профиль cProfile")
+parser.add_argument("--out", help="записать результат в файл")
+args = parser.parse_args()
+speed = None if args.speed == "max" else float(args.speed)
+
+# Группа поддержки из записи — на неё настроены фильтры хендлеров
+os.environ["SUPPORT_GROUP_ID"] = str(read_header(args.files[0])["support_group_id"])
+workdir = setup_env()
+os.environ["TELEGRAM_API_SERVER"] = f"http://127.0.0.1:{API_PORT}"
+if not args.limits:
+    os.environ.update({
+        "RATE_LIMIT_GLOBAL": "1000000",
+        "RATE_LIMIT_PRIVATE": "1000000",
+        "RATE_LIMIT_GROUP": "1000000",
+    })
+
+from aiogram import types  # noqa: E402
+
+from benchmarks.fake_api import FakeBotAPI  # noqa: E402
+from bot.main import build_dispatcher, create_bot, start_background_tasks  # noqa: E402
+from bot.utils.edits import edits  # noqa: E402
+from bot.utils.metrics import HANDLER_SECONDS  # noqa: E402
+from bot.utils.outbox import outbox  # noqa: E402
+from bot.utils.storage import storage  # noqa: E402
+
+
+async def retarget(record: dict, seen_users: set[int]):
+    """
+    Переносит сообщение группы в тему владельца, созданную при повторе.
+    Если владелец уже писал в этом повторе, его тема может ещё создаваться —
+    ждём её до TOPIC_WAIT.
+    """
+    owner = record.get("owner")
+    if owner is None:
+        return
+    update = record["update"]
+    message = update.get("message") or update.get("edited_message")
+    thread_id = message["message_thread_id"]
+    topic_id = storage.get_topic(str(owner))
+    if topic_id is None and owner in seen_users:
+        deadline = time.monotonic() + TOPIC_WAIT
+        while topic_id is None and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+            topic_id = storage.get_topic(str(owner))
+    if topic_id is None:
+        # Тема открыта до начала записи — заводим её как есть
+        storage.set_topic(str(owner), thread_id)
+        return
+    message["message_thread_id"] = topic_id
+    reply = message.get("reply_to_message")
+    if reply and reply.get("message_thread_id") == thread_id:
+        reply["message_thread_id"] = topic_id
+
+
+async def process(dp, bot, record: dict, seen_users: set[int]):
+    await retarget(record, seen_users)
+    await dp.feed_update(bot, types.Update.model_validate(record["update"]))
+
+
+def quantile(bounds: tuple, counts: list[int], share: float) -> float:
+    """Оценка квантиля гистограммы — верхняя граница корзины."""
+    target = share * sum(counts)
+    seen = 0
+    for bound, count in zip((*bounds, float("inf")), counts):
+        seen += count
+        if seen >= target:
+            return bound
+    return float("inf")
+
+
+def handler_stats() -> dict:
+    stats = {}
+    for (router, event), (counts, total) in HANDLER_SECONDS.series.items():
+        count = sum(counts)
+        stats[f"{router}.{event}"] = {
+            "count": count,
+            "mean_ms": round(total / count * 1000, 3),
+            "p50_ms_le": quantile(HANDLER_SECONDS.buckets, counts, 0.5) * 1000,
+            "p99_ms_le": quantile(HANDLER_SECONDS.buckets, counts, 0.99) * 1000,
+        }
+    return stats
+
+
+async def replay() -> dict:
+    api = FakeBotAPI(latency=args.latency / 1000, jitter=args.jitter / 1000, throttle=args.throttle, seed=1)
+    await api.start(port=API_PORT)
+    bot = create_bot()
+    dp = build_dispatcher()
+    start_background_tasks(bot)
+
+    tasks: set[asyncio.Task] = set()
+    semaphore = asyncio.Semaphore(args.concurrency)
+    kinds: Counter[str] = Counter()
+    seen_users: set[int] = set()
+    max_lag = 0.0
+    first_t = None
+    start = time.perf_counter()
+    try:
+        records = heapq.merge(*(read_records(path) for path in args.files), key=lambda r: r["t"])
+        for record in records:
+            if first_t is None:
+                first_t = record["t"]
+            if speed:
+                due = start + (record["t"] - first_t) / speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    max_lag = max(max_lag, -delay)
+
+            update = record["update"]
+            kind = next(key for key in update if key != "update_id")
+            kinds[kind] += 1
+            message = update.get("message") or update.get("edited_message")
+            if message and message["chat"]["type"] == "private":
+                seen_users.add(message["chat"]["id"])
+            await semaphore.acquire()
+            task = asyncio.create_task(process(dp, bot, record, seen_users))
+            tasks.add(task)
+            task.add_done_callback(lambda t: (tasks.discard(t), semaphore.release()))
+
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        deadline = time.monotonic() + args.timeout
+        while outbox.depth and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        elapsed = time.perf_counter() - start
+        storage.flush()
+    finally:
+        await edits.flush()
+        await outbox.stop()
+        await storage.close_async()
+        await bot.session.close()
+        await api.stop()
+
+    total = sum(kinds.values())
+    return {
+        "files": args.files,
+        "speed": args.speed,
+        "updates": total,
+        "kinds": dict(kinds),
+        "duration_s": round(elapsed, 3),
+        "updates_per_s": round(total / elapsed, 1) if elapsed else None,
+        "max_lag_s": round(max_lag, 3),
+        "handlers": handler_stats(),
+        "api_calls": {k: v for k, v in sorted(api.counters.items()) if ":" not in k},
+        "throttled": sum(v for k, v in api.counters.items() if k.endswith(":429")),
+        "outbox_left": outbox.depth,
+        "storage_writes": storage.writes,
+        "storage_bytes": storage.bytes_written,
+    }
+
+
+def main():
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler:
+        profiler.enable()
+    result = asyncio.run(replay())
+    if profiler:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+        stats = pstats.Stats(profiler, stream=sys.stderr)
+        stats.sort_stats("cumulative").print_stats(r"[/\\]bot[/\\]", 20)
+
+    payload = json.dumps(result, ensure_ascii=False, indent=2)
+    print(payload)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(payload + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Проверка режима webhook против поддельного Bot API.
+
+Запуск: python -m benchmarks.webhook_smoke
+
+Поднимает fake_api, запускает main() с BOT_MODE=webhook и проверяет:
+вебхук регистрируется без сброса очереди, запрос без секрета отклоняется,
+сообщение пользователя подтверждается сразу и доходит до темы, метрики
+отдаются на METRICS_PORT, а остановка дожидается принятых обновлений.
+"""
+import asyncio
+import os
+import sys
+import time
+
+from benchmarks.common import setup_env
+
+API_PORT = 18081
+WEBHOOK_PORT = 18080
+METRICS_PORT = 18089
+SECRET = "smoke-secret"
+
+setup_env()
+os.environ.update({
+    "BOT_MODE": "webhook",
+    "WEBHOOK_URL": f"http://127.0.0.1:{WEBHOOK_PORT}",
+    "WEBHOOK_SECRET": SECRET,
+    "WEBHOOK_PORT": str(WEBHOOK_PORT),
+    "TELEGRAM_API_SERVER": f"http://127.0.0.1:{API_PORT}",
+    "STORAGE_FLUSH_INTERVAL": "0",
+    "METRICS_PORT": str(METRICS_PORT),
+})
+
+import aiohttp  # noqa: E402
+
+from benchmarks.fake_api import FakeBotAPI  # noqa: E402
+from bot.main import main  # noqa: E402
+from bot.utils.storage import storage  # noqa: E402
+
+URL = f"http://127.0.0.1:{WEBHOOK_PORT}/webhook"
+
+
+def private_update(update_id: int, user_id: int, text: str) -> dict:
+    user = {"id": user_id, "is_bot": False, "first_name": "Smoke"}
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private", "first_name": "Smoke"},
+            "from": user,
+            "text": text,
+        },
+    }
+
+
+def check(ok: bool, text: str):
+    print(("OK   " if ok else "FAIL ") + text)
+    if not ok:
+        sys.exit(1)
+
+
+async def run():
+    api = FakeBotAPI()
+    await api.start(port=API_PORT)
+    stop = asyncio.Event()
+    bot_task = asyncio.create_task(main(stop))
+
+    await api.wait_for("setWebhook")
+    _, params = next(c for c in api.calls if c[0] == "setWebhook")
+    check(params.get("secret_token") == SECRET, "setWebhook с секретом")
+    check(not params.get("drop_pending_updates"), "очередь обновлений при запуске не сбрасывается")
+
+    async with aiohttp.ClientSession() as http:
+        async with http.post(URL, json=private_update(1, 777, "hi")) as resp:
+            check(resp.status == 401, f"запрос без секрета отклонён ({resp.status})")
+
+        headers = {"X-Telegram-Bot-Api-Secret-Token": SECRET}
+        start = time.perf_counter()
+        async with http.post(URL, json=private_update(2, 777, "Здравствуйте"), headers=headers) as resp:
+            ack = time.perf_counter() - start
+            check(resp.status == 200, f"апдейт принят за {ack * 1000:.1f} мс")
+
+        await api.wait_for("copyMessage")
+        check(storage.get_topic("777") is not None, "тема создана, сообщение переслано")
+
+        async with http.get(f"http://127.0.0.1:{METRICS_PORT}/metrics") as resp:
+            text = await resp.text()
+        check(
+            'tgsupport_handler_seconds_count{router="user",event="message"} 1' in text
+            and 'tgsupport_api_request_seconds_count{method="createForumTopic"} 1' in text
+            and 'tgsupport_storage_items{kind="topics"} 1' in text,
+            "метрики хендлеров, Bot API и хранилища отдаются",
+        )
+
+        # Апдейт, принятый прямо перед остановкой, должен быть обработан
+        async with http.post(URL, json=private_update(3, 778, "Ещё вопрос"), headers=headers) as resp:
+            check(resp.status == 200, "второй апдейт принят")
+        stop.set()
+
+    await asyncio.wait_for(bot_task, 30)
+    check(api.count("copyMessage") == 2, "остановка дождалась обработки принятого апдейта")
+    check(api.count("deleteWebhook") == 0, "вебхук при остановке не удаляется")
+    await api.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
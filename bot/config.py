@@ -20,10 +20,150 @@ if not SUPPORT_GROUP_ID:
 
 SUPPORT_GROUP_ID = int(SUPPORT_GROUP_ID)
 
+# Режим получения обновлений: "polling" — long polling, "webhook" — встроенный
+# HTTP-сервер, на который Telegram сам присылает обновления, "sharded" —
+# приёмник вебхуков, раздающий обновления SHARD_COUNT процессам-воркерам
+# ("worker" — режим самих воркеров, их запускает приёмник)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+
+# Публичный адрес бота (https://bot.example.com) и путь вебхука на нём;
+# секрет проверяется в заголовке X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+
+# Где слушает встроенный сервер (обычно за nginx)
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", 8080))
+
+# Шардирование: число воркеров, номер текущего воркера и порт первого
+# (воркер i слушает 127.0.0.1:SHARD_BASE_PORT+i)
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", 2))
+SHARD_INDEX = int(os.getenv("SHARD_INDEX", 0))
+SHARD_BASE_PORT = int(os.getenv("SHARD_BASE_PORT", 8090))
+
+if BOT_MODE not in ("polling", "webhook", "sharded", "worker"):
+    print(f"❌ Ошибка: неизвестный BOT_MODE={BOT_MODE} (polling, webhook или sharded)")
+    sys.exit(1)
+
+if BOT_MODE in ("webhook", "sharded") and not WEBHOOK_URL:
+    print(f"❌ Ошибка: для BOT_MODE={BOT_MODE} нужен WEBHOOK_URL в .env")
+    sys.exit(1)
+
+# Свой сервер Bot API (локальный telegram-bot-api или тестовый), пусто — api.telegram.org
+TELEGRAM_API_SERVER = os.getenv("TELEGRAM_API_SERVER", "")
+
+# Удалять ли накопившиеся обновления при запуске (по умолчанию — обработать их)
+DROP_PENDING_UPDATES = os.getenv("DROP_PENDING_UPDATES", "false").lower() in ("1", "true", "yes")
+
+# Метрики Prometheus: GET http://METRICS_HOST:METRICS_PORT/metrics (0 — выключены).
+# В режиме sharded приёмник слушает METRICS_PORT, воркер i — METRICS_PORT+1+i
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+if BOT_MODE == "worker" and METRICS_PORT:
+    METRICS_PORT += 1 + SHARD_INDEX
+
+# Логи: уровень и формат ("json" — одна запись на строку для journald/сборщиков,
+# "text" — прежний вид для терминала)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+if LOG_FORMAT not in ("json", "text"):
+    print(f"❌ Ошибка: неизвестный LOG_FORMAT={LOG_FORMAT} (json или text)")
+    sys.exit(1)
+
+# Прореживание частых событий: "категория=N,..." — в лог попадает каждое N-е
+# (relay — пересылки сообщений). Предупреждения и ошибки пишутся всегда
+LOG_SAMPLE = {}
+for _item in filter(None, (part.strip() for part in os.getenv("LOG_SAMPLE", "").split(","))):
+    _category, _, _every = _item.partition("=")
+    if not _every.strip().isdigit():
+        print(f"❌ Ошибка: неверный элемент LOG_SAMPLE={_item} (нужно категория=N)")
+        sys.exit(1)
+    LOG_SAMPLE[_category.strip()] = int(_every)
+
 # Системные настройки
 INACTIVITY_TIMEOUT = INACTIVITY_DAYS * 24 * 60 * 60
 
+# Очередь повторной отправки: число воркеров и максимум попыток
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", 4))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 10))
+
+# Сколько последних сообщений личного чата помнить для кнопки «Очистить чат»
+CHAT_HISTORY_LIMIT = int(os.getenv("CHAT_HISTORY_LIMIT", 500))
+
+# Сколько секунд ждать остальные части альбома
+ALBUM_WINDOW = float(os.getenv("ALBUM_WINDOW", 0.6))
+
+# Сколько секунд копить правки одного сообщения: уходит только последняя (0 — сразу)
+EDIT_SYNC_WINDOW = float(os.getenv("EDIT_SYNC_WINDOW", 2))
+
+# Лимиты исходящих запросов к Bot API: всего в секунду, в личный чат в секунду,
+# в группу в минуту
+RATE_LIMIT_GLOBAL = float(os.getenv("RATE_LIMIT_GLOBAL", 30))
+RATE_LIMIT_PRIVATE = float(os.getenv("RATE_LIMIT_PRIVATE", 1))
+RATE_LIMIT_GROUP = float(os.getenv("RATE_LIMIT_GROUP", 20))
+
+# Общий и групповой лимиты делятся между воркерами — бот и группа у них одни
+if BOT_MODE == "worker":
+    RATE_LIMIT_GLOBAL /= SHARD_COUNT
+    RATE_LIMIT_GROUP /= SHARD_COUNT
+
+# Пакетное автозакрытие: параллельных закрытий, тем в партии, запросов к API в секунду
+AUTO_CLOSE_CONCURRENCY = int(os.getenv("AUTO_CLOSE_CONCURRENCY", 5))
+AUTO_CLOSE_BATCH_SIZE = int(os.getenv("AUTO_CLOSE_BATCH_SIZE", 50))
+AUTO_CLOSE_RATE = float(os.getenv("AUTO_CLOSE_RATE", 15))
+
+# Тип хранилища: "json" — снимок целиком, "journal" — журнал изменений + снимки,
+# "sqlite" — локальная база SQLite
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json")
+
+# Формат снимка json/journal-хранилища: "binary" — storage.snap рядом со STORAGE_FILE
+# (упакованные колонки, загрузка через mmap), "json" — прежний storage.json
+STORAGE_FORMAT = os.getenv("STORAGE_FORMAT", "binary")
+if STORAGE_FORMAT not in ("binary", "json"):
+    print(f"❌ Ошибка: неизвестный STORAGE_FORMAT={STORAGE_FORMAT} (binary или json)")
+    sys.exit(1)
+
+# Общее хранилище нескольких процессов — только база SQLite
+if BOT_MODE in ("sharded", "worker") and STORAGE_BACKEND != "sqlite":
+    print(f"❌ Ошибка: для BOT_MODE={BOT_MODE} нужен STORAGE_BACKEND=sqlite")
+    sys.exit(1)
+
+# Сколько дней хранить связи сообщений для ответов и правок (по умолчанию как автозакрытие)
+LINK_RETENTION_DAYS = int(os.getenv("LINK_RETENTION_DAYS", INACTIVITY_DAYS))
+
+# Сколько записей журнала копить до сжатия в новый снимок
+JOURNAL_COMPACT_RECORDS = int(os.getenv("JOURNAL_COMPACT_RECORDS", 10000))
+
+# Интервал отложенной записи хранилища, сек (0 — писать на каждый save())
+STORAGE_FLUSH_INTERVAL = float(os.getenv("STORAGE_FLUSH_INTERVAL", 5))
+
 # Абсолютный путь до хранилища
 STORAGE_FILE = os.path.abspath(
-    os.path.join(os.path.dirname(__file__), "..", "storage.json")
-)
\ No newline at end of file
+    os.getenv("STORAGE_FILE")
+    or os.path.join(os.path.dirname(__file__), "..", "storage.json")
+)
+
+SQLITE_FILE = os.path.abspath(
+    os.getenv("SQLITE_FILE")
+    or os.path.join(os.path.dirname(__file__), "..", "storage.db")
+)
+
+OUTBOX_FILE = os.path.abspath(
+    os.getenv("OUTBOX_FILE")
+    or os.path.join(os.path.dirname(__file__), "..", "outbox.json")
+)
+
+# У каждого воркера своя очередь повторной отправки: outbox.0.json, outbox.1.json...
+if BOT_MODE == "worker":
+    _root, _ext = os.path.splitext(OUTBOX_FILE)
+    OUTBOX_FILE = f"{_root}.{SHARD_INDEX}{_ext}"
+
+# Запись входящих апдейтов для нагрузочных тестов (пусто — выключена): сжатый
+# JSONL с обезличенными данными, воспроизведение — python -m benchmarks.replay.
+# У каждого воркера свой файл: updates.0.jsonl.gz, updates.1.jsonl.gz...
+RECORD_FILE = os.path.abspath(os.getenv("RECORD_FILE")) if os.getenv("RECORD_FILE") else ""
+if BOT_MODE == "worker" and RECORD_FILE:
+    _root, _ext = os.path.splitext(RECORD_FILE)
+    _root, _inner = os.path.splitext(_root)
+    RECORD_FILE = f"{_root}.{SHARD_INDEX}{_inner}{_ext}"
\ No newline at end of file
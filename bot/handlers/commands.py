@@ -4,7 +4,6 @@ from bot.utils.keyboards import get_user_keyboard
 from bot.utils.storage import storage
 from bot.handlers.helpers import close_topic_system
 from bot.config import SUPPORT_GROUP_ID
-import asyncio
 
 router = Router()
 
@@ -24,12 +23,13 @@ async def cmd_topics(message: types.Message):
     if message.chat.id != SUPPORT_GROUP_ID:
         return
 
-    if not storage.user_topics:
+    topics = await storage.all_topics_async()
+    if not topics:
         await message.reply("📭 Активных тем нет.")
         return
 
-    lines = [f"👥 Активные темы: {len(storage.user_topics)}"]
-    for uid, tid in storage.user_topics.items():
+    lines = [f"👥 Активные темы: {len(topics)}"]
+    for uid, tid in topics.items():
         lines.append(f"• Пользователь <code>{uid}</code> → тема #{tid}")
 
     await message.reply("\n".join(lines), parse_mode="HTML")
@@ -42,7 +42,7 @@ async def cmd_close(message: types.Message, bot):
         return
 
     topic_id = message.message_thread_id
-    user_id = storage.find_user_by_topic(topic_id)
+    user_id = await storage.find_user_by_topic_async(topic_id)
 
     if not user_id:
         await message.reply("❌ Пользователь для этой темы не найден.")
@@ -56,8 +56,6 @@ async def cmd_close(message: types.Message, bot):
             closed_by="support",
             close_type="support",
         )
-        # Добавляем задержку перед ответом чтобы избежать flood control
-        await asyncio.sleep(1)
         # Отправляем сообщение без цитирования (не reply)
         await bot.send_message(
             chat_id=SUPPORT_GROUP_ID,
@@ -65,6 +63,4 @@ async def cmd_close(message: types.Message, bot):
             text="🛑 Вопрос закрыт поддержкой."
         )
     except Exception as e:
-        # Добавляем задержку перед ответом об ошибке
-        await asyncio.sleep(1)
         await message.reply(f"⚠️ Не удалось закрыть тему: {e}")
\ No newline at end of file
@@ -1,12 +1,16 @@
 from aiogram import Bot
-from bot.config import SUPPORT_GROUP_ID
-from bot.utils.storage import storage
+from bot.config import SUPPORT_GROUP_ID, AUTO_CLOSE_CONCURRENCY, AUTO_CLOSE_BATCH_SIZE, AUTO_CLOSE_RATE
+from bot.utils.storage import Ticket, storage
 from bot.utils.keyboards import get_user_keyboard
+from bot.utils.ratelimit import TokenBucket
 import datetime
 import asyncio
+import logging
 
-# Словарь для хранения данных пользователей
-user_data_cache = {}
+logger = logging.getLogger(__name__)
+
+# Сколько запросов к Bot API делает одно закрытие темы
+CLOSE_API_CALLS = 3
 
 
 async def create_user_topic(bot: Bot, user_id: str, user_name: str, username: str) -> int:
@@ -17,14 +21,9 @@ async def create_user_topic(bot: Bot, user_id: str, user_name: str, username: st
     )
     topic_id = topic.message_thread_id
 
-    # Сохраняем данные пользователя и время создания темы
+    # Сохраняем карточку обращения: имя, username и время создания темы
     creation_time = datetime.datetime.now()
-    user_data_cache[topic_id] = {
-        'user_id': user_id,
-        'user_name': user_name,
-        'username': username,
-        'creation_time': creation_time
-    }
+    storage.set_ticket(topic_id, Ticket(user_name, username, creation_time.timestamp()))
     formatted_time = creation_time.strftime("%Y-%m-%d %H:%M:%S")
 
     # 🧾 Карточка пользователя внутри темы
@@ -72,37 +71,44 @@ async def create_user_topic(bot: Bot, user_id: str, user_name: str, username: st
         )
         
         # Сохраняем ID сообщения уведомления для последующего редактирования
-        storage.link_group_message(notification_msg.message_id, topic_id)
+        storage.link_notification(notification_msg.message_id, topic_id)
 
     except Exception as e:
-        print(f"⚠️ Не удалось отправить карточку или уведомление: {e}")
+        logger.warning("⚠️ Не удалось отправить карточку или уведомление: %s", e, extra={"topic_id": topic_id})
 
     return topic_id
 
 
-async def close_topic_system(bot: Bot, topic_id: int, user_id: int, closed_by: str, close_type: str):
+async def close_topic_system(
+    bot: Bot,
+    topic_id: int,
+    user_id: int,
+    closed_by: str,
+    close_type: str,
+    persist: bool = True,
+) -> bool:
     """
     Закрывает тему в группе и уведомляет участников.
     close_type: "success" | "unsuccess" | "support"
+    persist=False — не сохранять хранилище (пакетное закрытие сохраняет само).
+    Возвращает True, если тема закрыта и удалена из хранилища.
     """
     completion_time = datetime.datetime.now()
     formatted_completion_time = completion_time.strftime("%Y-%m-%d %H:%M:%S")
     
-    # Получаем данные пользователя из кэша
+    # Данные пользователя из карточки обращения
     user_name = "Неизвестно"
     username = "Неизвестно"
     duration = "Неизвестно"
     
-    # Пробуем найти данные в кэше по topic_id
-    if topic_id in user_data_cache:
-        user_data = user_data_cache[topic_id]
-        user_name = user_data['user_name']
-        username = user_data['username']
-        creation_time = user_data['creation_time']
-        
+    ticket = await storage.get_ticket_async(topic_id)
+    if ticket:
+        user_name = ticket.user_name or user_name
+        username = ticket.username or username
+
+    if ticket and ticket.created_at:
         # Вычисляем длительность обращения
-        time_diff = completion_time - creation_time
-        total_seconds = int(time_diff.total_seconds())
+        total_seconds = int(completion_time.timestamp() - ticket.created_at)
         hours = total_seconds // 3600
         minutes = (total_seconds % 3600) // 60
         seconds = total_seconds % 60
@@ -113,9 +119,6 @@ async def close_topic_system(bot: Bot, topic_id: int, user_id: int, closed_by: s
             duration = f"{minutes}м {seconds}с"
         else:
             duration = f"{seconds}с"
-        
-        # Удаляем из кэша
-        del user_data_cache[topic_id]
 
     # Определяем статус и заголовок
     if close_type == "success":
@@ -145,14 +148,17 @@ async def close_topic_system(bot: Bot, topic_id: int, user_id: int, closed_by: s
                 reply_markup=get_user_keyboard()
             )
         except Exception as e:
-            print(f"⚠️ Не удалось отправить уведомление пользователю {user_id}: {e}")
+            logger.warning(
+                "⚠️ Не удалось отправить уведомление пользователю %s: %s", user_id, e,
+                extra={"topic_id": topic_id, "user_id": int(user_id)},
+            )
 
     # 🧩 Закрываем тему форума
     try:
         await bot.close_forum_topic(chat_id=SUPPORT_GROUP_ID, message_thread_id=topic_id)
     except Exception as e:
-        print(f"⚠️ Ошибка при закрытии темы #{topic_id}: {e}")
-        return  # Прерываем выполнение если не удалось закрыть тему
+        logger.warning("⚠️ Ошибка при закрытии темы: %s", e, extra={"topic_id": topic_id, "user_id": int(user_id)})
+        return False  # Прерываем выполнение если не удалось закрыть тему
 
     # 🗒 Формируем сообщение для группы (только если закрыл пользователь, а не поддержка)
     if closed_by != "support":
@@ -163,13 +169,10 @@ async def close_topic_system(bot: Bot, topic_id: int, user_id: int, closed_by: s
                 text=f"{status_emoji} {status_text}."
             )
         except Exception as e:
-            print(f"⚠️ Ошибка при уведомлении группы о закрытии темы #{topic_id}: {e}")
+            logger.warning("⚠️ Ошибка при уведомлении группы о закрытии темы: %s", e, extra={"topic_id": topic_id})
 
-    # 📢 Редактируем сообщение в общем чате (с задержкой чтобы избежать flood control)
+    # 📢 Редактируем сообщение в общем чате (темп запросов держит RateLimitMiddleware)
     try:
-        # Добавляем задержку перед редактированием
-        await asyncio.sleep(2)
-        
         # 🔗 Генерация ссылки на тему
         chat_link_id = str(SUPPORT_GROUP_ID).replace("-100", "")
         topic_link = f"https://t.me/c/{chat_link_id}/{topic_id}"
@@ -191,13 +194,9 @@ async def close_topic_system(bot: Bot, topic_id: int, user_id: int, closed_by: s
             f"━━━━━━━━━━━━━━━"
         )
         
-        # Ищем ID сообщения уведомления для этого topic_id
-        notification_msg_id = None
-        for group_msg_id, stored_topic_id in storage.g2u.items():
-            if stored_topic_id == topic_id:
-                notification_msg_id = group_msg_id
-                break
-        
+        # ID сообщения уведомления для этого topic_id
+        notification_msg_id = ticket.notification_id if ticket else None
+
         if notification_msg_id:
             # Редактируем существующее сообщение
             await bot.edit_message_text(
@@ -208,11 +207,59 @@ async def close_topic_system(bot: Bot, topic_id: int, user_id: int, closed_by: s
             )
 
     except Exception as e:
-        print(f"❌ Ошибка обновления сообщения в общем чате: {e}")
+        logger.error("❌ Ошибка обновления сообщения в общем чате: %s", e, extra={"topic_id": topic_id})
 
     # 🧹 Удаляем тему из хранилища
     try:
         storage.remove_topic(str(user_id))
-        storage.save()
+        if persist:
+            storage.save()
     except Exception as e:
-        print(f"⚠️ Ошибка при удалении темы из хранилища: {e}")
\ No newline at end of file
+        logger.error("⚠️ Ошибка при удалении темы из хранилища: %s", e, extra={"topic_id": topic_id})
+        return False
+    return True
+
+
+async def close_topics_batch(
+    bot: Bot,
+    topics: list[tuple[int, str]],
+    closed_by: str = "system",
+    close_type: str = "support",
+    concurrency: int = AUTO_CLOSE_CONCURRENCY,
+    batch_size: int = AUTO_CLOSE_BATCH_SIZE,
+) -> list[int]:
+    """
+    Закрывает много тем сразу: до concurrency закрытий параллельно в общем
+    лимите запросов, одно сохранение хранилища на партию.
+    topics — список (topic_id, user_id). Возвращает темы, которые закрыть не удалось.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    budget = TokenBucket(AUTO_CLOSE_RATE, capacity=CLOSE_API_CALLS * concurrency)
+    failed: list[int] = []
+    total_batches = (len(topics) + batch_size - 1) // batch_size
+
+    async def close_one(topic_id: int, user_id: str) -> bool:
+        async with semaphore:
+            await budget.acquire(CLOSE_API_CALLS)
+            try:
+                return await close_topic_system(
+                    bot, topic_id, user_id, closed_by=closed_by, close_type=close_type, persist=False
+                )
+            except Exception as e:
+                logger.error("⚠️ Ошибка автозакрытия темы: %s", e, extra={"topic_id": topic_id, "user_id": int(user_id)})
+                return False
+
+    for n, start in enumerate(range(0, len(topics), batch_size), 1):
+        batch = topics[start:start + batch_size]
+        results = await asyncio.gather(*(close_one(tid, uid) for tid, uid in batch))
+        batch_failed = [tid for (tid, _), ok in zip(batch, results) if not ok]
+        failed.extend(batch_failed)
+        storage.save()
+
+        logger.info(
+            f"🕒 Автозакрытие: партия {n}/{total_batches} — "
+            f"закрыто {len(batch) - len(batch_failed)}, ошибок {len(batch_failed)}"
+            + (f" ({', '.join(f'#{tid}' for tid in batch_failed)})" if batch_failed else "")
+        )
+
+    return failed
\ No newline at end of file
@@ -1,12 +1,16 @@
 from aiogram import Router, types
-from bot.utils.senders import forward_message
+from bot.utils.senders import can_relay, forward_message, forward_album
 from bot.utils.keyboards import get_user_keyboard
+from bot.utils.edits import edits
 from bot.handlers.helpers import create_user_topic, close_topic_system
 from bot.config import SUPPORT_GROUP_ID
-import asyncio
-import datetime
+import logging
 
 router = Router()
+logger = logging.getLogger(__name__)
+
+# Максимум сообщений в одном запросе deleteMessages
+DELETE_BATCH = 100
 
 
 @router.message(lambda msg: msg.chat.type == "private")
@@ -30,17 +34,17 @@ async def user_message_handler(message: types.Message, bot, **data):
             return
 
         try:
-            await message.answer("Если будут новые вопросы - просто напишите мне.")
-            await asyncio.sleep(0.3)
-
-            for msg_id in range(message.message_id, message.message_id - 250, -1):
+            # Удаляем только реально существующие сообщения чата, до 100 за запрос
+            message_ids = await storage.pop_chat_messages_async(user_id)
+            for start in range(0, len(message_ids), DELETE_BATCH):
                 try:
-                    await bot.delete_message(message.chat.id, msg_id)
-                    await asyncio.sleep(0.005)
+                    await bot.delete_messages(message.chat.id, message_ids[start:start + DELETE_BATCH])
                 except Exception:
                     pass
+
+            await message.answer("Если будут новые вопросы - просто напишите мне.")
         except Exception as e:
-            print(f"⚠️ Ошибка при очистке чата: {e}")
+            logger.warning("⚠️ Ошибка при очистке чата: %s", e, extra={"user_id": int(user_id)})
         return
 
     # Закрытие темы
@@ -54,8 +58,11 @@ async def user_message_handler(message: types.Message, bot, **data):
         is_success = "успешно" in message.text
 
         # Логируем закрытие темы
-        current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        print(f"{current_time} | INFO     | №{topic_id}: ✅ Вопрос успешно решён." if is_success else f"{current_time} | INFO     | №{topic_id}: ❌ Вопрос не был решён.")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(
+                "✅ Вопрос успешно решён." if is_success else "❌ Вопрос не был решён.",
+                extra={"category": "topic", "topic_id": topic_id, "user_id": int(user_id)},
+            )
 
         try:
             await close_topic_system(
@@ -66,7 +73,10 @@ async def user_message_handler(message: types.Message, bot, **data):
                 close_type=("success" if is_success else "unsuccess"),
             )
         except Exception as e:
-            print(f"⚠️ Ошибка close_topic_system: {e}")
+            logger.warning(
+                "⚠️ Ошибка close_topic_system: %s", e,
+                extra={"category": "topic", "topic_id": topic_id, "user_id": int(user_id)},
+            )
 
         await message.answer(
             "Если будут новые вопросы - просто напишите мне."
@@ -76,6 +86,13 @@ async def user_message_handler(message: types.Message, bot, **data):
         )
         return
 
+    # Служебные и неподдерживаемые сообщения не пересылаем и тему под них не создаём
+    if not can_relay(message):
+        return
+
+    # Альбом уже собран ConversationMiddleware (сюда приходит только первая часть)
+    album = data.get("album")
+
     # Проверка / создание темы
     topic_id = storage.get_topic(user_id)
     is_new_topic = False
@@ -84,22 +101,29 @@ async def user_message_handler(message: types.Message, bot, **data):
         topic_id = await create_user_topic(bot, user_id, user_name, username)
         storage.set_topic(user_id, topic_id)
         is_new_topic = True
-        current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        print(f"{current_time} | INFO     | №{topic_id}: ✅ Пользователь {user_id} открыл тему.")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(
+                "✅ Пользователь %s открыл тему.", user_id,
+                extra={"category": "topic", "topic_id": topic_id, "user_id": int(user_id)},
+            )
 
     # Пересылка в группу
-    sent_group_msg_id = await forward_message(
-        bot,
-        SUPPORT_GROUP_ID,
-        message,
-        thread_id=topic_id,
-    )
+    if album:
+        sent_group_msg_id = await forward_album(bot, SUPPORT_GROUP_ID, album, thread_id=topic_id)
+    else:
+        sent_group_msg_id = await forward_message(
+            bot,
+            SUPPORT_GROUP_ID,
+            message,
+            thread_id=topic_id,
+        )
 
     if sent_group_msg_id:
-        storage.link_user_message(message.message_id, sent_group_msg_id)
-        storage.update_activity(topic_id)
-        current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        print(f"{current_time} | INFO     | №{topic_id}: 📩 {user_id} написал сообщение.")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(
+                "📩 %s написал сообщение.", user_id,
+                extra={"category": "relay", "topic_id": topic_id, "user_id": int(user_id)},
+            )
 
     # Подтверждение для нового тикета
     if is_new_topic:
@@ -120,35 +144,15 @@ async def user_edited_message_handler(message: types.Message, bot, **data):
         return
 
     # Ищем соответствующее сообщение в группе
-    group_msg_id = storage.get_group_msg_by_user_msg(message.message_id)
+    group_msg_id = await storage.get_group_msg_by_user_msg_async(message.message_id)
     
     if not group_msg_id:
         return
 
-    try:
-        # Редактируем сообщение в группе
-        if message.text:
-            await bot.edit_message_text(
-                chat_id=SUPPORT_GROUP_ID,
-                message_id=group_msg_id,
-                text=message.text
-            )
-        elif message.caption and (message.photo or message.document or message.video):
-            # Для медиа-сообщений с подписью
-            await bot.edit_message_caption(
-                chat_id=SUPPORT_GROUP_ID,
-                message_id=group_msg_id,
-                caption=message.caption
-            )
-        
-        # УБРАНО: лишнее логирование редактирования
-        
-    except Exception as e:
-        current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        error_msg = str(e)
-        if "message can't be edited" in error_msg:
-            print(f"{current_time} | WARNING  | №{topic_id}: ⚠️ Сообщение нельзя отредактировать (возможно, прошло более 48 часов)")
-        elif "message to edit not found" in error_msg:
-            print(f"{current_time} | WARNING  | №{topic_id}: ⚠️ Сообщение для редактирования не найдено")
-        else:
-            print(f"{current_time} | WARNING  | №{topic_id}: ⚠️ Не удалось отредактировать сообщение в группе: {e}")
\ No newline at end of file
+    # Редактируем сообщение в группе: быстрые правки подряд объединяются
+    context = {"topic_id": topic_id, "user_id": int(user_id)}
+    if message.text:
+        edits.schedule(bot, SUPPORT_GROUP_ID, group_msg_id, text=message.text, context=context)
+    elif message.caption and (message.photo or message.document or message.video):
+        # Для медиа-сообщений с подписью
+        edits.schedule(bot, SUPPORT_GROUP_ID, group_msg_id, caption=message.caption, context=context)
\ No newline at end of file
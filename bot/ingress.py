@@ -0,0 +1,211 @@
+import asyncio
+import json
+import logging
+import os
+import secrets
+import signal
+import sys
+from collections import OrderedDict
+
+import aiohttp
+from aiohttp import web
+from aiogram import Bot
+
+from bot.config import (
+    WEBHOOK_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBHOOK_HOST,
+    WEBHOOK_PORT,
+    DROP_PENDING_UPDATES,
+    SHARD_COUNT,
+    SHARD_BASE_PORT,
+)
+from bot.utils.metrics import registry
+from bot.utils.sharding import pick_shard
+from bot.utils.storage import storage
+
+logger = logging.getLogger(__name__)
+
+RUN_PY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "run.py")
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+INGRESS_FORWARDED = registry.counter(
+    "tgsupport_ingress_forwarded_total", "Апдейтов передано воркеру", ("shard",)
+)
+INGRESS_FAILED = registry.counter(
+    "tgsupport_ingress_failed_total", "Апдейтов, которые не принял ни один воркер (503)"
+)
+INGRESS_RESTARTS = registry.counter(
+    "tgsupport_ingress_worker_restarts_total", "Перезапусков упавших воркеров", ("shard",)
+)
+
+# Сколько ждать владельца темы, которую воркер только что открыл и ещё
+# не закоммитил в базу, сек; пауза между повторами поиска растёт
+# от OWNER_RETRY_DELAY до OWNER_RETRY_MAX
+OWNER_WAIT = 2.0
+OWNER_RETRY_DELAY = 0.02
+OWNER_RETRY_MAX = 0.25
+# Сколько тем без владельца помнить, чтобы не ждать их повторно
+OWNERLESS_TOPICS = 10000
+
+# Пауза перед перезапуском упавшего воркера, сек
+WORKER_RESTART_DELAY = 3
+# Сколько ждать, пока воркеры поднимут свои серверы / завершатся, сек
+WORKER_START_TIMEOUT = 30
+WORKER_STOP_TIMEOUT = 40
+
+
+class Ingress:
+    """
+    Приёмник вебхуков для BOT_MODE=sharded.
+
+    Сам апдейты не обрабатывает: определяет воркер (pick_shard) и передаёт
+    тело запроса как есть на его локальный вебхук. Telegram получает 200
+    только после того, как воркер принял апдейт, — если воркер недоступен,
+    ответ 503 и Telegram повторит доставку.
+    """
+
+    def __init__(self, count: int = SHARD_COUNT, base_port: int = SHARD_BASE_PORT):
+        self.count = count
+        self.urls = [f"http://127.0.0.1:{base_port + i}{WEBHOOK_PATH}" for i in range(count)]
+        self.ports = [base_port + i for i in range(count)]
+        self.forwarded = [0] * count
+        self.failed = 0
+        self._session: aiohttp.ClientSession | None = None
+        self._procs: list[asyncio.subprocess.Process | None] = [None] * count
+        self._supervisors: list[asyncio.Task] = []
+        self._stopping = False
+        self._ownerless: OrderedDict[int, None] = OrderedDict()
+
+    # -------- Приём и пересылка --------
+    async def find_owner(self, topic_id: int) -> str | None:
+        """
+        Владелец темы для маршрутизации. Тему мог только что открыть воркер,
+        чей поток записи ещё не закоммитил её в базу, — тогда ищем повторно
+        до OWNER_WAIT. Тема без владельца и после ожидания (создана вручную)
+        запоминается: ID тем не переиспользуются, владелец у неё не появится.
+        """
+        if topic_id in self._ownerless:
+            return None
+        delay, waited = OWNER_RETRY_DELAY, 0.0
+        while True:
+            user_id = await storage.find_user_by_topic_async(topic_id)
+            if user_id is not None or waited >= OWNER_WAIT:
+                break
+            await asyncio.sleep(delay)
+            waited += delay
+            delay = min(delay * 2, OWNER_RETRY_MAX)
+        if user_id is None:
+            self._ownerless[topic_id] = None
+            if len(self._ownerless) > OWNERLESS_TOPICS:
+                self._ownerless.popitem(last=False)
+        return user_id
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if WEBHOOK_SECRET and not secrets.compare_digest(request.headers.get(SECRET_HEADER, ""), WEBHOOK_SECRET):
+            return web.Response(status=401)
+
+        body = await request.read()
+        shard = await pick_shard(json.loads(body), self.count, self.find_owner)
+        headers = {"Content-Type": "application/json"}
+        if WEBHOOK_SECRET:
+            headers[SECRET_HEADER] = WEBHOOK_SECRET
+
+        try:
+            async with self._session.post(self.urls[shard], data=body, headers=headers) as resp:
+                if resp.status == 200:
+                    self.forwarded[shard] += 1
+                    INGRESS_FORWARDED.inc(shard)
+                    return web.Response()
+        except aiohttp.ClientError as e:
+            logger.warning(f"⚠️ Воркер {shard} недоступен: {e}")
+        self.failed += 1
+        INGRESS_FAILED.inc()
+        return web.Response(status=503)
+
+    # -------- Воркеры --------
+    async def start_workers(self):
+        self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
+        for index in range(self.count):
+            self._supervisors.append(asyncio.create_task(self._supervise(index)))
+        await asyncio.wait_for(
+            asyncio.gather(*(self._wait_port(port) for port in self.ports)),
+            WORKER_START_TIMEOUT,
+        )
+        logger.info(f"🧩 Воркеров запущено: {self.count}")
+
+    async def _supervise(self, index: int):
+        """Запускает воркер и перезапускает его, если он упал."""
+        env = dict(os.environ, BOT_MODE="worker", SHARD_INDEX=str(index), SHARD_COUNT=str(self.count))
+        while not self._stopping:
+            proc = await asyncio.create_subprocess_exec(sys.executable, RUN_PY, env=env)
+            self._procs[index] = proc
+            code = await proc.wait()
+            if self._stopping:
+                return
+            logger.error(f"❌ Воркер {index} завершился (код {code}), перезапуск через {WORKER_RESTART_DELAY} с")
+            INGRESS_RESTARTS.inc(index)
+            await asyncio.sleep(WORKER_RESTART_DELAY)
+
+    @staticmethod
+    async def _wait_port(port: int):
+        while True:
+            try:
+                _, writer = await asyncio.open_connection("127.0.0.1", port)
+                writer.close()
+                await writer.wait_closed()
+                return
+            except OSError:
+                await asyncio.sleep(0.2)
+
+    async def stop_workers(self):
+        """SIGTERM всем воркерам: они дорабатывают принятые апдейты и выходят."""
+        self._stopping = True
+        procs = [proc for proc in self._procs if proc and proc.returncode is None]
+        for proc in procs:
+            proc.terminate()
+        try:
+            await asyncio.wait_for(asyncio.gather(*(proc.wait() for proc in procs)), WORKER_STOP_TIMEOUT)
+        except asyncio.TimeoutError:
+            for proc in procs:
+                if proc.returncode is None:
+                    proc.kill()
+        for task in self._supervisors:
+            task.cancel()
+        await asyncio.gather(*self._supervisors, return_exceptions=True)
+        if self._session:
+            await self._session.close()
+
+
+async def run_ingress(bot: Bot, allowed_updates: list[str], stop: asyncio.Event | None = None):
+    """Запускает воркеры, приёмник вебхуков и работает до сигнала остановки."""
+    if stop is None:
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+
+    ingress = Ingress()
+    runner = web.AppRunner(web.Application())
+    runner.app.router.add_post(WEBHOOK_PATH, ingress.handle)
+    await runner.setup()
+    site = web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT)
+
+    try:
+        await ingress.start_workers()
+        await site.start()
+        await bot.set_webhook(
+            url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET or None,
+            allowed_updates=allowed_updates,
+            drop_pending_updates=DROP_PENDING_UPDATES,
+        )
+        logger.info(f"🌐 Приёмник вебхуков: {WEBHOOK_HOST}:{WEBHOOK_PORT} → {ingress.count} воркеров")
+        await stop.wait()
+    finally:
+        # Сначала перестаём принимать запросы, потом останавливаем воркеры
+        await site.stop()
+        await ingress.stop_workers()
+        await runner.cleanup()
+        logger.info(f"🧩 Передано воркерам: {ingress.forwarded}, не доставлено: {ingress.failed}")
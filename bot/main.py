@@ -1,53 +1,263 @@
 import asyncio
 import logging
+import signal
 import time
+from aiohttp import web
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 
 from bot.config import (
     BOT_TOKEN,
     SUPPORT_GROUP_ID,
     INACTIVITY_TIMEOUT,
     INACTIVITY_DAYS,
+    BOT_MODE,
+    WEBHOOK_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBHOOK_HOST,
+    WEBHOOK_PORT,
+    TELEGRAM_API_SERVER,
+    DROP_PENDING_UPDATES,
+    SHARD_INDEX,
+    SHARD_BASE_PORT,
+    METRICS_HOST,
+    METRICS_PORT,
 )
 from bot.handlers import commands, user, support
-from bot.handlers.helpers import close_topic_system
+from bot.handlers.helpers import close_topics_batch
+from bot.ingress import run_ingress
 from bot.utils.storage import storage
+from bot.utils.scheduler import InactivityScheduler
+from bot.utils.ratelimit import RateLimitMiddleware
+from bot.utils.outbox import outbox
+from bot.utils.edits import edits
+from bot.utils.history import IncomingHistoryMiddleware, OutgoingHistoryMiddleware
+from bot.utils.conversation import ConversationMiddleware
+from bot.utils.metrics import registry, ApiMetricsMiddleware, instrument_router, start_metrics_server
+from bot.utils.recorder import recorder, RecorderMiddleware
 
 # Получаем логгер
 logger = logging.getLogger(__name__)
 
 
-async def auto_close_inactive_topics(bot: Bot):
-    """Автозакрытие неактивных тем."""
-    while True:
-        now = time.time()
-        for user_id, topic_id in list(storage.user_topics.items()):
-            last = storage.get_last_activity(topic_id)
-            if last and now - last > INACTIVITY_TIMEOUT:
-                logger.info(f"🕒 Автозакрытие темы #{topic_id} (пользователь {user_id})")
-                await close_topic_system(bot, topic_id, user_id, closed_by="system", close_type="support")
-        await asyncio.sleep(600)
+# Через сколько повторить автозакрытие, если тему закрыть не удалось
+AUTO_CLOSE_RETRY = 600
 
+# Сколько ждать обработку уже принятых вебхуков при остановке, сек
+WEBHOOK_DRAIN_TIMEOUT = 30
 
-async def main():
+# Размеры считаются только при сборе метрик
+registry.gauge(
+    "tgsupport_storage_items", "Размеры структур хранилища", ("kind",),
+    fn=lambda: {(kind,): size for kind, size in storage.sizes().items()},
+)
+registry.gauge(
+    "tgsupport_outbox_depth", "Пересылок в очереди повторной отправки",
+    fn=lambda: {(): outbox.depth},
+)
+registry.gauge(
+    "tgsupport_outbox_oldest_age_seconds", "Сколько ждёт самая старая недоставленная пересылка, сек",
+    fn=lambda: {(): outbox.oldest_age},
+)
+
+
+async def auto_close_inactive_topics(bot: Bot, scheduler: InactivityScheduler, topic_ids: list[int]):
+    """Автозакрытие тем, дедлайн неактивности которых наступил."""
+    now = time.time()
+    expired: list[tuple[int, str]] = []
+    for topic_id in topic_ids:
+        user_id = await storage.find_user_by_topic_async(topic_id)
+        if not user_id:
+            continue
+
+        last = storage.get_last_activity(topic_id)
+        if last and now - last < INACTIVITY_TIMEOUT:
+            # Активность пришла, пока тема ждала в очереди
+            scheduler.schedule(topic_id, last + INACTIVITY_TIMEOUT)
+            continue
+        expired.append((topic_id, user_id))
+
+    if not expired:
+        return
+
+    logger.info(f"🕒 Автозакрытие неактивных тем: {len(expired)}")
+    failed = await close_topics_batch(bot, expired)
+    for topic_id in failed:
+        if await storage.find_user_by_topic_async(topic_id):
+            scheduler.schedule(topic_id, time.time() + AUTO_CLOSE_RETRY)
+
+
+def create_bot() -> Bot:
+    """Создаёт бота с ограничителем запросов и учётом истории личных чатов."""
+    session = None
+    if TELEGRAM_API_SERVER:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_SERVER))
+
+    bot = Bot(
+        token=BOT_TOKEN,
+        session=session,
+        default=DefaultBotProperties(parse_mode="HTML")
+    )
+    bot.session.middleware(RateLimitMiddleware())
+    bot.session.middleware(OutgoingHistoryMiddleware())
+    # Последним — ближе всех к запросу: каждая попытка и каждый 429 отдельно
+    bot.session.middleware(ApiMetricsMiddleware())
+    return bot
+
+
+def build_dispatcher() -> Dispatcher:
+    """Создаёт диспетчер с хранилищем, middleware и всеми роутерами."""
+    dp = Dispatcher()
+    dp["storage"] = storage
+    if recorder:
+        # Первым — записывается каждый апдейт, даже если его отбросят дальше
+        dp.update.outer_middleware(RecorderMiddleware(recorder))
+    dp.message.outer_middleware(IncomingHistoryMiddleware())
+
+    # Один диалог — строго по очереди, разные диалоги — параллельно
+    conversation = ConversationMiddleware()
+    dp.message.outer_middleware(conversation)
+    dp.edited_message.outer_middleware(conversation)
+
+    for name, module in (("commands", commands), ("user", user), ("support", support)):
+        instrument_router(module.router, name)
+        dp.include_router(module.router)
+    return dp
+
+
+def start_background_tasks(bot: Bot):
+    """Автозакрытие по дедлайнам, запись и очистка хранилища, очередь пересылок, запись апдейтов."""
+    scheduler = InactivityScheduler(INACTIVITY_TIMEOUT)
+    scheduler.rebuild(storage)
+    storage.add_activity_listener(scheduler.on_activity)
+    asyncio.create_task(scheduler.run(
+        lambda topic_ids: auto_close_inactive_topics(bot, scheduler, topic_ids)
+    ))
+    storage.start()
+    outbox.start(bot)
+    if recorder:
+        recorder.start()
+
+
+class WebhookHandler(SimpleRequestHandler):
+    """
+    Приём вебхуков: сразу отвечает 200, а апдейт обрабатывает фоновой
+    задачей. При остановке дожидается уже принятых апдейтов (drain).
+    """
+
+    async def drain(self, timeout: float):
+        tasks = set(self._background_feed_update_tasks)
+        if not tasks:
+            return
+        logger.info(f"⏳ Дожидаемся обработки принятых обновлений: {len(tasks)}")
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        if pending:
+            logger.warning(f"⚠️ Не дождались обработки обновлений: {len(pending)}")
+
+
+async def drain_senders():
+    """Отправляет отложенные правки и останавливает очередь пересылок."""
+    await edits.flush()
+    await outbox.stop()
+
+
+async def run_polling(bot: Bot, dp: Dispatcher):
+    await bot.delete_webhook(drop_pending_updates=DROP_PENDING_UPDATES)
+    # start_polling закрывает сессию бота сразу после on_shutdown —
+    # дослать правки и пересылки можно только в нём
+    dp.shutdown.register(drain_senders)
+    await dp.start_polling(bot)
+
+
+async def run_webhook(
+    bot: Bot,
+    dp: Dispatcher,
+    stop: asyncio.Event | None = None,
+    *,
+    host: str = WEBHOOK_HOST,
+    port: int = WEBHOOK_PORT,
+    register: bool = True,
+):
+    """
+    Поднимает HTTP-сервер для вебхуков и работает до сигнала остановки.
+    Вебхук при остановке не удаляется — Telegram копит обновления и
+    доставит их после перезапуска. Воркер (register=False) вебхук не
+    регистрирует — апдейты ему передаёт приёмник.
+    """
+    if stop is None:
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+
+    if not WEBHOOK_SECRET:
+        logger.warning("⚠️ WEBHOOK_SECRET не задан — вебхук примет запрос от кого угодно")
+
+    app = web.Application()
+    handler = WebhookHandler(dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET or None)
+    handler.register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+
+    if register:
+        await bot.set_webhook(
+            url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET or None,
+            allowed_updates=dp.resolve_used_update_types(),
+            drop_pending_updates=DROP_PENDING_UPDATES,
+        )
+        logger.info(f"🌐 Вебхук: {WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}, сервер {host}:{port}")
+    else:
+        logger.info(f"🧩 Воркер {SHARD_INDEX}: сервер {host}:{port}")
+
+    try:
+        await stop.wait()
+    finally:
+        # Сначала перестаём принимать запросы, потом дорабатываем принятые
+        await site.stop()
+        await handler.drain(WEBHOOK_DRAIN_TIMEOUT)
+        await drain_senders()
+        await runner.cleanup()
+
+
+async def main(stop: asyncio.Event | None = None):
     # ======== ЗАПУСК И ИНИЦИАЛИЗАЦИЯ =========
     logger.info("🟢 Бот запущен.")
     logger.info("===========================================================")
 
     # ======== СТАТИСТИКА ПРИ ЗАПУСКЕ =========
-    logger.info(f"📦 Открытых тем: {len(storage.user_topics)}")
+    logger.info(f"📦 Открытых тем: {len(storage.open_topics())}")
     logger.info(f"🕒 Автозакрытие неактивных тем: {INACTIVITY_DAYS} суток")
+    logger.info(f"📡 Режим получения обновлений: {BOT_MODE}")
     logger.info("⚙️ Конфигурация загружена успешно.")
     logger.info("===========================================================")
 
     # ======== ИНИЦИАЛИЗАЦИЯ БОТА =========
-    bot = Bot(
-        token=BOT_TOKEN,
-        default=DefaultBotProperties(parse_mode="HTML")
-    )
-    dp = Dispatcher()
-    dp["storage"] = storage
+    bot = create_bot()
+    dp = build_dispatcher()
+    metrics = await start_metrics_server(METRICS_HOST, METRICS_PORT) if METRICS_PORT else None
+
+    # ======== ПРИЁМНИК ДЛЯ ВОРКЕРОВ =========
+    if BOT_MODE == "sharded":
+        try:
+            await run_ingress(bot, dp.resolve_used_update_types(), stop)
+        except Exception as e:
+            logger.error(f"❌ Ошибка приёмника вебхуков: {e}")
+        finally:
+            if metrics:
+                await metrics.cleanup()
+            await bot.session.close()
+            await storage.close_async()
+            logger.info("🛑 Приёмник остановлен.")
+        return
 
     # ======== ПРОВЕРКА ГРУППЫ ПОДДЕРЖКИ =========
     try:
@@ -57,24 +267,35 @@ async def main():
     except Exception as e:
         logger.error(f"❌ Ошибка проверки группы: {e}")
 
-    # ======== НАСТРОЙКА ХЕНДЛЕРОВ =========
-    dp.include_router(commands.router)
-    dp.include_router(user.router)
-    dp.include_router(support.router)
-
     # ======== ЗАПУСК ФОНОВЫХ ЗАДАЧ =========
-    asyncio.create_task(auto_close_inactive_topics(bot))
+    start_background_tasks(bot)
 
     # ======== ЗАПУСК БОТА =========
     try:
-        await bot.delete_webhook(drop_pending_updates=True)
-        await dp.start_polling(bot)
+        if BOT_MODE == "webhook":
+            await run_webhook(bot, dp, stop)
+        elif BOT_MODE == "worker":
+            await run_webhook(bot, dp, stop, host="127.0.0.1", port=SHARD_BASE_PORT + SHARD_INDEX, register=False)
+        else:
+            await run_polling(bot, dp)
     except Exception as e:
         logger.error(f"❌ Ошибка при работе бота: {e}")
     finally:
-        storage.save()
+        # Обычно уже сделано до закрытия сессии (on_shutdown или run_webhook);
+        # здесь — на случай ошибки запуска, повторный вызов только сохраняет очередь
+        await drain_senders()
+        if recorder:
+            recorder.stop()
+        if metrics:
+            await metrics.cleanup()
+        await storage.close_async()
         logger.info("===========================================================")
         logger.info("⚙️ Конфигурация сохранена успешно.")
         logger.info("💾 Данные успешно сохранены.")
+        logger.info(
+            f"📮 Недоставлено в очереди: {outbox.depth} (старейшему {outbox.oldest_age:.0f} с), "
+            f"отброшено: {outbox.dropped}"
+        )
+        logger.info(f"💽 Записей на диск: {storage.writes}, объединено запросов: {storage.writes_avoided}")
         logger.info("🛑 Бот остановлен.")
-        logger.info("===========================================================")
\ No newline at end of file
+        logger.info("===========================================================")
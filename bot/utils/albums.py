@@ -0,0 +1,46 @@
+import asyncio
+
+from aiogram import types
+
+from bot.config import ALBUM_WINDOW
+
+
+class AlbumAggregator:
+    """
+    Собирает части альбома (одинаковый media_group_id) в один список.
+
+    Telegram присылает альбом отдельными сообщениями подряд. Первый хендлер
+    ждёт, пока части перестанут приходить (window секунд тишины), и получает
+    весь альбом; хендлеры остальных частей получают None и ничего не делают.
+    """
+
+    def __init__(self, window: float = ALBUM_WINDOW):
+        self.window = window
+        self._albums: dict[tuple[int, str], list[types.Message]] = {}
+        self._updated: dict[tuple[int, str], float] = {}
+
+    async def collect(self, message: types.Message) -> list[types.Message] | None:
+        key = (message.chat.id, message.media_group_id)
+        loop = asyncio.get_running_loop()
+
+        album = self._albums.get(key)
+        if album is not None:
+            album.append(message)
+            self._updated[key] = loop.time()
+            return None
+
+        self._albums[key] = [message]
+        self._updated[key] = loop.time()
+        try:
+            while True:
+                delay = self._updated[key] + self.window - loop.time()
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+            return sorted(self._albums[key], key=lambda m: m.message_id)
+        finally:
+            self._albums.pop(key, None)
+            self._updated.pop(key, None)
+
+
+albums = AlbumAggregator()
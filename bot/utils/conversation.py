@@ -0,0 +1,93 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Hashable
+
+from aiogram import BaseMiddleware, types
+
+from bot.config import SUPPORT_GROUP_ID
+from bot.utils.albums import albums
+from bot.utils.storage import storage
+
+
+class _KeyLock:
+    __slots__ = ("lock", "users")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0  # сколько задач держат или ждут замок
+
+
+class KeyedLocks:
+    """
+    Замки по ключу. Замок живёт, пока его кто-то держит или ждёт, и удаляется
+    сразу после последнего — память растёт только с числом активных диалогов.
+    asyncio.Lock будит ожидающих по очереди, поэтому порядок сохраняется.
+    """
+
+    def __init__(self):
+        self._locks: dict[Hashable, _KeyLock] = {}
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    @asynccontextmanager
+    async def hold(self, key: Hashable):
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = _KeyLock()
+        entry.users += 1
+        try:
+            async with entry.lock:
+                yield
+        finally:
+            entry.users -= 1
+            if entry.users == 0:
+                del self._locks[key]
+
+
+class ConversationMiddleware(BaseMiddleware):
+    """
+    Обрабатывает апдейты одного диалога строго по очереди.
+
+    Ключ — пользователь: его личные сообщения и сообщения поддержки в его
+    теме идут через один замок, поэтому два быстрых сообщения не создадут
+    две темы, а ответы уйдут в том порядке, в каком написаны. Разные
+    пользователи обрабатываются параллельно.
+
+    Альбом собирается до замка: части альбома — отдельные апдейты того же
+    диалога и иначе ждали бы замок, пока первая часть ждёт их. Хендлер
+    получает собранный альбом в data["album"], остальные части до него
+    не доходят. Один экземпляр вешается и на новые, и на отредактированные
+    сообщения — правка не обгонит пересылку исходного сообщения.
+    """
+
+    def __init__(self):
+        self.locks = KeyedLocks()
+
+    @staticmethod
+    async def conversation_key(message: types.Message) -> Hashable | None:
+        if message.chat.type == "private":
+            return str(message.chat.id)
+        if message.chat.id == SUPPORT_GROUP_ID and message.message_thread_id:
+            topic_id = message.message_thread_id
+            return await storage.find_user_by_topic_async(topic_id) or ("topic", topic_id)
+        return None
+
+    async def __call__(
+        self,
+        handler: Callable[[types.TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: types.Message,
+        data: dict[str, Any],
+    ) -> Any:
+        key = await self.conversation_key(event)
+        if key is None:
+            return await handler(event, data)
+
+        if event.media_group_id and event.edit_date is None:
+            album = await albums.collect(event)
+            if album is None:
+                return None
+            data["album"] = album
+
+        async with self.locks.hold(key):
+            return await handler(event, data)
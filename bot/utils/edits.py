@@ -0,0 +1,131 @@
+import asyncio
+import logging
+from collections import OrderedDict
+
+from aiogram import Bot
+
+from bot.config import EDIT_SYNC_WINDOW
+from bot.utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Сколько последних синхронизированных сообщений помнить для отсева повторов
+SYNCED_KEYS = 10000
+
+EDITS = registry.counter(
+    "tgsupport_edits_total", "Правки сообщений: sent, coalesced, noop, failed", ("result",)
+)
+
+
+class _PendingEdit:
+    __slots__ = ("bot", "content", "context")
+
+    def __init__(self, bot: Bot, content: tuple[str, str], context: dict):
+        self.bot = bot
+        self.content = content  # ("text" | "caption", значение)
+        self.context = context  # поля для лога: topic_id, user_id
+
+
+class EditSync:
+    """
+    Синхронизация правок между личным чатом и темой.
+
+    Первая правка сообщения откладывается на window секунд; правки, пришедшие
+    за это время, заменяют её — уходит только последняя. Правка, совпадающая
+    с уже отправленным текстом, не уходит вовсе (иначе Telegram отвечает
+    «message is not modified»). flush() при остановке отправляет всё
+    отложенное сразу.
+    """
+
+    def __init__(self, window: float = EDIT_SYNC_WINDOW):
+        self.window = window
+        self.pending: dict[tuple[int, int], _PendingEdit] = {}
+        self.synced: OrderedDict[tuple[int, int], tuple[str, str]] = OrderedDict()
+        self._tasks: dict[tuple[int, int], asyncio.Task] = {}
+        self._closing = asyncio.Event()
+
+    def schedule(
+        self,
+        bot: Bot,
+        chat_id: int,
+        message_id: int,
+        *,
+        text: str | None = None,
+        caption: str | None = None,
+        context: dict | None = None,
+    ):
+        """Ставит правку копии сообщения (chat_id, message_id) в очередь."""
+        key = (chat_id, message_id)
+        content = ("text", text) if text is not None else ("caption", caption)
+
+        if self.synced.get(key) == content:
+            # Вернули текст к уже отправленному — отложенная правка не нужна
+            if self.pending.pop(key, None):
+                EDITS.inc("coalesced")
+            EDITS.inc("noop")
+            return
+
+        if key in self.pending:
+            EDITS.inc("coalesced")
+        self.pending[key] = _PendingEdit(bot, content, context or {})
+        if key not in self._tasks:
+            self._tasks[key] = asyncio.create_task(self._run(key))
+
+    async def flush(self):
+        """Отправляет все отложенные правки, не дожидаясь окна."""
+        self._closing.set()
+        if self._tasks:
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+    async def _run(self, key: tuple[int, int]):
+        try:
+            try:
+                await asyncio.wait_for(self._closing.wait(), self.window)
+            except asyncio.TimeoutError:
+                pass
+            # Правки, пришедшие во время запроса, отправляются следом
+            while key in self.pending:
+                await self._apply(key, self.pending.pop(key))
+        finally:
+            self._tasks.pop(key, None)
+
+    async def _apply(self, key: tuple[int, int], edit: _PendingEdit):
+        if self.synced.get(key) == edit.content:
+            EDITS.inc("noop")
+            return
+
+        chat_id, message_id = key
+        kind, value = edit.content
+        try:
+            if kind == "text":
+                await edit.bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=value)
+            else:
+                await edit.bot.edit_message_caption(chat_id=chat_id, message_id=message_id, caption=value)
+        except Exception as e:
+            error_msg = str(e)
+            context = {"category": "edit", **edit.context}
+            if "message is not modified" in error_msg:
+                # У получателя уже этот текст
+                self._remember(key, edit.content)
+                EDITS.inc("noop")
+                return
+            EDITS.inc("failed")
+            if "message can't be edited" in error_msg:
+                logger.warning("⚠️ Сообщение нельзя отредактировать (возможно, прошло более 48 часов)", extra=context)
+            elif "message to edit not found" in error_msg:
+                logger.warning("⚠️ Сообщение для редактирования не найдено", extra=context)
+            else:
+                logger.warning("⚠️ Не удалось отредактировать сообщение: %s", e, extra=context)
+            return
+
+        self._remember(key, edit.content)
+        EDITS.inc("sent")
+
+    def _remember(self, key: tuple[int, int], content: tuple[str, str]):
+        self.synced[key] = content
+        self.synced.move_to_end(key)
+        if len(self.synced) > SYNCED_KEYS:
+            self.synced.popitem(last=False)
+
+
+edits = EditSync()
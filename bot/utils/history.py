@@ -0,0 +1,47 @@
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware, Bot, types
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+from bot.utils.ratelimit import SEND_PREFIXES
+from bot.utils.storage import storage
+
+
+class OutgoingHistoryMiddleware(BaseRequestMiddleware):
+    """Запоминает ID сообщений, которые бот отправил в личные чаты."""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        # make_request возвращает уже распакованный результат метода
+        result = await make_request(bot, method)
+
+        chat_id = getattr(method, "chat_id", None)
+        if (
+            isinstance(chat_id, int) and chat_id > 0
+            and method.__api_method__.startswith(SEND_PREFIXES)
+        ):
+            for sent in result if isinstance(result, list) else (result,):
+                message_id = getattr(sent, "message_id", None)
+                if message_id:
+                    storage.track_chat_message(str(chat_id), message_id)
+        return result
+
+
+class IncomingHistoryMiddleware(BaseMiddleware):
+    """Запоминает ID входящих сообщений пользователя в личном чате."""
+
+    async def __call__(
+        self,
+        handler: Callable[[types.TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: types.Message,
+        data: dict[str, Any],
+    ) -> Any:
+        if event.chat.type == "private":
+            storage.track_chat_message(str(event.chat.id), event.message_id)
+        return await handler(event, data)
@@ -0,0 +1,239 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from bot.config import STORAGE_FILE, STORAGE_FLUSH_INTERVAL, JOURNAL_COMPACT_RECORDS
+from bot.utils.storage import MemoryStorage, Ticket
+
+
+class JournaledStorage(MemoryStorage):
+    """
+    Хранилище с журналом изменений.
+
+    Каждое изменение дописывается в журнал одной короткой строкой JSON, поэтому
+    стоимость сохранения пропорциональна изменению, а не всему состоянию.
+    Когда журнал разрастается, он сжимается в обычный снимок (storage.json).
+    При запуске читается снимок и проигрываются записи журнала после него.
+    """
+
+    def __init__(
+        self,
+        path: str = STORAGE_FILE,
+        flush_interval: float = STORAGE_FLUSH_INTERVAL,
+        compact_records: int = JOURNAL_COMPACT_RECORDS,
+    ):
+        self.journal_path = path + ".journal"
+        self.compact_records = compact_records
+        self.seq = 0  # номер последней записи журнала
+        self.journal_records = 0  # записей с последнего снимка
+        self._unsynced = 0  # символов журнала с последнего fsync
+        self._journal = None
+        self._replaying = False
+        super().__init__(path, flush_interval)
+
+    # -------- Изменения с записью в журнал --------
+    def set_topic(self, user_id: str, topic_id: int):
+        self._append({"op": "set_topic", "u": user_id, "t": topic_id})
+        super().set_topic(user_id, topic_id)
+
+    def remove_topic(self, user_id: str):
+        self._append({"op": "remove_topic", "u": user_id})
+        super().remove_topic(user_id)
+
+    def update_activity(self, topic_id: int):
+        super().update_activity(topic_id)
+        self._append({"op": "activity", "t": topic_id, "ts": self.last_activity[topic_id]})
+
+    def _add_link(self, group_msg_id: int, user_msg_id: int, topic_id: int | None, created_at: float):
+        self._append({"op": "link", "g": group_msg_id, "u": user_msg_id, "t": topic_id, "ts": created_at})
+        super()._add_link(group_msg_id, user_msg_id, topic_id, created_at)
+
+    def set_ticket(self, topic_id: int, ticket: Ticket):
+        self._append({"op": "ticket", "t": topic_id, "k": ticket.to_list()})
+        super().set_ticket(topic_id, ticket)
+
+    def _track_chat_message(self, user_id: str, message_id: int, sent_at: float):
+        self._append({"op": "chat", "u": user_id, "m": message_id, "ts": sent_at})
+        super()._track_chat_message(user_id, message_id, sent_at)
+
+    def pop_chat_messages(self, user_id: str) -> list[int]:
+        self._append({"op": "chat_clear", "u": user_id})
+        return super().pop_chat_messages(user_id)
+
+    # -------- Журнал --------
+    def _append(self, record: dict):
+        """Дописывает запись в журнал одной строкой."""
+        if self._replaying or self._journal is None:
+            return
+        self.seq += 1
+        self.journal_records += 1
+        record["s"] = self.seq
+        try:
+            line = json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+            self._journal.write(line)
+            self._journal.flush()
+            self._unsynced += len(line)
+        except Exception as e:
+            logging.error(f"⚠️ Ошибка записи журнала {self.journal_path}: {e}")
+
+    def _apply_record(self, record: dict):
+        """Применяет запись журнала к состоянию в памяти."""
+        op = record["op"]
+        if op == "set_topic":
+            super().set_topic(record["u"], record["t"])
+        elif op == "remove_topic":
+            super().remove_topic(record["u"])
+        elif op == "activity":
+            self.last_activity[record["t"]] = record["ts"]
+        elif op == "link":
+            # В записях до появления корзин времени нет — считаем связь новой
+            super()._add_link(record["g"], record["u"], record["t"], record.get("ts") or time.time())
+        elif op == "ticket":
+            super().set_ticket(record["t"], Ticket.from_list(record["k"]))
+        elif op == "notification":
+            # Журналы до появления карточек
+            super().link_notification(record["g"], record["t"])
+        elif op == "chat":
+            # В записях до появления срока истории времени нет — считаем сообщение новым
+            super()._track_chat_message(record["u"], record["m"], record.get("ts") or time.time())
+        elif op == "chat_clear":
+            super().pop_chat_messages(record["u"])
+
+    def _replay(self):
+        """Проигрывает журнал (включая не сжатый до конца .old) поверх снимка."""
+        applied = 0
+        self._replaying = True
+        try:
+            for path in (self.journal_path + ".old", self.journal_path):
+                if os.path.exists(path):
+                    applied += self._replay_file(path)
+        finally:
+            self._replaying = False
+
+        self.journal_records = applied
+        if applied:
+            logging.info(f"📜 Из журнала восстановлено записей: {applied}")
+
+    def _replay_file(self, path: str) -> int:
+        applied = 0
+        good_end = 0
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("incomplete record")
+                    record = json.loads(line)
+                except ValueError:
+                    # Оборванная запись после сбоя — отрезаем её, дальше ничего нет
+                    logging.warning(f"⚠️ Журнал {path}: отброшена повреждённая запись")
+                    break
+                good_end += len(line)
+                if record.get("s", 0) <= self.seq:
+                    continue
+                self._apply_record(record)
+                self.seq = record["s"]
+                applied += 1
+        if good_end != os.path.getsize(path):
+            os.truncate(path, good_end)
+        return applied
+
+    # -------- Снимки --------
+    def _snapshot_data(self) -> dict:
+        data = super()._snapshot_data()
+        data["journal_seq"] = self.seq
+        return data
+
+    def _apply_data(self, data: dict):
+        super()._apply_data(data)
+        self.seq = data.get("journal_seq", 0)
+
+    def _write(self) -> bool:
+        """Сбрасывает журнал на диск и при необходимости сжимает его в снимок."""
+        if self._journal is None or self.journal_records >= self.compact_records:
+            return self.compact()
+
+        self.dirty = False
+        self.writes += 1
+        try:
+            started = time.perf_counter()
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            self._record_save(time.perf_counter() - started, self._unsynced)
+            self._unsynced = 0
+            return True
+        except Exception as e:
+            self.dirty = True
+            logging.error(f"⚠️ Ошибка записи журнала {self.journal_path}: {e}")
+            return False
+
+    async def flush_async(self) -> bool:
+        if not self.dirty:
+            return False
+        if self._journal is None or self.journal_records >= self.compact_records:
+            return await self.compact_async()
+
+        self.dirty = False
+        self.writes += 1
+        try:
+            started = time.perf_counter()
+            self._journal.flush()
+            await asyncio.to_thread(os.fsync, self._journal.fileno())
+            self._record_save(time.perf_counter() - started, self._unsynced)
+            self._unsynced = 0
+            return True
+        except Exception as e:
+            self.dirty = True
+            logging.error(f"⚠️ Ошибка записи журнала {self.journal_path}: {e}")
+            return False
+
+    def _rotate_journal(self):
+        """
+        Откладывает текущий журнал в .old и начинает новый.
+        Записи, сделанные во время записи снимка, попадают уже в новый журнал.
+        Если .old остался от неудачного сжатия — журнал не трогаем, при
+        загрузке лишние записи отсеются по номеру.
+        """
+        old_path = self.journal_path + ".old"
+        if self._journal is None or os.path.exists(old_path):
+            return
+        self._journal.close()
+        os.replace(self.journal_path, old_path)
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+        self.journal_records = 0
+
+    def _drop_old_journal(self):
+        try:
+            os.remove(self.journal_path + ".old")
+        except FileNotFoundError:
+            pass
+
+    def compact(self) -> bool:
+        """Пишет полный снимок и начинает журнал заново."""
+        self._rotate_journal()
+        if not super()._write():
+            return False
+        if self._journal is not None:
+            self._drop_old_journal()
+        return True
+
+    async def compact_async(self) -> bool:
+        """То же, что compact(), но снимок пишется в фоновом потоке."""
+        self._rotate_journal()
+        if not await super().flush_async():
+            return False
+        self._drop_old_journal()
+        return True
+
+    def close(self):
+        self.flush()
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def load(self):
+        """Загружает снимок и проигрывает журнал после него."""
+        super().load()
+        self._replay()
+        self.cleanup_old_data()
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
@@ -0,0 +1,391 @@
+from array import array
+from bisect import bisect_left
+from heapq import merge
+from itertools import compress
+from typing import Iterable, Iterator
+
+# Значение удалённой записи в основных колонках (ID сообщений всегда > 0)
+TOMBSTONE = -(2 ** 63)
+
+# Минимальный размер дельты, после которого она вливается в колонки
+MIN_DELTA = 4096
+
+# Ключ корзины для связей без темы (ID тем форума всегда > 0)
+NO_TOPIC = 0
+
+
+class LinkMap:
+    """
+    Компактное отображение int -> int для связей сообщений.
+
+    Основная часть — две параллельные колонки array('q'), отсортированные
+    по ключу: 16 байт на запись вместо двух объектов int и слота dict.
+    Новые ключи копятся в обычном dict (дельте) и вливаются в колонки одним
+    слиянием, когда дельта вырастает до 1/8 колонок, — вставка остаётся
+    O(1) в среднем. Поиск: дельта, затем бинарный поиск по колонкам.
+    Удаление из колонок помечает запись TOMBSTONE, место освобождается
+    при слиянии, когда их накопится больше 1/8.
+
+    Колонки, загруженные из бинарного снимка, — memoryview поверх mmap
+    (только чтение); своя копия делается при первом изменении (_own).
+    """
+
+    __slots__ = ("keys", "values", "delta", "tombstones")
+
+    def __init__(self, items: Iterable[tuple[int, int]] = ()):
+        self.keys = array("q")
+        self.values = array("q")
+        self.delta: dict[int, int] = {}
+        self.tombstones = 0
+        for key, value in sorted(items):
+            self._append(key, value)
+
+    @classmethod
+    def from_columns(cls, keys, values) -> "LinkMap":
+        """Из готовых отсортированных колонок (array или memoryview формата 'q')."""
+        links = cls()
+        links.keys, links.values = keys, values
+        return links
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "LinkMap":
+        """Из словаря снимка; ключи JSON-объекта приходят строками."""
+        return cls((int(key), int(value)) for key, value in data.items())
+
+    def to_dict(self) -> dict[int, int]:
+        return dict(self.items())
+
+    def copy(self) -> "LinkMap":
+        clone = LinkMap()
+        if isinstance(self.keys, array):
+            clone.keys = array("q", self.keys)
+            clone.values = array("q", self.values)
+        else:
+            # Колонки снимка неизменяемы — их можно делить
+            clone.keys, clone.values = self.keys, self.values
+        clone.delta = dict(self.delta)
+        clone.tombstones = self.tombstones
+        return clone
+
+    # -------- Чтение --------
+    def _find(self, key: int) -> int:
+        """Позиция ключа в колонках или -1."""
+        keys = self.keys
+        i = bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            return i
+        return -1
+
+    def get(self, key: int, default: int | None = None) -> int | None:
+        value = self.delta.get(key)
+        if value is not None:
+            return value
+        i = self._find(key)
+        if i < 0:
+            return default
+        value = self.values[i]
+        return default if value == TOMBSTONE else value
+
+    def __getitem__(self, key: int) -> int:
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key: int) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        return len(self.keys) - self.tombstones + len(self.delta)
+
+    def items(self) -> Iterator[tuple[int, int]]:
+        """Пары в порядке ключей."""
+        base = ((k, v) for k, v in zip(self.keys, self.values) if v != TOMBSTONE)
+        return merge(base, sorted(self.delta.items()))
+
+    def __iter__(self) -> Iterator[int]:
+        return (key for key, _ in self.items())
+
+    # -------- Запись --------
+    def __setitem__(self, key: int, value: int):
+        keys = self.keys
+        # Новый ID больше всех в колонках — искать его там незачем
+        i = self._find(key) if keys and key <= keys[-1] else -1
+        if i >= 0:
+            # Ключ уже в колонках — обновляем на месте
+            self._own()
+            if self.values[i] == TOMBSTONE:
+                self.tombstones -= 1
+            self.values[i] = value
+            return
+        self.delta[key] = value
+        if len(self.delta) >= max(MIN_DELTA, len(keys) >> 3):
+            self.compact()
+
+    def pop(self, key: int, default: int | None = None) -> int | None:
+        value = self.delta.pop(key, None)
+        if value is not None:
+            return value
+        i = self._find(key)
+        if i < 0 or self.values[i] == TOMBSTONE:
+            return default
+        value = self.values[i]
+        self._own()
+        self.values[i] = TOMBSTONE
+        self.tombstones += 1
+        return value
+
+    def __delitem__(self, key: int):
+        if self.pop(key) is None:
+            raise KeyError(key)
+
+    def compact(self):
+        """Вливает дельту в колонки и выбрасывает удалённые записи."""
+        if not self.delta and not self.tombstones:
+            return
+        self._own()
+        keys = self.keys
+        if self.delta and (not keys or min(self.delta) > keys[-1]):
+            # ID сообщений растут — обычно дельта целиком ложится в хвост
+            pairs = sorted(self.delta.items())
+            keys.extend(key for key, _ in pairs)
+            self.values.extend(value for _, value in pairs)
+            self.delta = {}
+            if self.tombstones <= len(keys) >> 3:
+                return
+
+        if not self.delta:
+            # Только удалённые записи (истечение срока) — фильтр без слияния
+            live = [value != TOMBSTONE for value in self.values]
+            self.keys = array("q", compress(self.keys, live))
+            self.values = array("q", compress(self.values, live))
+            self.tombstones = 0
+            return
+
+        keys, values = array("q"), array("q")
+        for key, value in self.items():
+            keys.append(key)
+            values.append(value)
+        self.keys, self.values = keys, values
+        self.delta = {}
+        self.tombstones = 0
+
+    def _own(self):
+        """Заменяет колонки снимка (memoryview) своими копиями."""
+        if isinstance(self.keys, array):
+            return
+        keys, values = array("q"), array("q")
+        keys.frombytes(self.keys.cast("B"))
+        values.frombytes(self.values.cast("B"))
+        self.keys, self.values = keys, values
+
+    def _append(self, key: int, value: int):
+        self.keys.append(key)
+        self.values.append(value)
+
+    def nbytes(self) -> int:
+        """Память колонок (без дельты)."""
+        return self.keys.itemsize * len(self.keys) + self.values.itemsize * len(self.values)
+
+
+class LinkBucket:
+    """
+    Поколение связей: ID сообщений группы, связанных за один интервал
+    времени, по темам. Сами связи лежат в общем индексе MessageLinks —
+    корзина нужна только чтобы знать, что удалять при истечении срока.
+    """
+
+    __slots__ = ("start", "topics")
+
+    def __init__(self, start: int):
+        self.start = start  # номер интервала: int(время // ширина)
+        self.topics: dict[int, array] = {}  # topic (NO_TOPIC — без темы) -> group message ids
+
+    def add(self, group_msg_id: int, topic_id: int | None):
+        if topic_id is None:
+            topic_id = NO_TOPIC
+        ids = self.topics.get(topic_id)
+        if ids is None:
+            ids = self.topics[topic_id] = array("q")
+        ids.append(group_msg_id)
+
+    def group_ids(self) -> Iterator[int]:
+        for ids in self.topics.values():
+            yield from ids
+
+    def __len__(self) -> int:
+        return sum(len(ids) for ids in self.topics.values())
+
+    def copy(self) -> "LinkBucket":
+        clone = LinkBucket(self.start)
+        clone.topics = {tid: array("q", ids) for tid, ids in self.topics.items()}
+        return clone
+
+    def to_dict(self) -> dict:
+        return {"start": self.start, "topics": self.topics}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "LinkBucket":
+        bucket = cls(int(data["start"]))
+        bucket.topics = {int(tid): array("q", ids) for tid, ids in data.get("topics", {}).items()}
+        return bucket
+
+
+def _int_items(links) -> Iterator[tuple[int, int]]:
+    """Пары LinkMap или словаря снимка (ключи JSON-объекта — строки)."""
+    if isinstance(links, LinkMap):
+        return links.items()
+    return ((int(key), int(value)) for key, value in links.items())
+
+
+def restore_links(data) -> tuple[LinkMap, LinkMap, list[LinkBucket]]:
+    """
+    Общий индекс и корзины из снимка. Текущий формат — словарь
+    {"g2u", "u2g", "buckets"}; прежний — список корзин, у каждой свои g2u
+    и u2g: их связи сливаются в общий индекс от старых корзин к новым.
+    """
+    if isinstance(data, dict):
+        g2u, u2g = data.get("g2u", {}), data.get("u2g", {})
+        if not isinstance(g2u, LinkMap):
+            g2u = LinkMap(_int_items(g2u))
+        if not isinstance(u2g, LinkMap):
+            u2g = LinkMap(_int_items(u2g))
+        buckets = [
+            bucket if isinstance(bucket, LinkBucket) else LinkBucket.from_dict(bucket)
+            for bucket in data.get("buckets", [])
+        ]
+        return g2u, u2g, buckets
+
+    g2u, u2g, buckets = LinkMap(), LinkMap(), []
+    for entry in sorted(data or [], key=lambda entry: int(entry["start"])):
+        bucket = LinkBucket(int(entry["start"]))
+        owners = {int(gid): int(tid) for tid, ids in entry.get("topics", {}).items() for gid in ids}
+        for gid, uid in _int_items(entry.get("g2u", {})):
+            if gid not in g2u:
+                bucket.add(gid, owners.get(gid))
+            g2u[gid] = uid
+            u2g[uid] = gid
+        # u2g может расходиться с g2u (одно сообщение пользователя переслано
+        # дважды) — берём только записи, согласованные с g2u
+        for uid, gid in _int_items(entry.get("u2g", {})):
+            if g2u.get(gid) == uid:
+                u2g[uid] = gid
+        buckets.append(bucket)
+    return g2u, u2g, buckets
+
+
+class MessageLinks:
+    """
+    Связи сообщений с истечением срока по поколениям времени.
+
+    Поиск — по одному общему индексу на направление (g2u, u2g): бинарный
+    поиск в колонках LinkMap, не зависящий от числа корзин и срока
+    хранения. Корзины (по умолчанию час) только помнят, какие ID сообщений
+    группы связаны в их интервал: истечение срока проходит по корзинам
+    старше retention и удаляет их связи из индекса. Обратная связь
+    удаляется, только если ещё указывает на это же сообщение группы —
+    более новая связь того же ID пользователя остаётся.
+    """
+
+    def __init__(self, retention: float, width: int = 3600):
+        self.retention = retention
+        self.width = width
+        self.g2u = LinkMap()  # group message -> user message
+        self.u2g = LinkMap()  # user message -> group message
+        self.buckets: dict[int, LinkBucket] = {}  # от старых к новым
+
+    def __len__(self) -> int:
+        return len(self.g2u)
+
+    def bucket(self, created_at: float) -> LinkBucket:
+        start = int(created_at // self.width)
+        bucket = self.buckets.get(start)
+        if bucket is None:
+            bucket = LinkBucket(start)
+            self.add_bucket(bucket)
+        return bucket
+
+    def add(self, group_msg_id: int, user_msg_id: int, topic_id: int | None, created_at: float):
+        if group_msg_id not in self.g2u:
+            # Повторная связь того же сообщения группы остаётся в прежней корзине
+            self.bucket(created_at).add(group_msg_id, topic_id)
+        self.g2u[group_msg_id] = user_msg_id
+        self.u2g[user_msg_id] = group_msg_id
+
+    def add_bucket(self, bucket: LinkBucket):
+        """Добавляет корзину; корзина из прошлого (журнал, снимок) встаёт по порядку."""
+        newest = next(reversed(self.buckets), None)
+        self.buckets[bucket.start] = bucket
+        if newest is not None and bucket.start < newest:
+            self.buckets = dict(sorted(self.buckets.items()))
+
+    def restore(self, data):
+        """Заменяет содержимое прочитанным из снимка (см. restore_links)."""
+        self.g2u, self.u2g, buckets = restore_links(data)
+        self.buckets = {}
+        for bucket in buckets:
+            self.add_bucket(bucket)
+
+    # -------- Поиск --------
+    def get_user(self, group_msg_id: int) -> int | None:
+        return self.g2u.get(group_msg_id)
+
+    def get_group(self, user_msg_id: int) -> int | None:
+        return self.u2g.get(user_msg_id)
+
+    def records(self) -> Iterator[tuple[int, int, int | None, float]]:
+        """(group_msg_id, user_msg_id, topic_id, начало интервала) всех живых связей."""
+        for bucket in self.buckets.values():
+            created_at = bucket.start * self.width
+            for tid, ids in bucket.topics.items():
+                for group_msg_id in ids:
+                    user_msg_id = self.g2u.get(group_msg_id)
+                    if user_msg_id is not None:
+                        yield group_msg_id, user_msg_id, tid or None, created_at
+
+    # -------- Удаление --------
+    def _unlink(self, group_msg_id: int) -> bool:
+        user_msg_id = self.g2u.pop(group_msg_id)
+        if user_msg_id is None:
+            return False
+        if self.u2g.get(user_msg_id) == group_msg_id:
+            self.u2g.pop(user_msg_id)
+        return True
+
+    def pop_topic(self, topic_id: int) -> int:
+        """Удаляет связи темы из всех корзин; возвращает их число."""
+        removed = 0
+        for bucket in self.buckets.values():
+            for group_msg_id in bucket.topics.pop(topic_id, ()):
+                removed += self._unlink(group_msg_id)
+        return removed
+
+    def expire(self, now: float) -> tuple[int, int]:
+        """
+        Удаляет корзины, целиком старше retention, и их связи из индекса.
+        Возвращает (корзин, связей).
+        """
+        cutoff = (now - self.retention) // self.width
+        dropped = links = 0
+        while self.buckets:
+            start = next(iter(self.buckets))
+            # Корзина покрывает [start, start + 1) интервалов
+            if start + 1 > cutoff:
+                break
+            for group_msg_id in self.buckets.pop(start).group_ids():
+                links += self._unlink(group_msg_id)
+            dropped += 1
+        if links:
+            # Удалённые записи освобождают место только при слиянии
+            for index in (self.g2u, self.u2g):
+                if index.tombstones > len(index.keys) >> 3:
+                    index.compact()
+        return dropped, links
+
+    # -------- Снимок --------
+    def copy(self) -> dict:
+        return {
+            "g2u": self.g2u.copy(),
+            "u2g": self.u2g.copy(),
+            "buckets": [bucket.copy() for bucket in self.buckets.values()],
+        }
@@ -0,0 +1,145 @@
+"""
+Неблокирующее логирование.
+
+Хендлеры пишут в логгеры как обычно, а корневой логгер кладёт записи
+в очередь (QueueHandler). Форматирование и запись в stdout делает отдельный
+поток (QueueListener), поэтому event loop не ждёт journald.
+
+Контекст передаётся через extra: category (для прореживания), topic_id,
+user_id — в JSON они становятся отдельными полями:
+
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("📩 %s написал сообщение.", user_id,
+                    extra={"category": "relay", "topic_id": topic_id, "user_id": int(user_id)})
+
+Аргументы сообщения подставляются только в потоке записи, поэтому передавать
+их нужно через %s, а не f-строкой, и только неизменяемые значения. Словарь
+extra собирается до проверки уровня — на частых путях вызов оборачивается
+в isEnabledFor, чтобы выключенный уровень ничего не стоил.
+"""
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+
+from bot.utils.metrics import registry
+
+# Сколько записей держать в очереди, если stdout не успевает; сверх этого
+# записи ниже WARNING отбрасываются, а предупреждения и ошибки ставятся всегда
+LOG_QUEUE_SIZE = 10000
+
+LOG_DROPPED = registry.counter(
+    "tgsupport_log_dropped_total", "Записи лога ниже WARNING, отброшенные из-за переполненной очереди"
+)
+
+# Стандартные атрибуты LogRecord — всё остальное пришло через extra
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись — одна строка JSON: время, уровень, логгер, текст и поля из extra."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created).astimezone().isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Прежний вид для терминала: «время | уровень | №тема: текст»."""
+
+    def __init__(self):
+        super().__init__("%(asctime)s | %(levelname)-8s | %(message)s", "%Y-%m-%d %H:%M:%S")
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        topic_id = getattr(record, "topic_id", None)
+        prefix = "" if topic_id is None else f"№{topic_id}: "
+        return f"{record.asctime} | {record.levelname:<8} | {prefix}{record.message}"
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Прореживание частых событий: для категории с rates[category] = N
+    пропускается каждая N-я запись (в JSON у неё поле sample = N).
+    Предупреждения и ошибки не прореживаются.
+    """
+
+    def __init__(self, rates: dict[str, int]):
+        super().__init__()
+        self.rates = {category: every for category, every in rates.items() if every > 1}
+        self.counters = dict.fromkeys(self.rates, 0)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not self.rates or record.levelno >= logging.WARNING:
+            return True
+        category = getattr(record, "category", None)
+        every = self.rates.get(category)
+        if every is None:
+            return True
+        seen = self.counters[category]
+        self.counters[category] = seen + 1
+        if seen % every:
+            return False
+        record.sample = every
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler без форматирования в вызывающем потоке: очередь внутри
+    процесса, запись уходит в поток записи как есть. Когда в очереди
+    limit записей, INFO и ниже отбрасываются вместо ожидания;
+    предупреждения и ошибки не теряются — очередь для них не ограничена.
+    """
+
+    def __init__(self, log_queue: queue.Queue, limit: int = LOG_QUEUE_SIZE):
+        super().__init__(log_queue)
+        self.limit = limit
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        if record.levelno < logging.WARNING and self.queue.qsize() >= self.limit:
+            LOG_DROPPED.inc()
+            return
+        self.queue.put_nowait(record)
+
+
+def setup_logging(
+    level: str = "INFO",
+    fmt: str = "json",
+    sample: dict[str, int] | None = None,
+) -> logging.handlers.QueueListener:
+    """
+    Перенастраивает корневой логгер на очередь и запускает поток записи.
+    Возвращает поток записи — его stop() дописывает очередь при остановке.
+    """
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+
+    log_queue: queue.Queue = queue.Queue()
+    handler = NonBlockingQueueHandler(log_queue)
+    if sample:
+        handler.addFilter(SamplingFilter(sample))
+
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    listener.start()
+    return listener
@@ -0,0 +1,254 @@
+import logging
+import time
+from bisect import bisect_left
+from typing import Any, Awaitable, Callable
+
+from aiohttp import web
+from aiogram import BaseMiddleware, Bot, types
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм задержек, сек
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Отставание автозакрытия от дедлайна, сек
+LAG_BUCKETS = (0.01, 0.1, 0.5, 1, 5, 15, 60, 300, 900, 3600)
+# Размер записи хранилища, байт
+SIZE_BUCKETS = (1024, 16384, 131072, 1048576, 8388608, 67108864, 268435456)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple[str, ...], values: tuple) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Counter:
+    """Монотонный счётчик с метками."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        return [f"{self.name}{_labels(self.labels, key)} {value}" for key, value in self.values.items()]
+
+
+class Gauge:
+    """Текущее значение; fn вызывается при каждом сборе и возвращает {метки: значение}."""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labels: tuple[str, ...] = (),
+        fn: Callable[[], dict[tuple, float]] | None = None,
+    ):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.fn = fn
+        self.values: dict[tuple, float] = {}
+
+    def set(self, value: float, *labels):
+        self.values[labels] = value
+
+    def render(self) -> list[str]:
+        values = self.fn() if self.fn else self.values
+        return [f"{self.name}{_labels(self.labels, key)} {value}" for key, value in values.items()]
+
+
+class Histogram:
+    """
+    Гистограмма с фиксированными границами. observe() — один bisect
+    и два сложения, накопительные суммы считаются только при сборе.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = buckets
+        # метки -> [счётчики по корзинам (+Inf последней), сумма]
+        self.series: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self) -> list[str]:
+        lines = []
+        for key, (counts, total) in self.series.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                labels = _labels((*self.labels, "le"), (*key, bound))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: list[Counter | Gauge | Histogram] = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs) -> Counter:
+        return self.add(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs) -> Gauge:
+        return self.add(Gauge(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        return self.add(Histogram(*args, **kwargs))
+
+    def render(self) -> str:
+        """Текстовый формат Prometheus (exposition format 0.0.4)."""
+        lines = []
+        for metric in self.metrics:
+            try:
+                samples = metric.render()
+            except Exception as e:
+                logger.warning(f"⚠️ Метрика {metric.name} не собрана: {e}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# -------- Метрики бота --------
+HANDLER_SECONDS = registry.histogram(
+    "tgsupport_handler_seconds", "Время обработки апдейта хендлером", ("router", "event")
+)
+HANDLER_ERRORS = registry.counter(
+    "tgsupport_handler_errors_total", "Исключения в хендлерах", ("router", "event")
+)
+API_SECONDS = registry.histogram(
+    "tgsupport_api_request_seconds", "Время запроса к Bot API", ("method",)
+)
+API_ERRORS = registry.counter(
+    "tgsupport_api_errors_total", "Ошибки запросов к Bot API", ("method", "error")
+)
+API_THROTTLED = registry.counter(
+    "tgsupport_api_throttled_total", "Ответы 429 (flood control) от Bot API", ("method",)
+)
+STORAGE_SAVE_SECONDS = registry.histogram(
+    "tgsupport_storage_save_seconds", "Длительность записи хранилища на диск"
+)
+STORAGE_SAVE_BYTES = registry.histogram(
+    "tgsupport_storage_save_bytes", "Размер одной записи хранилища", buckets=SIZE_BUCKETS
+)
+AUTOCLOSE_LAG = registry.histogram(
+    "tgsupport_autoclose_lag_seconds", "Отставание автозакрытия от дедлайна темы", buckets=LAG_BUCKETS
+)
+
+
+# -------- Middleware --------
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Время хендлера роутера. Вешается внутренним middleware на наблюдатели
+    роутера, поэтому меряет только сработавший хендлер — без фильтров
+    других роутеров и без ожидания замка диалога.
+    """
+
+    def __init__(self, router: str, event: str):
+        self.router = router
+        self.event = event
+
+    async def __call__(
+        self,
+        handler: Callable[[types.TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: types.TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(self.router, self.event)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, self.router, self.event)
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    """
+    Время, ошибки и 429 запросов к Bot API. Подключается последним
+    (внутри лимитера), поэтому каждая попытка после RetryAfter видна отдельно.
+    """
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        name = method.__api_method__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter:
+            API_THROTTLED.inc(name)
+            raise
+        except Exception as e:
+            API_ERRORS.inc(name, type(e).__name__)
+            raise
+        finally:
+            API_SECONDS.observe(time.perf_counter() - started, name)
+
+
+def instrument_router(router, name: str):
+    """Подключает замер времени ко всем используемым наблюдателям роутера."""
+    for event, observer in router.observers.items():
+        if observer.handlers:
+            observer.middleware(HandlerMetricsMiddleware(name, event))
+
+
+# -------- HTTP --------
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    """Поднимает GET /metrics на отдельном порту."""
+
+    async def handle(request: web.Request) -> web.Response:
+        return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"📈 Метрики: http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,266 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from collections import OrderedDict
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+
+from bot.config import OUTBOX_FILE, OUTBOX_WORKERS, OUTBOX_MAX_ATTEMPTS
+from bot.utils.keyboards import get_user_keyboard
+from bot.utils.storage import atomic_write, storage
+
+logger = logging.getLogger(__name__)
+
+# Ошибки, после которых есть смысл повторить отправку
+TRANSIENT_ERRORS = (TelegramNetworkError, TelegramRetryAfter, TelegramServerError, asyncio.TimeoutError, OSError)
+
+# Сколько ключей доставленных сообщений помнить для защиты от дублей
+DELIVERED_KEYS = 10000
+
+# Задержка повтора: BACKOFF_BASE * 2^попытка, но не больше BACKOFF_MAX (сек)
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 300.0
+
+
+class RelayJob:
+    """
+    Одна пересылка: метод бота и его аргументы (только JSON-совместимые).
+    key — ключ идемпотентности (исходный чат и сообщение).
+    direction: "to_group" — от пользователя в тему, "to_user" — от поддержки.
+    album_ids — исходные сообщения альбома (для copy_messages).
+    """
+
+    __slots__ = (
+        "key", "method", "params", "keyboard", "direction",
+        "source_msg_id", "album_ids", "topic_id", "attempts", "next_at", "created_at",
+    )
+
+    def __init__(
+        self,
+        key: str,
+        method: str,
+        params: dict,
+        *,
+        direction: str,
+        source_msg_id: int,
+        topic_id: int | None,
+        album_ids: list[int] | None = None,
+        keyboard: bool = False,
+        attempts: int = 0,
+        next_at: float = 0.0,
+        created_at: float | None = None,
+    ):
+        self.key = key
+        self.method = method
+        self.params = params
+        self.keyboard = keyboard
+        self.direction = direction
+        self.source_msg_id = source_msg_id
+        self.album_ids = album_ids
+        self.topic_id = topic_id
+        self.attempts = attempts
+        self.next_at = next_at
+        self.created_at = created_at or time.time()
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "RelayJob":
+        data = dict(data)
+        return cls(data.pop("key"), data.pop("method"), data.pop("params"), **data)
+
+
+class Outbox:
+    """
+    Надёжная очередь пересылок.
+
+    Сначала отправка пробуется сразу. Если она упала на временной ошибке
+    (сеть, 5xx, flood control), задание сохраняется в файл и повторяется
+    пулом воркеров с экспоненциальной задержкой — в том числе после
+    перезапуска бота. Ключ идемпотентности не даёт отправить одно исходное
+    сообщение дважды.
+
+    Изменения очереди только отмечаются (_changed), файл пишет фоновая
+    задача в отдельном потоке — несколько изменений подряд дают одну
+    запись. Синхронно очередь сохраняется только в stop().
+    """
+
+    def __init__(self, path: str = OUTBOX_FILE, workers: int = OUTBOX_WORKERS):
+        self.path = path
+        self.workers = workers
+        self.pending: dict[str, RelayJob] = {}
+        self.delivered: OrderedDict[str, int] = OrderedDict()
+        self.dropped = 0
+        self._queue: asyncio.Queue[RelayJob] = asyncio.Queue()
+        self._tasks: list[asyncio.Task] = []
+        self._bot: Bot | None = None
+        self._dirty = asyncio.Event()
+        self._write_lock = asyncio.Lock()
+        self.load()
+
+    # -------- Состояние очереди --------
+    @property
+    def depth(self) -> int:
+        return len(self.pending)
+
+    @property
+    def oldest_age(self) -> float:
+        """Сколько секунд ждёт самое старое недоставленное сообщение."""
+        if not self.pending:
+            return 0.0
+        return time.time() - min(job.created_at for job in self.pending.values())
+
+    # -------- Отправка --------
+    async def send(self, bot: Bot, job: RelayJob) -> int | None:
+        """
+        Отправляет сразу. Возвращает message_id отправленного сообщения или
+        None, если отправка отложена в очередь или не удалась совсем.
+        """
+        if job.key in self.delivered:
+            return self.delivered[job.key]
+        if job.key in self.pending:
+            return None
+
+        try:
+            return await self._deliver(bot, job)
+        except TRANSIENT_ERRORS as e:
+            logger.warning(f"📮 Отправка отложена ({job.key}): {e}")
+            self._retry_later(job)
+            return None
+
+    async def _deliver(self, bot: Bot, job: RelayJob) -> int:
+        params = dict(job.params)
+        if job.keyboard:
+            params["reply_markup"] = get_user_keyboard()
+        sent = await getattr(bot, job.method)(**params)
+        sent_ids = [m.message_id for m in sent] if isinstance(sent, list) else [sent.message_id]
+
+        self.delivered[job.key] = sent_ids[0]
+        if len(self.delivered) > DELIVERED_KEYS:
+            self.delivered.popitem(last=False)
+        self._record_links(job, sent_ids)
+        return sent_ids[0]
+
+    @staticmethod
+    def _record_links(job: RelayJob, sent_ids: list[int]):
+        source_ids = job.album_ids or [job.source_msg_id]
+        for source_id, sent_id in zip(source_ids, sent_ids):
+            if job.direction == "to_group":
+                storage.link_user_message(source_id, sent_id, job.topic_id)
+            else:
+                storage.link_group_message(source_id, sent_id, job.topic_id)
+        if job.direction == "to_group" and job.topic_id:
+            storage.update_activity(job.topic_id)
+
+    def _retry_later(self, job: RelayJob):
+        job.attempts += 1
+        if job.attempts >= OUTBOX_MAX_ATTEMPTS:
+            self.pending.pop(job.key, None)
+            self.dropped += 1
+            logger.error(f"📮 Сообщение {job.key} не доставлено после {job.attempts} попыток")
+            self._changed()
+            return
+
+        delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** job.attempts)
+        job.next_at = time.time() + delay * random.uniform(0.8, 1.2)
+        self.pending[job.key] = job
+        self._changed()
+        self._queue.put_nowait(job)
+
+    # -------- Воркеры --------
+    def start(self, bot: Bot):
+        """Запускает воркеры и ставит в очередь задания, оставшиеся с прошлого запуска."""
+        self._bot = bot
+        for job in self.pending.values():
+            self._queue.put_nowait(job)
+        for _ in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker()))
+        self._tasks.append(asyncio.create_task(self._saver()))
+        if self.pending:
+            logger.info(f"📮 В очереди на повторную отправку: {len(self.pending)}")
+
+    async def stop(self):
+        # Отмена не прерывает запись в потоке — сначала дожидаемся её под блокировкой
+        async with self._write_lock:
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+        self.save()
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._queue.get()
+            if job.key not in self.pending:
+                continue
+
+            delay = job.next_at - time.time()
+            if delay > 0:
+                # Ещё рано — вернём в очередь к сроку и возьмём следующее
+                loop.call_later(delay, self._queue.put_nowait, job)
+                continue
+
+            try:
+                await self._deliver(self._bot, job)
+                self.pending.pop(job.key, None)
+                self._changed()
+            except TRANSIENT_ERRORS as e:
+                logger.warning(f"📮 Повтор {job.attempts} не удался ({job.key}): {e}")
+                self._retry_later(job)
+            except Exception as e:
+                self.pending.pop(job.key, None)
+                self.dropped += 1
+                self._changed()
+                logger.error(f"📮 Сообщение {job.key} отброшено: {e}")
+
+    # -------- Сохранение / загрузка --------
+    def _changed(self):
+        """Отмечает, что очередь изменилась; файл запишет _saver."""
+        self._dirty.set()
+
+    async def _saver(self):
+        while True:
+            await self._dirty.wait()
+            async with self._write_lock:
+                self._dirty.clear()
+                data = self._snapshot()
+                await asyncio.to_thread(self._write, data)
+
+    def _snapshot(self) -> dict:
+        return {
+            "pending": [job.to_dict() for job in self.pending.values()],
+            "delivered": list(self.delivered.items()),
+        }
+
+    def _write(self, data: dict):
+        try:
+            atomic_write(self.path, json.dumps(data, ensure_ascii=False).encode("utf-8"))
+        except Exception as e:
+            logger.error(f"⚠️ Ошибка сохранения очереди {self.path}: {e}")
+
+    def save(self):
+        """Синхронная запись — при остановке, когда фоновой задачи уже нет."""
+        self._write(self._snapshot())
+        self._dirty.clear()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for item in data.get("pending", []):
+                job = RelayJob.from_dict(item)
+                self.pending[job.key] = job
+            self.delivered = OrderedDict((key, msg_id) for key, msg_id in data.get("delivered", []))
+        except Exception as e:
+            logger.error(f"⚠️ Ошибка загрузки очереди {self.path}: {e}")
+
+
+outbox = Outbox()
@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import time
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+from bot.config import RATE_LIMIT_GLOBAL, RATE_LIMIT_PRIVATE, RATE_LIMIT_GROUP
+
+logger = logging.getLogger(__name__)
+
+# Методы, которые считаются «отправкой сообщения» в лимитах Telegram
+SEND_PREFIXES = ("send", "copy", "forward")
+
+# Сколько раз повторять запрос после RetryAfter
+MAX_RETRIES = 3
+
+# Сколько корзин чатов держать, прежде чем чистить простаивающие
+MAX_CHAT_BUCKETS = 10000
+
+# RetryAfter в стольких разных чатах за FLOOD_WINDOW секунд — лимит всего
+# бота, а не отдельного чата: на паузу встаёт общая корзина
+FLOOD_CHATS = 3
+FLOOD_WINDOW = 1.0
+
+
+class TokenBucket:
+    """
+    Простой token bucket: rate токенов в секунду, не больше capacity про запас.
+    acquire() ждёт ровно столько, сколько нужно до появления токенов.
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def is_idle(self) -> bool:
+        """Корзина полная — её можно выбросить без потери состояния."""
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity and not self._lock.locked()
+
+    def pause(self, seconds: float):
+        """Опустошает корзину так, чтобы первый токен появился через seconds."""
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+    async def acquire(self, tokens: float = 1):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+
+class RateLimitMiddleware(BaseRequestMiddleware):
+    """
+    Лимитер исходящих запросов к Bot API (middleware сессии бота).
+
+    - общий лимит на все запросы в чаты (RATE_LIMIT_GLOBAL в секунду);
+    - отправка в личный чат — RATE_LIMIT_PRIVATE в секунду;
+    - отправка в группу — RATE_LIMIT_GROUP в минуту.
+    Пока лимиты не выбраны, запрос уходит без задержки. На RetryAfter чат
+    ставится на паузу на указанное время и запрос повторяется. Весь бот
+    (общая корзина) встаёт на паузу, если 429 пришёл не на отправку
+    сообщения (правки, темы — это не лимит чата) или если за FLOOD_WINDOW
+    секунд 429 получили FLOOD_CHATS разных чатов.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = RATE_LIMIT_GLOBAL,
+        private_rate: float = RATE_LIMIT_PRIVATE,
+        group_per_minute: float = RATE_LIMIT_GROUP,
+    ):
+        self.global_bucket = TokenBucket(global_rate)
+        self.private_rate = private_rate
+        self.group_rate = group_per_minute / 60
+        self.group_capacity = group_per_minute
+        self.chats: dict[int | str, TokenBucket] = {}
+        self.retries = 0
+        self._flooded: dict[int | str, float] = {}  # чат -> время последнего 429
+
+    def _is_global_flood(self, chat_id: int | str) -> bool:
+        """Запоминает 429 в чате; True, если недавно их получили FLOOD_CHATS чатов."""
+        now = time.monotonic()
+        self._flooded = {cid: at for cid, at in self._flooded.items() if now - at < FLOOD_WINDOW}
+        self._flooded[chat_id] = now
+        return len(self._flooded) >= FLOOD_CHATS
+
+    def _chat_bucket(self, chat_id: int | str) -> TokenBucket:
+        bucket = self.chats.get(chat_id)
+        if bucket is None:
+            if len(self.chats) >= MAX_CHAT_BUCKETS:
+                self.chats = {cid: b for cid, b in self.chats.items() if not b.is_idle()}
+            if isinstance(chat_id, int) and chat_id > 0:
+                bucket = TokenBucket(self.private_rate, capacity=max(1, self.private_rate * 3))
+            else:
+                bucket = TokenBucket(self.group_rate, capacity=self.group_capacity)
+            self.chats[chat_id] = bucket
+        return bucket
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            # getUpdates, getMe и т.п. — не про отправку в чаты
+            return await make_request(bot, method)
+
+        is_send = method.__api_method__.startswith(SEND_PREFIXES)
+        for attempt in range(MAX_RETRIES + 1):
+            if is_send:
+                await self._chat_bucket(chat_id).acquire()
+            await self.global_bucket.acquire()
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt == MAX_RETRIES:
+                    raise
+                self.retries += 1
+                if self._is_global_flood(chat_id) or not is_send:
+                    logger.warning(
+                        f"⏳ Flood control: {method.__api_method__} в чате {chat_id}, "
+                        f"пауза всего бота {e.retry_after} с"
+                    )
+                    self.global_bucket.pause(e.retry_after)
+                else:
+                    logger.warning(
+                        f"⏳ Flood control: {method.__api_method__} в чате {chat_id}, пауза {e.retry_after} с"
+                    )
+                self._chat_bucket(chat_id).pause(e.retry_after)
+                await asyncio.sleep(e.retry_after)
@@ -0,0 +1,219 @@
+"""
+Запись входящих апдейтов для нагрузочных тестов.
+
+RecorderMiddleware (внешний middleware апдейтов диспетчера) кладёт каждый
+апдейт в очередь, а отдельный поток обезличивает его и дописывает строкой
+в сжатый JSONL (gzip). Раз в FLUSH_INTERVAL поток сбрасывает сжатый поток
+на диск — при аварийной остановке теряется не больше последней секунды.
+
+Строка файла:
+    {"header": {"version": 1, "support_group_id": ..., "started": ...}} — при каждом запуске;
+    {"t": время получения, "update": {...}, "owner": владелец темы} — апдейт.
+
+owner — обезличенный пользователь темы для сообщений из группы поддержки:
+по нему воспроизведение находит тему, созданную уже при повторе.
+Воспроизведение: python -m benchmarks.replay <файл>...
+"""
+import gzip
+import hashlib
+import hmac
+import json
+import logging
+import queue
+import threading
+import time
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware, types
+
+from bot.config import BOT_TOKEN, RECORD_FILE, SUPPORT_GROUP_ID
+from bot.utils.keyboards import get_user_keyboard
+from bot.utils.metrics import registry
+from bot.utils.storage import storage
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+
+# Сколько апдейтов держать в очереди на запись; при переполнении — отбрасываем
+RECORD_QUEUE_SIZE = 10000
+
+# Как часто сбрасывать сжатый поток на диск, сек
+FLUSH_INTERVAL = 1.0
+
+RECORDED = registry.counter("tgsupport_recorder_updates_total", "Записанные апдейты")
+RECORD_DROPPED = registry.counter(
+    "tgsupport_recorder_dropped_total", "Апдейты, не записанные из-за переполненной очереди"
+)
+
+# Тексты, от которых зависит поведение бота, — их сохраняем как есть
+KEEP_TEXTS = {button.text for row in get_user_keyboard().keyboard for button in row}
+
+# Тексты сообщений: команды и кнопки сохраняются, остальное — заглушка
+TEXT_KEYS = {"text", "caption", "title", "address", "question", "description", "performer"}
+# Служебные строки, от которых зависит разбор апдейта, — как есть. Любая
+# другая строка (в том числе в полях новых версий Bot API) — заглушка
+KEEP_KEYS = {"type", "status", "language_code", "mime_type", "media_group_id", "emoji"}
+DROP_KEYS = {"username", "last_name", "bio", "email"}
+FILE_KEYS = {"file_id", "file_unique_id"}
+USER_ID_KEYS = {"id", "user_id", "user_chat_id"}
+
+
+class Scrubber:
+    """
+    Обезличивание апдейта. ID пользователей и файлов заменяются HMAC от
+    токена бота — одинаково во всех записях, но необратимо без токена.
+    Тексты заменяются заглушкой той же длины (в UTF-16, как считает
+    Telegram), поэтому смещения entities остаются верными. Строки
+    остальных полей заменяются заглушкой по умолчанию — как есть остаются
+    только служебные (KEEP_KEYS): vCard, данные Web App и Telegram Passport,
+    callback data, адреса доставки и поля, которых ещё нет в Bot API, в запись
+    не попадают.
+    """
+
+    def __init__(self, key: bytes):
+        self.key = key
+
+    def _digest(self, value) -> bytes:
+        return hmac.new(self.key, str(value).encode(), hashlib.sha256).digest()
+
+    def user_id(self, value: int) -> int:
+        # Положительный и меньше 2^48 — как настоящие ID пользователей
+        return int.from_bytes(self._digest(value)[:6], "big") + 1
+
+    def file_id(self, value: str) -> str:
+        return self._digest(value)[:12].hex()
+
+    @staticmethod
+    def placeholder(value: str) -> str:
+        return "x" * (len(value.encode("utf-16-le")) // 2)
+
+    @classmethod
+    def text(cls, value: str) -> str:
+        if value in KEEP_TEXTS:
+            return value
+        if value.startswith("/"):
+            # Команда без аргументов
+            return value.split(maxsplit=1)[0]
+        return cls.placeholder(value)
+
+    def scrub(self, value):
+        if isinstance(value, str):
+            # Строка в списке — имени поля нет, значит, не служебная
+            return self.placeholder(value)
+        if isinstance(value, list):
+            return [self.scrub(item) for item in value]
+        if not isinstance(value, dict):
+            return value
+
+        is_bot = value.get("is_bot")
+        result = {}
+        for key, item in value.items():
+            if key in DROP_KEYS:
+                continue
+            if key in USER_ID_KEYS and isinstance(item, int) and item > 0 and not is_bot:
+                result[key] = self.user_id(item)
+            elif key in TEXT_KEYS and isinstance(item, str):
+                result[key] = self.text(item)
+            elif key in FILE_KEYS:
+                result[key] = self.file_id(item)
+            elif key == "first_name":
+                result[key] = "Bot" if is_bot else "User"
+            elif key == "file_name":
+                result[key] = "file" + item[item.rfind("."):] if "." in item else "file"
+            elif key == "phone_number":
+                result[key] = "+0"
+            elif key in ("latitude", "longitude"):
+                result[key] = 0.0
+            elif key == "url":
+                result[key] = "https://example.com"
+            elif isinstance(item, str):
+                result[key] = item if key in KEEP_KEYS else self.placeholder(item)
+            else:
+                result[key] = self.scrub(item)
+        return result
+
+
+class UpdateRecorder:
+    """Фоновая запись обезличенных апдейтов в gzip JSONL (дописывает файл)."""
+
+    def __init__(self, path: str, key: bytes):
+        self.path = path
+        self.scrubber = Scrubber(key)
+        self.queue: queue.Queue = queue.Queue(RECORD_QUEUE_SIZE)
+        self._thread: threading.Thread | None = None
+
+    def start(self):
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._run, name="update-recorder", daemon=True)
+        self._thread.start()
+        logger.info(f"⏺ Запись апдейтов: {self.path}")
+
+    def stop(self):
+        """Дописывает очередь и закрывает файл."""
+        if not self._thread:
+            return
+        self.queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def record(self, update: types.Update, owner: str | None = None):
+        try:
+            self.queue.put_nowait((time.time(), update, owner))
+        except queue.Full:
+            RECORD_DROPPED.inc()
+
+    def encode(self, received_at: float, update: types.Update, owner: str | None) -> str:
+        entry = {
+            "t": round(received_at, 3),
+            "update": self.scrubber.scrub(update.model_dump(mode="json", exclude_none=True, by_alias=True)),
+        }
+        if owner:
+            entry["owner"] = self.scrubber.user_id(int(owner))
+        return json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+    def _run(self):
+        header = {"version": FORMAT_VERSION, "support_group_id": SUPPORT_GROUP_ID, "started": time.time()}
+        with gzip.open(self.path, "at", encoding="utf-8") as f:
+            f.write(json.dumps({"header": header}) + "\n")
+            flushed_at = time.monotonic()
+            while True:
+                try:
+                    item = self.queue.get(timeout=FLUSH_INTERVAL)
+                except queue.Empty:
+                    item = ()
+                if item is None:
+                    break
+                if item:
+                    try:
+                        f.write(self.encode(*item))
+                        RECORDED.inc()
+                    except Exception as e:
+                        logger.warning(f"⚠️ Апдейт не записан: {e}")
+                if time.monotonic() - flushed_at >= FLUSH_INTERVAL:
+                    f.flush()
+                    flushed_at = time.monotonic()
+
+
+class RecorderMiddleware(BaseMiddleware):
+    """Передаёт каждый входящий апдейт в запись до обработки."""
+
+    def __init__(self, recorder: UpdateRecorder):
+        self.recorder = recorder
+
+    async def __call__(
+        self,
+        handler: Callable[[types.TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: types.Update,
+        data: dict[str, Any],
+    ) -> Any:
+        message = event.message or event.edited_message
+        owner = None
+        if message and message.chat.id == SUPPORT_GROUP_ID and message.message_thread_id:
+            owner = await storage.find_user_by_topic_async(message.message_thread_id)
+        self.recorder.record(event, owner)
+        return await handler(event, data)
+
+
+recorder = UpdateRecorder(RECORD_FILE, BOT_TOKEN.encode()) if RECORD_FILE else None
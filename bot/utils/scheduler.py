@@ -0,0 +1,124 @@
+import asyncio
+import heapq
+import logging
+import time
+from typing import Awaitable, Callable
+
+from bot.utils.metrics import AUTOCLOSE_LAG
+from bot.utils.storage import BaseStorage
+
+logger = logging.getLogger(__name__)
+
+# Через сколько повторить партию, обработка которой упала с ошибкой, сек
+ERROR_RETRY = 600
+
+
+class InactivityScheduler:
+    """
+    Планировщик автозакрытия неактивных тем.
+
+    Дедлайны (last_activity + timeout) лежат в min-heap, поэтому задача спит
+    ровно до ближайшего дедлайна. Новая активность просто кладёт в кучу новую
+    запись, а устаревшие записи отбрасываются при извлечении (ленивая
+    инвалидация) — актуальный дедлайн темы хранится в _deadlines.
+    """
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self._heap: list[tuple[float, int]] = []
+        self._deadlines: dict[int, float] = {}
+        self._wakeup = asyncio.Event()
+        self._sleep_until: float | None = None
+        self.last_lag = 0.0  # на сколько позже дедлайна обработана последняя партия, сек
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    # -------- Обновление дедлайнов --------
+    def on_activity(self, topic_id: int, last_activity: float | None):
+        """Слушатель хранилища: новая активность или удаление темы (None)."""
+        if last_activity is None:
+            self.cancel(topic_id)
+        else:
+            self.schedule(topic_id, last_activity + self.timeout)
+
+    def schedule(self, topic_id: int, deadline: float):
+        self._deadlines[topic_id] = deadline
+        heapq.heappush(self._heap, (deadline, topic_id))
+
+        # Куча из одних устаревших записей не должна расти бесконечно
+        if len(self._heap) > 2 * len(self._deadlines) + 1024:
+            self._heap = [(d, tid) for tid, d in self._deadlines.items()]
+            heapq.heapify(self._heap)
+
+        if self._sleep_until is None or deadline < self._sleep_until:
+            self._wakeup.set()
+
+    def cancel(self, topic_id: int):
+        self._deadlines.pop(topic_id, None)
+
+    def rebuild(self, storage: BaseStorage):
+        """Заполняет дедлайны из хранилища (после перезапуска)."""
+        now = time.time()
+        self._heap.clear()
+        self._deadlines.clear()
+        for topic_id in storage.open_topics().values():
+            last = storage.get_last_activity(topic_id) or now
+            self._deadlines[topic_id] = last + self.timeout
+        self._heap = [(d, tid) for tid, d in self._deadlines.items()]
+        heapq.heapify(self._heap)
+        self._wakeup.set()
+
+    # -------- Извлечение --------
+    def next_deadline(self) -> float | None:
+        while self._heap:
+            deadline, topic_id = self._heap[0]
+            if self._deadlines.get(topic_id) == deadline:
+                return deadline
+            heapq.heappop(self._heap)
+        return None
+
+    def pop_due(self, now: float) -> list[int]:
+        """Забирает все темы, дедлайн которых наступил."""
+        return [topic_id for _, topic_id in self._pop_due(now)]
+
+    def _pop_due(self, now: float) -> list[tuple[float, int]]:
+        due = []
+        while True:
+            deadline = self.next_deadline()
+            if deadline is None or deadline > now:
+                return due
+            due.append(heapq.heappop(self._heap))
+            del self._deadlines[due[-1][1]]
+
+    async def run(self, on_expired: Callable[[list[int]], Awaitable[None]]):
+        """Спит до ближайшего дедлайна и передаёт истёкшие темы в on_expired."""
+        while True:
+            self._wakeup.clear()
+            due = self._pop_due(time.time())
+            if due:
+                try:
+                    await on_expired([topic_id for _, topic_id in due])
+                except Exception as e:
+                    # Одна ошибка не должна выключать автозакрытие до перезапуска
+                    logger.error(f"⚠️ Ошибка автозакрытия партии из {len(due)} тем: {e}")
+                    retry_at = time.time() + ERROR_RETRY
+                    for _, topic_id in due:
+                        # Тему могли уже перепланировать активностью — её дедлайн не трогаем
+                        if topic_id not in self._deadlines:
+                            self.schedule(topic_id, retry_at)
+                # Отставание: от дедлайна до конца обработки партии
+                done = time.time()
+                for deadline, _ in due:
+                    AUTOCLOSE_LAG.observe(done - deadline)
+                self.last_lag = done - due[0][0]
+                continue
+
+            self._sleep_until = self.next_deadline()
+            timeout = None if self._sleep_until is None else self._sleep_until - time.time()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self._sleep_until = None
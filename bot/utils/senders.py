@@ -1,9 +1,118 @@
+import logging
+
 from aiogram import Bot, types
-from bot.utils.keyboards import get_user_keyboard
+from aiogram.enums import ContentType
 from bot.utils.storage import storage
+from bot.utils.outbox import RelayJob, outbox
+
+logger = logging.getLogger(__name__)
+
+# Всё пересылается через copy_message: Telegram копирует сообщение у себя,
+# файл не загружается заново, подпись и форматирование (entities) сохраняются.
+# Новые типы контента копируются без правок здесь. Не копируются только
+# служебные сообщения и то, что copyMessage не принимает (платные медиа,
+# розыгрыши, счета).
+NOT_COPYABLE = frozenset({
+    # Служебные
+    ContentType.NEW_CHAT_MEMBERS,
+    ContentType.LEFT_CHAT_MEMBER,
+    ContentType.NEW_CHAT_TITLE,
+    ContentType.NEW_CHAT_PHOTO,
+    ContentType.DELETE_CHAT_PHOTO,
+    ContentType.GROUP_CHAT_CREATED,
+    ContentType.SUPERGROUP_CHAT_CREATED,
+    ContentType.CHANNEL_CHAT_CREATED,
+    ContentType.MESSAGE_AUTO_DELETE_TIMER_CHANGED,
+    ContentType.MIGRATE_TO_CHAT_ID,
+    ContentType.MIGRATE_FROM_CHAT_ID,
+    ContentType.PINNED_MESSAGE,
+    ContentType.SUCCESSFUL_PAYMENT,
+    ContentType.REFUNDED_PAYMENT,
+    ContentType.USERS_SHARED,
+    ContentType.USER_SHARED,
+    ContentType.CHAT_SHARED,
+    ContentType.CONNECTED_WEBSITE,
+    ContentType.WRITE_ACCESS_ALLOWED,
+    ContentType.PASSPORT_DATA,
+    ContentType.PROXIMITY_ALERT_TRIGGERED,
+    ContentType.BOOST_ADDED,
+    ContentType.CHAT_BACKGROUND_SET,
+    ContentType.FORUM_TOPIC_CREATED,
+    ContentType.FORUM_TOPIC_EDITED,
+    ContentType.FORUM_TOPIC_CLOSED,
+    ContentType.FORUM_TOPIC_REOPENED,
+    ContentType.GENERAL_FORUM_TOPIC_HIDDEN,
+    ContentType.GENERAL_FORUM_TOPIC_UNHIDDEN,
+    ContentType.GIVEAWAY_CREATED,
+    ContentType.GIVEAWAY_COMPLETED,
+    ContentType.VIDEO_CHAT_SCHEDULED,
+    ContentType.VIDEO_CHAT_STARTED,
+    ContentType.VIDEO_CHAT_ENDED,
+    ContentType.VIDEO_CHAT_PARTICIPANTS_INVITED,
+    ContentType.WEB_APP_DATA,
+    # copyMessage их не принимает
+    ContentType.PAID_MEDIA,
+    ContentType.GIVEAWAY,
+    ContentType.GIVEAWAY_WINNERS,
+    ContentType.INVOICE,
+})
+
+
+def can_relay(message: types.Message) -> bool:
+    """
+    Можно ли переслать сообщение. Смотрим только поля, пришедшие в апдейте
+    (model_fields_set), — это дешевле, чем message.content_type, который
+    перебирает все типы по очереди. Поле может быть в model_fields_set
+    и со значением None (например, у сообщения, собранного aiogram
+    из словаря), поэтому значение всё равно проверяется.
+    """
+    for field in NOT_COPYABLE.intersection(message.model_fields_set):
+        if getattr(message, field) is not None:
+            return False
+    return True
+
+
+async def resolve_reply(message: types.Message, to_user: bool) -> int | None:
+    """Находит сообщение на другой стороне, на которое нужно ответить (цитата)."""
+    if not message.reply_to_message:
+        return None
+    replied_id = message.reply_to_message.message_id
+    if to_user:
+        return await storage.get_user_msg_by_group_msg_async(replied_id)
+    return await storage.get_group_msg_by_user_msg_async(replied_id)
+
+
+def build_relay_job(
+    message: types.Message,
+    target_id: int,
+    *,
+    thread_id: int | None = None,
+    reply_to: int | None = None,
+    to_user: bool = False,
+    keyboard: bool = False,
+    topic_id: int | None = None,
+) -> RelayJob | None:
+    """Готовит задание пересылки через copy_message (None — сообщение не копируется)."""
+    if not can_relay(message):
+        return None
 
-# УДАЛИТЬ эту строку - она вызывает циклический импорт
-# from bot.utils.senders import forward_message
+    chat_id = message.chat.id
+    message_id = message.message_id
+    params = {"chat_id": target_id, "from_chat_id": chat_id, "message_id": message_id}
+    if thread_id:
+        params["message_thread_id"] = thread_id
+    if reply_to:
+        params["reply_to_message_id"] = reply_to
+
+    return RelayJob(
+        f"{chat_id}:{message_id}",
+        "copy_message",
+        params,
+        keyboard=keyboard,
+        direction="to_user" if to_user else "to_group",
+        source_msg_id=message_id,
+        topic_id=topic_id or thread_id,
+    )
 
 
 async def forward_message(
@@ -14,58 +123,70 @@ async def forward_message(
     thread_id: int | None = None,
     reply_to: int | None = None,
     to_user: bool = False,
+    keyboard: bool = False,
+    topic_id: int | None = None,
 ) -> int | None:
     """
-    Универсальная пересылка сообщений с поддержкой цитат.
+    Универсальная пересылка сообщений в обе стороны с поддержкой цитат.
+    to_user — направление (из группы пользователю), keyboard — добавить
+    клавиатуру пользователя, topic_id — тема-владелец связи (по умолчанию
+    thread_id). Связь сообщений записывается при доставке.
+    Возвращает ID отправленного сообщения или None, если отправка
+    не удалась или отложена в outbox.
     """
-    kwargs = {"chat_id": target_id}
-    if thread_id:
-        kwargs["message_thread_id"] = thread_id
-    if to_user:
-        kwargs["reply_markup"] = get_user_keyboard()
-
     try:
-        # Определяем ID сообщения для ответа
-        reply_to_id = reply_to
-        if not reply_to_id and message.reply_to_message:
-            replied_id = message.reply_to_message.message_id
-            if to_user:
-                reply_to_id = storage.get_user_msg_by_group_msg(replied_id)
-            else:
-                reply_to_id = storage.get_group_msg_by_user_msg(replied_id)
-
-        if reply_to_id:
-            kwargs["reply_to_message_id"] = reply_to_id
-
-        # Отправка сообщения
-        sent = None
-        if message.text:
-            sent = await bot.send_message(**kwargs, text=message.text)
-        elif message.photo:
-            sent = await bot.send_photo(**kwargs, photo=message.photo[-1].file_id, caption=message.caption or "")
-        elif message.document:
-            sent = await bot.send_document(**kwargs, document=message.document.file_id, caption=message.caption or "")
-        elif message.video:
-            sent = await bot.send_video(**kwargs, video=message.video.file_id, caption=message.caption or "")
-        else:
-            copy_kwargs = kwargs.copy()
-            copy_kwargs.update({
-                "from_chat_id": message.chat.id,
-                "message_id": message.message_id
-            })
-            sent = await bot.copy_message(**copy_kwargs)
-
-        if not sent:
+        job = build_relay_job(
+            message,
+            target_id,
+            thread_id=thread_id,
+            reply_to=reply_to or await resolve_reply(message, to_user),
+            to_user=to_user,
+            keyboard=keyboard,
+            topic_id=topic_id,
+        )
+        if job is None:
             return None
+        return await outbox.send(bot, job)
 
-        # Сохраняем связи сообщений (БЕЗ DEBUG ЛОГОВ)
-        if to_user:
-            storage.link_group_message(message.message_id, sent.message_id)
-        else:
-            storage.link_user_message(message.message_id, sent.message_id)
+    except Exception as e:
+        logger.error("⚠️ Ошибка при пересылке сообщения: %s", e, extra={"topic_id": topic_id or thread_id})
+        return None
+
+
+async def forward_album(
+    bot: Bot,
+    target_id: int,
+    messages: list[types.Message],
+    *,
+    thread_id: int | None = None,
+    to_user: bool = False,
+    topic_id: int | None = None,
+) -> int | None:
+    """
+    Пересылает альбом одним запросом copy_messages — группировка сохраняется,
+    связь записывается для каждой части.
+    """
+    first = messages[0]
+    params = {
+        "chat_id": target_id,
+        "from_chat_id": first.chat.id,
+        "message_ids": [m.message_id for m in messages],
+    }
+    if thread_id:
+        params["message_thread_id"] = thread_id
 
-        return sent.message_id
+    try:
+        job = RelayJob(
+            f"{first.chat.id}:{first.message_id}:album",
+            "copy_messages",
+            params,
+            direction="to_user" if to_user else "to_group",
+            source_msg_id=first.message_id,
+            album_ids=params["message_ids"],
+            topic_id=topic_id or thread_id,
+        )
+        return await outbox.send(bot, job)
 
     except Exception as e:
-        print(f"⚠️ Ошибка при пересылке сообщения: {e}")
-        return None
\ No newline at end of file
+        logger.error("⚠️ Ошибка при пересылке альбома: %s", e, extra={"topic_id": topic_id or thread_id})
+        return None
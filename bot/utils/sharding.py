@@ -0,0 +1,32 @@
+from typing import Awaitable, Callable
+
+
+def shard_of(user_id: int | str, count: int) -> int:
+    """Номер воркера, которому принадлежит пользователь."""
+    return int(user_id) % count
+
+
+async def pick_shard(update: dict, count: int, find_user: Callable[[int], Awaitable[str | None]]) -> int:
+    """
+    Выбирает воркер для сырого апдейта Telegram (dict, без разбора в модели).
+
+    Личные сообщения идут по ID пользователя, сообщения в темах группы — по
+    владельцу темы, поэтому обе стороны одного диалога всегда попадают в один
+    процесс. Всё остальное (команды в общем чате, служебные апдейты, темы
+    без владельца) — воркеру 0. По ID темы не распределяем: так ответ в тему,
+    владельца которой find_user ещё не видит, ушёл бы чужому воркеру.
+    """
+    message = update.get("message") or update.get("edited_message")
+    if message is None:
+        return 0
+
+    chat = message["chat"]
+    if chat["type"] == "private":
+        return shard_of(chat["id"], count)
+
+    topic_id = message.get("message_thread_id")
+    if topic_id:
+        user_id = await find_user(topic_id)
+        if user_id is not None:
+            return shard_of(user_id, count)
+    return 0
@@ -0,0 +1,173 @@
+"""
+Форматы снимка MemoryStorage.
+
+Бинарный (основной): заголовок JSON с небольшими структурами (темы,
+активность, карточки, история чатов) и упакованные колонки int64 связей
+сообщений. Файл открывается через mmap, колонки становятся memoryview без
+копирования и разбора — страницы подгружаются с диска при первом обращении.
+
+    MAGIC (6 байт) | версия (u16) | длина заголовка (u32) | заголовок JSON |
+    выравнивание до 8 байт | колонки
+
+Версия 2: общий индекс g2u/u2g и корзины только с ID сообщений по темам.
+Версия 1 (колонки g2u/u2g у каждой корзины) читается и сливается в индекс.
+
+JSON — формат экспорта/импорта: python -m bot.utils.snapshot export|import
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from bot.utils.linkmap import LinkMap, LinkBucket, restore_links
+
+MAGIC = b"TGSNAP"
+VERSION = 2
+PREFIX = struct.Struct("<6sHI")
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+# -------- JSON --------
+def _json_default(value):
+    """Компактные структуры снимка в формате JSON."""
+    if isinstance(value, (LinkMap, LinkBucket)):
+        return value.to_dict()
+    if isinstance(value, (array, memoryview)):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} не сериализуется в JSON")
+
+
+def encode_json(data: dict) -> bytes:
+    return json.dumps(
+        data, ensure_ascii=False, separators=(",", ":"), default=_json_default
+    ).encode("utf-8")
+
+
+# -------- Бинарный формат --------
+def encode(data: dict) -> bytes:
+    """Снимок в бинарный формат. Колонки копии снимка сжимаются на месте."""
+    chunks: list[bytes] = []
+    offset = 0
+
+    def put(column) -> int:
+        nonlocal offset
+        raw = column.tobytes()
+        chunks.append(raw)
+        start, offset = offset, offset + len(raw)
+        return start
+
+    g2u, u2g, buckets = restore_links(data.get("links", []))
+    links = {"buckets": [
+        {"start": bucket.start, "topics": [[tid, put(ids), len(ids)] for tid, ids in bucket.topics.items()]}
+        for bucket in buckets
+    ]}
+    for name, index in (("g2u", g2u), ("u2g", u2g)):
+        index.compact()
+        links[name] = [put(index.keys), put(index.values), len(index)]
+
+    header = {key: value for key, value in data.items() if key != "links"}
+    header["links"] = links
+    header["byteorder"] = sys.byteorder
+    header_raw = encode_json(header)
+
+    prefix = PREFIX.pack(MAGIC, VERSION, len(header_raw))
+    head = prefix + header_raw
+    return b"".join([head, b"\0" * (_align(len(head)) - len(head)), *chunks])
+
+
+def _column(view: memoryview, base: int, offset: int, count: int, swap: bool, copy: bool = False):
+    raw = view[base + offset:base + offset + count * 8]
+    if not swap and not copy:
+        return raw.cast("q")
+    owned = array("q")
+    owned.frombytes(raw)
+    if swap:
+        # Снимок с машины с другим порядком байт
+        owned.byteswap()
+    return owned
+
+
+def decode(buffer) -> dict:
+    """Разбирает бинарный снимок; колонки ссылаются на buffer без копирования."""
+    magic, version, header_len = PREFIX.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise ValueError("не бинарный снимок")
+    if version > VERSION:
+        raise ValueError(f"снимок версии {version} новее поддерживаемой {VERSION}")
+
+    header = json.loads(bytes(buffer[PREFIX.size:PREFIX.size + header_len]))
+    base = _align(PREFIX.size + header_len)
+    swap = header.pop("byteorder", sys.byteorder) != sys.byteorder
+    view = memoryview(buffer)
+
+    def links(entry: list) -> LinkMap:
+        keys_at, values_at, count = entry
+        return LinkMap.from_columns(
+            _column(view, base, keys_at, count, swap),
+            _column(view, base, values_at, count, swap),
+        )
+
+    def bucket(entry: dict) -> LinkBucket:
+        bucket = LinkBucket(entry["start"])
+        for tid, at, count in entry["topics"]:
+            # Списки тем пополняются новыми связями — нужна своя копия
+            bucket.topics[tid] = _column(view, base, at, count, swap, copy=True)
+        return bucket
+
+    if version < 2:
+        # Колонки у каждой корзины — в прежнем виде, restore_links сольёт их
+        header["links"] = [
+            {**bucket(entry).to_dict(), "g2u": links(entry["g2u"]), "u2g": links(entry["u2g"])}
+            for entry in header.get("links", [])
+        ]
+        return header
+
+    entry = header["links"]
+    header["links"] = {
+        "g2u": links(entry["g2u"]),
+        "u2g": links(entry["u2g"]),
+        "buckets": [bucket(item) for item in entry["buckets"]],
+    }
+    return header
+
+
+def is_binary(path: str) -> bool:
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def read(path: str) -> dict:
+    """Читает снимок любого формата (бинарный — через mmap)."""
+    if is_binary(path):
+        with open(path, "rb") as f:
+            # mmap живёт, пока на него ссылаются колонки
+            return decode(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    with open(path, "r", encoding="utf-8") as f:
+        raw = f.read().strip()
+    if not raw:
+        raise ValueError("Файл пуст")
+    return json.loads(raw)
+
+
+def _convert(source: str, target: str, binary: bool):
+    data = read(source)
+    payload = encode(data) if binary else encode_json(data)
+    tmp_path = f"{target}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(payload)
+    os.replace(tmp_path, target)
+    print(f"✅ {source} → {target} ({len(payload)} байт)")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] not in ("export", "import"):
+        print("Использование: python -m bot.utils.snapshot export <снимок> <файл.json>")
+        print("               python -m bot.utils.snapshot import <файл.json> <снимок>")
+        sys.exit(1)
+    _convert(sys.argv[2], sys.argv[3], binary=sys.argv[1] == "import")
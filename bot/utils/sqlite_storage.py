@@ -0,0 +1,567 @@
+import asyncio
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from bot.config import (
+    SQLITE_FILE,
+    STORAGE_FILE,
+    LINK_RETENTION_DAYS,
+    CHAT_HISTORY_LIMIT,
+)
+from bot.utils.storage import CHAT_HISTORY_TTL, BaseStorage, MemoryStorage, Ticket
+from bot.utils.sharding import shard_of
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS topics (
+    user_id         TEXT PRIMARY KEY,
+    topic_id        INTEGER NOT NULL UNIQUE,
+    last_activity   REAL,
+    notification_id INTEGER,
+    user_name       TEXT,
+    username        TEXT,
+    created_at      REAL
+);
+CREATE TABLE IF NOT EXISTS links (
+    group_msg_id INTEGER PRIMARY KEY,
+    user_msg_id  INTEGER NOT NULL,
+    topic_id     INTEGER,
+    created_at   REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS links_user_msg ON links(user_msg_id);
+CREATE INDEX IF NOT EXISTS links_topic ON links(topic_id);
+CREATE INDEX IF NOT EXISTS links_created ON links(created_at);
+CREATE TABLE IF NOT EXISTS chat_messages (
+    user_id    TEXT NOT NULL,
+    message_id INTEGER NOT NULL,
+    created_at REAL,
+    PRIMARY KEY (user_id, message_id)
+) WITHOUT ROWID;
+"""
+
+# Чтения, общие для синхронных методов и методов event loop (*_async)
+OWNER_QUERY = "SELECT user_id FROM topics WHERE topic_id = ?"
+TICKET_QUERY = "SELECT user_name, username, created_at, notification_id FROM topics WHERE topic_id = ?"
+G2U_QUERY = "SELECT user_msg_id FROM links WHERE group_msg_id = ?"
+U2G_QUERY = "SELECT group_msg_id FROM links WHERE user_msg_id = ? ORDER BY created_at DESC LIMIT 1"
+CHAT_QUERY = "SELECT message_id FROM chat_messages WHERE user_id = ? ORDER BY message_id"
+
+# Колонки карточки обращения, добавленные в topics после первой версии схемы
+TICKET_COLUMNS = {"user_name": "TEXT", "username": "TEXT", "created_at": "REAL"}
+
+# Сколько последних связей держать в памяти (чтение сразу после записи)
+LINK_CACHE_SIZE = 10000
+
+# Сколько ждать блокировку базы, занятую другим процессом, мс
+BUSY_TIMEOUT_MS = 5000
+
+
+def _snap_path(json_path: str) -> str:
+    return os.path.splitext(json_path)[0] + ".snap"
+
+
+def _ticket_from_row(row: tuple) -> Ticket:
+    return Ticket(row[0] or "", row[1] or "", row[2] or 0.0, row[3])
+
+
+class _Query:
+    """
+    Чтение, поставленное в очередь потока записи: выполняется после всех
+    записей, поставленных раньше. Результат уходит в future event loop
+    после коммита пачки.
+    """
+
+    __slots__ = ("sql", "params", "loop", "future", "rows", "error")
+
+    def __init__(self, sql: str, params: tuple, loop: asyncio.AbstractEventLoop):
+        self.sql = sql
+        self.params = params
+        self.loop = loop
+        self.future = loop.create_future()
+        self.rows: list[tuple] | None = None
+        self.error: Exception | None = None
+
+    def run(self, db: sqlite3.Connection):
+        self.rows = db.execute(self.sql, self.params).fetchall()
+
+    def resolve(self):
+        def deliver():
+            if self.future.done():
+                return
+            if self.error is not None:
+                self.future.set_exception(self.error)
+            else:
+                self.future.set_result(self.rows)
+
+        try:
+            self.loop.call_soon_threadsafe(deliver)
+        except RuntimeError:
+            # Event loop уже закрыт — результат никто не ждёт
+            pass
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    Хранилище в локальной базе SQLite (WAL).
+
+    Открытые темы держатся в памяти — их столько же, сколько открытых
+    обращений. Связи сообщений живут только в базе, поэтому память не растёт
+    с историей. Все записи уходят в отдельный поток и коммитятся пачками,
+    не блокируя event loop; чтение связи — точечный запрос по индексу.
+    Из event loop база читается через *_async: промах по памяти уходит
+    в поток чтения со своим соединением (WAL не блокирует его записью).
+
+    Базу могут делить несколько процессов (BOT_MODE=sharded):
+    - shard=(номер, всего) — воркер держит в памяти только темы своих
+      пользователей, остальные принадлежат другим воркерам;
+    - read_through=True — приёмник: тема, которой нет в памяти (её открыл
+      воркер уже после запуска), ищется в базе.
+    """
+
+    def __init__(
+        self,
+        path: str = SQLITE_FILE,
+        retention_days: int = LINK_RETENTION_DAYS,
+        shard: tuple[int, int] | None = None,
+        read_through: bool = False,
+    ):
+        super().__init__()
+        self.path = path
+        self.shard = shard
+        self.read_through = read_through
+        self.retention = retention_days * 24 * 60 * 60
+        self.user_topics: dict[str, int] = {}
+        self.topic_users: dict[int, str] = {}
+        self.last_activity: dict[int, float] = {}
+        self.tickets: dict[int, Ticket] = {}  # карточки открытых тем, читаются по требованию
+        self._g2u_cache: OrderedDict[int, int] = OrderedDict()
+        self._u2g_cache: OrderedDict[int, int] = OrderedDict()
+        self._owner_cache: OrderedDict[int, str] = OrderedDict()
+
+        is_new = not os.path.exists(path)
+        self._db = self._connect()
+        self._db.executescript(SCHEMA)
+        self._upgrade_schema()
+        self._load_topics()
+
+        self._queue: queue.Queue = queue.Queue()
+        self._writer = threading.Thread(target=self._writer_loop, name="sqlite-writer", daemon=True)
+        self._writer.start()
+        self._reader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-reader")
+        self._reader_db: sqlite3.Connection | None = None
+
+        # Воркеры базу не мигрируют — это делает приёмник до их запуска
+        has_old = os.path.exists(STORAGE_FILE) or os.path.exists(_snap_path(STORAGE_FILE))
+        if is_new and shard is None and has_old:
+            self.migrate_from_json(STORAGE_FILE)
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, isolation_level=None)
+        db.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def _upgrade_schema(self):
+        """Добавляет в старую базу колонки карточки обращения и время сообщений личного чата."""
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(topics)")}
+        for name, kind in TICKET_COLUMNS.items():
+            if name not in columns:
+                self._db.execute(f"ALTER TABLE topics ADD COLUMN {name} {kind}")
+
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(chat_messages)")}
+        if "created_at" not in columns:
+            self._db.execute("ALTER TABLE chat_messages ADD COLUMN created_at REAL")
+            # Время старых записей неизвестно — считаем их отправленными сейчас
+            self._db.execute("UPDATE chat_messages SET created_at = ?", (time.time(),))
+        self._db.execute("CREATE INDEX IF NOT EXISTS chat_messages_created ON chat_messages(created_at)")
+
+    def _load_topics(self):
+        rows = self._db.execute("SELECT user_id, topic_id, last_activity FROM topics").fetchall()
+        for user_id, topic_id, last_activity in rows:
+            if not self._owns(user_id):
+                continue
+            self.user_topics[user_id] = topic_id
+            self.topic_users[topic_id] = user_id
+            if last_activity is not None:
+                self.last_activity[topic_id] = last_activity
+
+    def _owns(self, user_id: str) -> bool:
+        return self.shard is None or shard_of(user_id, self.shard[1]) == self.shard[0]
+
+    # -------- Поток записи --------
+    def _execute(self, sql: str, params: tuple = ()):
+        """Ставит запрос в очередь потока записи."""
+        self._queue.put((sql, params))
+
+    def _writer_loop(self):
+        db = self._connect()
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                break
+
+            batch = [item]
+            while len(batch) < 500:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = batch[-1] is None
+            if stop:
+                batch.pop()
+            try:
+                started = time.perf_counter()
+                try:
+                    db.execute("BEGIN")
+                    for op in batch:
+                        self._apply(db, op)
+                    db.execute("COMMIT")
+                except Exception as e:
+                    if db.in_transaction:
+                        db.execute("ROLLBACK")
+                    logging.warning(f"⚠️ Пачка не записана в {self.path}: {e}. Повтор по одному запросу")
+                    self._write_one_by_one(db, batch)
+                self.writes += 1
+                # Сколько байт записал SQLite, не видно — только время коммита
+                self._record_save(time.perf_counter() - started, None)
+            except Exception as e:
+                if db.in_transaction:
+                    db.execute("ROLLBACK")
+                logging.error(f"⚠️ Ошибка записи в {self.path}, потеряно запросов: {len(batch)}: {e}")
+                for op in batch:
+                    if isinstance(op, _Query):
+                        op.error = e
+            finally:
+                for op in batch:
+                    if isinstance(op, _Query):
+                        op.resolve()
+                for _ in range(len(batch) + stop):
+                    self._queue.task_done()
+            if stop:
+                break
+        db.close()
+
+    @staticmethod
+    def _apply(db: sqlite3.Connection, op: "tuple[str, tuple] | _Query"):
+        if isinstance(op, _Query):
+            op.run(db)
+        else:
+            db.execute(*op)
+
+    def _write_one_by_one(self, db: sqlite3.Connection, batch: list):
+        """
+        Повтор откатившейся пачки: каждый запрос в своей точке сохранения,
+        поэтому сбойный запрос откатывается один, а остальные коммитятся.
+        """
+        db.execute("BEGIN")
+        for op in batch:
+            db.execute("SAVEPOINT statement")
+            try:
+                self._apply(db, op)
+            except Exception as e:
+                db.execute("ROLLBACK TO statement")
+                if isinstance(op, _Query):
+                    op.error = e
+                else:
+                    logging.error(f"⚠️ Запрос не записан в {self.path}: {e}: {op[0]} {op[1]}")
+            db.execute("RELEASE statement")
+        db.execute("COMMIT")
+
+    def _query_after_writes(self, sql: str, params: tuple) -> asyncio.Future:
+        """Чтение в потоке записи: видит всё, что уже поставлено в очередь."""
+        query = _Query(sql, params, asyncio.get_running_loop())
+        self._queue.put(query)
+        return query.future
+
+    # -------- Поток чтения --------
+    def _read(self, sql: str, params: tuple) -> list[tuple]:
+        """Выполняется в потоке чтения: соединение sqlite3 привязано к потоку."""
+        if self._reader_db is None:
+            self._reader_db = self._connect()
+        return self._reader_db.execute(sql, params).fetchall()
+
+    async def _read_async(self, sql: str, params: tuple = ()) -> list[tuple]:
+        return await asyncio.get_running_loop().run_in_executor(self._reader, self._read, sql, params)
+
+    def _close_reader(self):
+        if self._reader_db is not None:
+            self._reader_db.close()
+            self._reader_db = None
+
+    # -------- Управление темами --------
+    def set_topic(self, user_id: str, topic_id: int):
+        old_tid = self.user_topics.get(user_id)
+        if old_tid is not None and old_tid != topic_id:
+            self.topic_users.pop(old_tid, None)
+            self.tickets.pop(old_tid, None)
+            self._activity_changed(old_tid, None)
+            self.last_activity.pop(old_tid, None)
+        now = time.time()
+        self.user_topics[user_id] = topic_id
+        self.topic_users[topic_id] = user_id
+        self.last_activity[topic_id] = now
+        self._activity_changed(topic_id, now)
+        # Карточку обычно заводят раньше темы — она пишется вместе со строкой темы
+        ticket = self.tickets.get(topic_id) or Ticket()
+        self._execute(
+            "INSERT OR REPLACE INTO topics "
+            "(user_id, topic_id, last_activity, notification_id, user_name, username, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (user_id, topic_id, now, ticket.notification_id, ticket.user_name, ticket.username, ticket.created_at),
+        )
+
+    def get_topic(self, user_id: str) -> int | None:
+        return self.user_topics.get(user_id)
+
+    def remove_topic(self, user_id: str):
+        tid = self.user_topics.pop(user_id, None)
+        if tid:
+            self.topic_users.pop(tid, None)
+            self.tickets.pop(tid, None)
+            self.last_activity.pop(tid, None)
+            self._activity_changed(tid, None)
+            self._execute("DELETE FROM topics WHERE user_id = ?", (user_id,))
+            self._execute("DELETE FROM links WHERE topic_id = ?", (tid,))
+
+    def find_user_by_topic(self, topic_id: int) -> str | None:
+        user_id = self.topic_users.get(topic_id)
+        if user_id is None and self.read_through:
+            user_id = self._owner_cache.get(topic_id)
+            if user_id is None:
+                row = self._db.execute(OWNER_QUERY, (topic_id,)).fetchone()
+                if row:
+                    # ID тем в группе не переиспользуются — владельца можно запомнить
+                    user_id = row[0]
+                    self._remember(self._owner_cache, topic_id, user_id)
+        return user_id
+
+    async def find_user_by_topic_async(self, topic_id: int) -> str | None:
+        user_id = self.topic_users.get(topic_id)
+        if user_id is None and self.read_through:
+            user_id = self._owner_cache.get(topic_id)
+            if user_id is None:
+                rows = await self._read_async(OWNER_QUERY, (topic_id,))
+                if rows:
+                    user_id = rows[0][0]
+                    self._remember(self._owner_cache, topic_id, user_id)
+        return user_id
+
+    def open_topics(self) -> dict[str, int]:
+        return self.user_topics
+
+    def all_topics(self) -> dict[str, int]:
+        if self.shard is None:
+            return self.user_topics
+        return dict(self._db.execute("SELECT user_id, topic_id FROM topics").fetchall())
+
+    async def all_topics_async(self) -> dict[str, int]:
+        if self.shard is None:
+            return self.user_topics
+        return dict(await self._read_async("SELECT user_id, topic_id FROM topics"))
+
+    # -------- Активность тем --------
+    def update_activity(self, topic_id: int):
+        now = time.time()
+        self.last_activity[topic_id] = now
+        self._activity_changed(topic_id, now)
+        self._execute("UPDATE topics SET last_activity = ? WHERE topic_id = ?", (now, topic_id))
+
+    def get_last_activity(self, topic_id: int) -> float | None:
+        return self.last_activity.get(topic_id)
+
+    # -------- Связи сообщений --------
+    def link_messages(self, group_msg_id: int, user_msg_id: int, topic_id: int | None = None):
+        self._remember(self._g2u_cache, group_msg_id, user_msg_id)
+        self._remember(self._u2g_cache, user_msg_id, group_msg_id)
+        self._execute(
+            "INSERT OR REPLACE INTO links (group_msg_id, user_msg_id, topic_id, created_at) "
+            "VALUES (?, ?, ?, ?)",
+            (group_msg_id, user_msg_id, topic_id, time.time()),
+        )
+
+    def get_user_msg_by_group_msg(self, group_msg_id: int) -> int | None:
+        cached = self._g2u_cache.get(group_msg_id)
+        if cached is not None:
+            return cached
+        row = self._db.execute(G2U_QUERY, (group_msg_id,)).fetchone()
+        return row[0] if row else None
+
+    async def get_user_msg_by_group_msg_async(self, group_msg_id: int) -> int | None:
+        cached = self._g2u_cache.get(group_msg_id)
+        if cached is not None:
+            return cached
+        rows = await self._read_async(G2U_QUERY, (group_msg_id,))
+        return rows[0][0] if rows else None
+
+    def get_group_msg_by_user_msg(self, user_msg_id: int) -> int | None:
+        cached = self._u2g_cache.get(user_msg_id)
+        if cached is not None:
+            return cached
+        row = self._db.execute(U2G_QUERY, (user_msg_id,)).fetchone()
+        return row[0] if row else None
+
+    async def get_group_msg_by_user_msg_async(self, user_msg_id: int) -> int | None:
+        cached = self._u2g_cache.get(user_msg_id)
+        if cached is not None:
+            return cached
+        rows = await self._read_async(U2G_QUERY, (user_msg_id,))
+        return rows[0][0] if rows else None
+
+    # -------- Карточки обращений --------
+    def set_ticket(self, topic_id: int, ticket: Ticket):
+        self.tickets[topic_id] = ticket
+        self._execute(
+            "UPDATE topics SET user_name = ?, username = ?, created_at = ?, notification_id = ? "
+            "WHERE topic_id = ?",
+            (ticket.user_name, ticket.username, ticket.created_at, ticket.notification_id, topic_id),
+        )
+
+    def get_ticket(self, topic_id: int) -> Ticket | None:
+        ticket = self.tickets.get(topic_id)
+        if ticket is None and topic_id in self.topic_users:
+            row = self._db.execute(TICKET_QUERY, (topic_id,)).fetchone()
+            if row:
+                ticket = self.tickets[topic_id] = _ticket_from_row(row)
+        return ticket
+
+    async def get_ticket_async(self, topic_id: int) -> Ticket | None:
+        ticket = self.tickets.get(topic_id)
+        if ticket is None and topic_id in self.topic_users:
+            rows = await self._read_async(TICKET_QUERY, (topic_id,))
+            # За время запроса карточку могли записать, а тему — закрыть
+            ticket = self.tickets.get(topic_id)
+            if ticket is None and rows and topic_id in self.topic_users:
+                ticket = self.tickets[topic_id] = _ticket_from_row(rows[0])
+        return ticket
+
+    def link_notification(self, group_msg_id: int, topic_id: int):
+        ticket = self.tickets.get(topic_id)
+        if ticket is None and topic_id not in self.topic_users:
+            # Темы ещё нет в базе — карточка запишется вместе с ней
+            return super().link_notification(group_msg_id, topic_id)
+        # Меняется одна колонка — карточку из базы читать незачем
+        if ticket is not None:
+            ticket.notification_id = group_msg_id
+        self._execute("UPDATE topics SET notification_id = ? WHERE topic_id = ?", (group_msg_id, topic_id))
+
+    # -------- История личного чата --------
+    def track_chat_message(self, user_id: str, message_id: int):
+        self._execute(
+            "INSERT OR IGNORE INTO chat_messages (user_id, message_id, created_at) VALUES (?, ?, ?)",
+            (user_id, message_id, time.time()),
+        )
+        self._execute(
+            "DELETE FROM chat_messages WHERE user_id = ? AND message_id <= ("
+            "SELECT message_id FROM chat_messages WHERE user_id = ? "
+            "ORDER BY message_id DESC LIMIT 1 OFFSET ?)",
+            (user_id, user_id, CHAT_HISTORY_LIMIT),
+        )
+
+    def pop_chat_messages(self, user_id: str) -> list[int]:
+        # Вне event loop — дожидаемся записи очереди
+        self.flush()
+        rows = self._db.execute(CHAT_QUERY, (user_id,)).fetchall()
+        self._execute("DELETE FROM chat_messages WHERE user_id = ?", (user_id,))
+        return [row[0] for row in rows]
+
+    async def pop_chat_messages_async(self, user_id: str) -> list[int]:
+        # Чтение в потоке записи идёт после уже поставленных track_chat_message,
+        # удаление — сразу за ним, поэтому новые сообщения не теряются
+        rows = self._query_after_writes(CHAT_QUERY, (user_id,))
+        self._execute("DELETE FROM chat_messages WHERE user_id = ?", (user_id,))
+        return [row[0] for row in await rows]
+
+    @staticmethod
+    def _remember(cache: OrderedDict, key: int, value: int):
+        cache[key] = value
+        cache.move_to_end(key)
+        if len(cache) > LINK_CACHE_SIZE:
+            cache.popitem(last=False)
+
+    def sizes(self) -> dict[str, int]:
+        sizes = {
+            "topics": len(self.user_topics),
+            "tickets": len(self.tickets),
+            "g2u_cache": len(self._g2u_cache),
+            "u2g_cache": len(self._u2g_cache),
+        }
+        # Связи живут на диске — вместо числа строк размер файла базы
+        try:
+            sizes["db_bytes"] = os.path.getsize(self.path)
+        except OSError:
+            pass
+        return sizes
+
+    # -------- Сохранение --------
+    def save(self):
+        # Записи и так коммитятся фоновым потоком сразу после изменения
+        self.save_requests += 1
+
+    def flush(self):
+        """Дожидается, пока поток записи закоммитит всё из очереди."""
+        self._queue.join()
+
+    async def flush_async(self):
+        await asyncio.to_thread(self.flush)
+
+    def cleanup_old_data(self):
+        now = time.time()
+        self._execute("DELETE FROM links WHERE created_at < ?", (now - self.retention,))
+        self._execute("DELETE FROM chat_messages WHERE created_at < ?", (now - CHAT_HISTORY_TTL,))
+
+    def close(self):
+        self._queue.put(None)
+        self._writer.join()
+        self._reader.submit(self._close_reader).result()
+        self._reader.shutdown()
+        self._db.close()
+
+    # -------- Миграция --------
+    def migrate_from_json(self, json_path: str):
+        """Переносит данные MemoryStorage (storage.snap или storage.json) в базу."""
+        # Только чтение: снимок есть — берём его, иначе JSON без конвертации в снимок
+        snapshot_format = "binary" if os.path.exists(_snap_path(json_path)) else "json"
+        old = MemoryStorage(path=json_path, flush_interval=0, snapshot_format=snapshot_format)
+        now = time.time()
+
+        for user_id, topic_id in old.user_topics.items():
+            self.user_topics[user_id] = topic_id
+            self.topic_users[topic_id] = user_id
+            last = old.get_last_activity(topic_id) or now
+            self.last_activity[topic_id] = last
+            ticket = old.get_ticket(topic_id) or Ticket()
+            self._execute(
+                "INSERT OR REPLACE INTO topics "
+                "(user_id, topic_id, last_activity, notification_id, user_name, username, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (user_id, topic_id, last, ticket.notification_id, ticket.user_name, ticket.username, ticket.created_at),
+            )
+
+        links = 0
+        for gid, uid, tid, created_at in old.links.records():
+            links += 1
+            self._execute(
+                "INSERT OR REPLACE INTO links (group_msg_id, user_msg_id, topic_id, created_at) "
+                "VALUES (?, ?, ?, ?)",
+                (gid, uid, tid, created_at),
+            )
+
+        for user_id, history in old.chat_messages.items():
+            for message_id, sent_at in history:
+                self._execute(
+                    "INSERT OR IGNORE INTO chat_messages (user_id, message_id, created_at) VALUES (?, ?, ?)",
+                    (user_id, message_id, sent_at),
+                )
+
+        self.flush()
+        logging.info(
+            f"📦 Перенесено из {json_path}: тем {len(old.user_topics)}, связей {links}"
+        )
+
@@ -1,27 +1,357 @@
-import json
+import asyncio
+import threading
 import time
 import os
 import logging
-from bot.config import STORAGE_FILE, INACTIVITY_DAYS
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Callable
+from bot.config import (
+    STORAGE_FILE,
+    STORAGE_FORMAT,
+    STORAGE_BACKEND,
+    LINK_RETENTION_DAYS,
+    STORAGE_FLUSH_INTERVAL,
+    CHAT_HISTORY_LIMIT,
+    BOT_MODE,
+    SHARD_INDEX,
+    SHARD_COUNT,
+)
+from bot.utils import snapshot
+from bot.utils.metrics import STORAGE_SAVE_SECONDS, STORAGE_SAVE_BYTES
+from bot.utils.linkmap import MessageLinks
+
+# Как часто удалять связи сообщений старше срока хранения, сек
+LINK_SWEEP_INTERVAL = 600
+
+# Telegram даёт боту удалять сообщения личного чата не старше 48 часов —
+# более старые ID в истории бесполезны
+CHAT_HISTORY_TTL = 48 * 60 * 60
+
+
+def atomic_write(path: str, payload: bytes):
+    """
+    Пишет файл через временный файл, fsync и атомарное переименование.
+    Предыдущая версия остаётся в path + ".bak" (жёсткая ссылка), поэтому
+    основной файл не пропадает ни на одном шаге.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+
+    if os.path.exists(path):
+        try:
+            if os.path.exists(path + ".bak"):
+                os.remove(path + ".bak")
+            os.link(path, path + ".bak")
+        except OSError:
+            pass
+    os.replace(tmp_path, path)
+
+    try:
+        dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+    except OSError:
+        pass
 
 
-class MemoryStorage:
+class Ticket:
     """
-    Простое persistent-хранилище для данных бота поддержки.
+    Карточка обращения: кто открыл тему, когда (unix-время) и какое
+    сообщение-уведомление о ней висит в общем чате группы.
+    На диске хранится компактным списком (to_list / from_list).
+    """
+
+    __slots__ = ("user_name", "username", "created_at", "notification_id")
+
+    def __init__(
+        self,
+        user_name: str = "",
+        username: str = "",
+        created_at: float = 0.0,
+        notification_id: int | None = None,
+    ):
+        self.user_name = user_name
+        self.username = username
+        self.created_at = created_at
+        self.notification_id = notification_id
+
+    def to_list(self) -> list:
+        return [self.user_name, self.username, self.created_at, self.notification_id]
+
+    @classmethod
+    def from_list(cls, data: list) -> "Ticket":
+        return cls(*data)
+
+
+class BaseStorage(ABC):
     """
+    Интерфейс хранилища, которым пользуются хендлеры.
+    """
+
+    flush_interval: float = 0
+    save_requests: int = 0  # вызовы save()
+    writes: int = 0  # реальные записи на диск
+    last_save_duration: float = 0.0  # секунд на последнюю запись
+    last_save_bytes: int = 0
+    bytes_written: int = 0
 
     def __init__(self):
+        self._activity_listeners: list[Callable[[int, float | None], None]] = []
+        # Фоновые задачи хранилища: ссылки держим, иначе их может собрать GC
+        self._tasks: set[asyncio.Task] = set()
+
+    # -------- Управление темами --------
+    @abstractmethod
+    def set_topic(self, user_id: str, topic_id: int): ...
+
+    @abstractmethod
+    def get_topic(self, user_id: str) -> int | None: ...
+
+    @abstractmethod
+    def remove_topic(self, user_id: str): ...
+
+    @abstractmethod
+    def find_user_by_topic(self, topic_id: int) -> str | None: ...
+
+    @abstractmethod
+    def open_topics(self) -> dict[str, int]:
+        """Открытые темы: user_id -> topic_id."""
+
+    def all_topics(self) -> dict[str, int]:
+        """Открытые темы всех воркеров (без шардирования — то же, что open_topics)."""
+        return self.open_topics()
+
+    # -------- Активность тем --------
+    @abstractmethod
+    def update_activity(self, topic_id: int): ...
+
+    @abstractmethod
+    def get_last_activity(self, topic_id: int) -> float | None: ...
+
+    def add_activity_listener(self, callback: Callable[[int, float | None], None]):
+        """
+        Подписка на изменение активности темы: callback(topic_id, last_activity).
+        При удалении темы last_activity = None.
+        """
+        self._activity_listeners.append(callback)
+
+    def _activity_changed(self, topic_id: int, last_activity: float | None):
+        for callback in self._activity_listeners:
+            callback(topic_id, last_activity)
+
+    # -------- Связи сообщений --------
+    @abstractmethod
+    def link_messages(self, group_msg_id: int, user_msg_id: int, topic_id: int | None = None): ...
+
+    def link_group_message(self, group_msg_id: int, user_msg_id: int, topic_id: int | None = None):
+        self.link_messages(group_msg_id, user_msg_id, topic_id)
+
+    def link_user_message(self, user_msg_id: int, group_msg_id: int, topic_id: int | None = None):
+        self.link_messages(group_msg_id, user_msg_id, topic_id)
+
+    # -------- Карточки обращений --------
+    @abstractmethod
+    def set_ticket(self, topic_id: int, ticket: Ticket):
+        """Сохраняет карточку обращения (удаляется вместе с темой)."""
+
+    @abstractmethod
+    def get_ticket(self, topic_id: int) -> Ticket | None: ...
+
+    def link_notification(self, group_msg_id: int, topic_id: int):
+        """Запоминает сообщение-уведомление о теме в общем чате группы."""
+        ticket = self.get_ticket(topic_id) or Ticket()
+        ticket.notification_id = group_msg_id
+        self.set_ticket(topic_id, ticket)
+
+    def get_notification(self, topic_id: int) -> int | None:
+        ticket = self.get_ticket(topic_id)
+        return ticket.notification_id if ticket else None
+
+    @abstractmethod
+    def get_user_msg_by_group_msg(self, group_msg_id: int) -> int | None: ...
+
+    @abstractmethod
+    def get_group_msg_by_user_msg(self, user_msg_id: int) -> int | None: ...
+
+    # -------- История личного чата --------
+    @abstractmethod
+    def track_chat_message(self, user_id: str, message_id: int):
+        """
+        Запоминает сообщение в личном чате (последние CHAT_HISTORY_LIMIT,
+        не старше CHAT_HISTORY_TTL — более старые удаляет cleanup_old_data).
+        """
+
+    @abstractmethod
+    def pop_chat_messages(self, user_id: str) -> list[int]:
+        """Возвращает и забывает все запомненные сообщения личного чата."""
+
+    # -------- Чтение из event loop --------
+    # Хендлеры читают через эти методы. Хранилища в памяти отвечают сразу,
+    # SQLite при промахе по памяти идёт в базу в отдельном потоке.
+    async def find_user_by_topic_async(self, topic_id: int) -> str | None:
+        return self.find_user_by_topic(topic_id)
+
+    async def all_topics_async(self) -> dict[str, int]:
+        return self.all_topics()
+
+    async def get_ticket_async(self, topic_id: int) -> Ticket | None:
+        return self.get_ticket(topic_id)
+
+    async def get_user_msg_by_group_msg_async(self, group_msg_id: int) -> int | None:
+        return self.get_user_msg_by_group_msg(group_msg_id)
+
+    async def get_group_msg_by_user_msg_async(self, user_msg_id: int) -> int | None:
+        return self.get_group_msg_by_user_msg(user_msg_id)
+
+    async def pop_chat_messages_async(self, user_id: str) -> list[int]:
+        return self.pop_chat_messages(user_id)
+
+    # -------- Сохранение --------
+    @property
+    def writes_avoided(self) -> int:
+        """Сколько вызовов save() было объединено с другими записями."""
+        return max(0, self.save_requests - self.writes)
+
+    @abstractmethod
+    def save(self):
+        """Запрашивает сохранение: сразу или при следующем сбросе на диск."""
+
+    @abstractmethod
+    def flush(self):
+        """Пишет накопленные изменения на диск."""
+
+    async def flush_async(self):
+        """То же, что flush(), для вызова из event loop."""
+        self.flush()
+
+    def start(self):
+        """Запускает фоновые задачи: сброс на диск (если он отложенный) и очистку связей."""
+        if self.flush_interval > 0:
+            self._track(asyncio.create_task(self.run_flusher()))
+        self._track(asyncio.create_task(self.run_sweeper()))
+
+    def _track(self, task: asyncio.Task):
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def run_flusher(self):
+        """Фоновый сброс изменений на диск раз в flush_interval секунд."""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush_async()
+
+    @abstractmethod
+    def cleanup_old_data(self):
+        """Удаляет связи сообщений старше LINK_RETENTION_DAYS."""
+
+    async def run_sweeper(self, interval: float = LINK_SWEEP_INTERVAL):
+        """Периодическая очистка устаревших связей во время работы."""
+        while True:
+            await asyncio.sleep(interval)
+            self.cleanup_old_data()
+
+    def close(self):
+        """Сохраняет всё и освобождает ресурсы при остановке бота."""
+        self.flush()
+
+    async def close_async(self):
+        """
+        То же, что close(), для вызова из event loop: останавливает фоновые
+        задачи, дописывает изменения и только потом закрывает хранилище.
+        """
+        await self._stop_tasks()
+        await self.flush_async()
+        self.close()
+
+    async def _stop_tasks(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _record_save(self, duration: float, size: int | None):
+        """Учитывает стоимость одной записи на диск (и в метриках)."""
+        self.last_save_duration = duration
+        STORAGE_SAVE_SECONDS.observe(duration)
+        if size is not None:
+            self.last_save_bytes = size
+            self.bytes_written += size
+            STORAGE_SAVE_BYTES.observe(size)
+
+    def sizes(self) -> dict[str, int]:
+        """Размеры структур хранилища для метрик."""
+        return {"topics": len(self.open_topics())}
+
+
+class MemoryStorage(BaseStorage):
+    """
+    Простое persistent-хранилище для данных бота поддержки.
+
+    При flush_interval > 0 работает в режиме отложенной записи: save() только
+    помечает состояние изменённым, а run_flusher() пишет файл не чаще одного
+    раза за интервал.
+
+    При STORAGE_FORMAT=binary снимок пишется рядом с path в бинарном
+    формате (storage.snap, см. bot.utils.snapshot) и читается через mmap.
+    JSON-файл path тогда служит только для импорта: если снимка ещё нет,
+    данные берутся из него и сразу переписываются в бинарный снимок.
+    """
+
+    def __init__(
+        self,
+        path: str = STORAGE_FILE,
+        flush_interval: float = STORAGE_FLUSH_INTERVAL,
+        retention_days: int = LINK_RETENTION_DAYS,
+        snapshot_format: str = STORAGE_FORMAT,
+    ):
+        super().__init__()
+        self.path = path
+        self.binary = snapshot_format == "binary"
+        self.snapshot_path = os.path.splitext(path)[0] + ".snap" if self.binary else path
+        self.flush_interval = flush_interval
         self.user_topics: dict[str, int] = {}
-        self.g2u: dict[int, int] = {}  # group message -> user message
-        self.u2g: dict[int, int] = {}  # user message -> group message
+        # Связи group message <-> user message: общий индекс, часовые корзины — для истечения срока
+        self.links = MessageLinks(retention_days * 24 * 60 * 60)
         self.last_activity: dict[int, float] = {}
+        # Обратные индексы для O(1) поиска по теме
+        self.topic_users: dict[int, str] = {}  # topic -> user
+        # topic -> карточка; после загрузки лежит сырым списком до первого обращения
+        self.tickets: dict[int, Ticket | list] = {}
+        # user -> (сообщение личного чата, время отправки) от старых к новым
+        self.chat_messages: dict[str, deque[tuple[int, int]]] = {}
         self.loaded = False
+        # Отложенная запись
+        self.dirty = False
+        self.save_requests = 0  # вызовы save()
+        self.writes = 0  # реальные записи на диск
+        self._write_lock = asyncio.Lock()
+        # Снимки нумеруются: файл пишет один поток за раз, и более старый
+        # снимок не заменяет уже записанный более новый
+        self._file_lock = threading.Lock()
+        self._generation = 0
+        self._written_generation = 0
+        # Стоимость записи
+        self.last_save_duration = 0.0
+        self.last_save_bytes = 0
+        self.bytes_written = 0
         self.load()
 
     # -------- Управление темами --------
     def set_topic(self, user_id: str, topic_id: int):
+        old_tid = self.user_topics.get(user_id)
+        if old_tid is not None and old_tid != topic_id:
+            self.topic_users.pop(old_tid, None)
+            self.tickets.pop(old_tid, None)
+            self._activity_changed(old_tid, None)
         self.user_topics[user_id] = topic_id
+        self.topic_users[topic_id] = user_id
         self.update_activity(topic_id)
+        self.dirty = True
 
     def get_topic(self, user_id: str) -> int | None:
         return self.user_topics.get(user_id)
@@ -29,153 +359,304 @@ class MemoryStorage:
     def remove_topic(self, user_id: str):
         tid = self.user_topics.pop(user_id, None)
         if tid:
+            self.dirty = True
+            self.topic_users.pop(tid, None)
+            self.tickets.pop(tid, None)
             self.last_activity.pop(tid, None)
-            self._cleanup_message_links(tid)
+            self.links.pop_topic(tid)
+            self._activity_changed(tid, None)
 
     def find_user_by_topic(self, topic_id: int) -> str | None:
-        for uid, tid in self.user_topics.items():
-            if tid == topic_id:
-                return uid
-        return None
+        return self.topic_users.get(topic_id)
+
+    def open_topics(self) -> dict[str, int]:
+        return self.user_topics
 
     # -------- Активность тем --------
     def update_activity(self, topic_id: int):
-        self.last_activity[topic_id] = time.time()
+        now = time.time()
+        self.last_activity[topic_id] = now
+        self.dirty = True
+        self._activity_changed(topic_id, now)
 
     def get_last_activity(self, topic_id: int) -> float | None:
         return self.last_activity.get(topic_id)
 
     # -------- Связи сообщений --------
-    def link_messages(self, group_msg_id: int, user_msg_id: int):
-        self.g2u[group_msg_id] = user_msg_id
-        self.u2g[user_msg_id] = group_msg_id
+    def link_messages(self, group_msg_id: int, user_msg_id: int, topic_id: int | None = None):
+        self._add_link(group_msg_id, user_msg_id, topic_id, time.time())
 
-    def link_group_message(self, group_msg_id: int, user_msg_id: int):
-        self.link_messages(group_msg_id, user_msg_id)
-
-    def link_user_message(self, user_msg_id: int, group_msg_id: int):
-        self.link_messages(group_msg_id, user_msg_id)
+    def _add_link(self, group_msg_id: int, user_msg_id: int, topic_id: int | None, created_at: float):
+        self.links.add(group_msg_id, user_msg_id, topic_id, created_at)
+        self.dirty = True
 
     def get_user_msg_by_group_msg(self, group_msg_id: int) -> int | None:
-        return self.g2u.get(group_msg_id)
+        return self.links.get_user(group_msg_id)
 
     def get_group_msg_by_user_msg(self, user_msg_id: int) -> int | None:
-        return self.u2g.get(user_msg_id)
+        return self.links.get_group(user_msg_id)
+
+    # -------- Карточки обращений --------
+    def set_ticket(self, topic_id: int, ticket: Ticket):
+        self.tickets[topic_id] = ticket
+        self.dirty = True
+
+    def get_ticket(self, topic_id: int) -> Ticket | None:
+        ticket = self.tickets.get(topic_id)
+        if isinstance(ticket, list):
+            ticket = self.tickets[topic_id] = Ticket.from_list(ticket)
+        return ticket
+
+    # -------- История личного чата --------
+    def track_chat_message(self, user_id: str, message_id: int):
+        self._track_chat_message(user_id, message_id, time.time())
+
+    def _track_chat_message(self, user_id: str, message_id: int, sent_at: float):
+        history = self.chat_messages.get(user_id)
+        if history is None:
+            history = self.chat_messages[user_id] = deque(maxlen=CHAT_HISTORY_LIMIT)
+        history.append((message_id, int(sent_at)))
+        self.dirty = True
+
+    def pop_chat_messages(self, user_id: str) -> list[int]:
+        history = self.chat_messages.pop(user_id, None)
+        if not history:
+            return []
+        self.dirty = True
+        return [message_id for message_id, _ in history]
+
+    def _expire_chat_messages(self, now: float) -> int:
+        """Забывает сообщения старше CHAT_HISTORY_TTL и пустые истории; возвращает число сообщений."""
+        cutoff = now - CHAT_HISTORY_TTL
+        expired = 0
+        for user_id in list(self.chat_messages):
+            history = self.chat_messages[user_id]
+            while history and history[0][1] < cutoff:
+                history.popleft()
+                expired += 1
+            if not history:
+                del self.chat_messages[user_id]
+        return expired
+
+    # -------- Индексы --------
+    def _rebuild_indexes(self):
+        """Перестраивает обратные индексы после загрузки."""
+        self.topic_users = {tid: uid for uid, tid in self.user_topics.items()}
+        self.tickets = {
+            int(tid): ticket for tid, ticket in self.tickets.items()
+            if int(tid) in self.topic_users
+        }
+
+    def _apply_legacy_links(self, data: dict):
+        """
+        Старый формат: плоские g2u/u2g без времени создания. Возраст таких
+        связей неизвестен — они считаются созданными при загрузке.
+        """
+        g2u = {int(gid): int(uid) for gid, uid in data.get("g2u", {}).items()}
+        u2g = {int(uid): int(gid) for uid, gid in data.get("u2g", {}).items()}
+
+        # Ещё более старый формат: уведомление хранилось в g2u как group_msg -> topic_id
+        for gid, value in list(g2u.items()):
+            if value not in self.topic_users or self.get_notification(value):
+                continue
+            if u2g.get(value) != gid:
+                continue
+            self.tickets[value] = Ticket(notification_id=gid)
+            del g2u[gid]
+            del u2g[value]
+
+        owners = {
+            gid: int(tid) for tid, gids in data.get("topic_links", {}).items() for gid in gids
+        }
+        now = time.time()
+        for gid, uid in g2u.items():
+            self.links.add(gid, uid, owners.get(gid), now)
+        # u2g может расходиться с g2u (одно сообщение переслано дважды)
+        for uid, gid in u2g.items():
+            if self.links.get_user(gid) == uid:
+                self.links.u2g[uid] = gid
 
     # -------- Очистка старых данных --------
-    def _cleanup_message_links(self, topic_id: int):
-        """Очищает связи сообщений для указанной темы."""
-        # Находим все сообщения, связанные с этой темой
-        messages_to_remove = []
-        for group_msg_id, user_msg_id in self.g2u.items():
-            # Если сообщение принадлежит удаляемой теме, добавляем в список на удаление
-            if self._is_message_from_topic(group_msg_id, topic_id):
-                messages_to_remove.append((group_msg_id, user_msg_id))
-
-        # Удаляем найденные связи
-        for group_msg_id, user_msg_id in messages_to_remove:
-            self.g2u.pop(group_msg_id, None)
-            self.u2g.pop(user_msg_id, None)
-
-    def _is_message_from_topic(self, message_id: int, topic_id: int) -> bool:
-        """Проверяет, принадлежит ли сообщение указанной теме."""
-        # Простая эвристика: если message_id находится в диапазоне topic_id ± 1000
-        return abs(message_id - topic_id) < 1000
-
     def cleanup_old_data(self):
-        """Очищает устаревшие данные при загрузке."""
-        current_time = time.time()
-        max_age = INACTIVITY_DAYS * 24 * 60 * 60  # Используем настройку из config
-
-        # Очищаем last_activity от очень старых записей (более 7 дней)
-        week_ago = current_time - (7 * 24 * 60 * 60)
-        self.last_activity = {tid: ts for tid, ts in self.last_activity.items() 
-                             if ts > week_ago or tid in self.user_topics.values()}
-
-        # Очищаем связи сообщений от старых тем (более 3 дней)
-        three_days_ago = current_time - max_age
-        
-        # Создаем новые словари только с актуальными данными
-        new_g2u = {}
-        new_u2g = {}
-        
-        for gid, uid in self.g2u.items():
-            if self._get_message_timestamp(gid) > three_days_ago:
-                new_g2u[gid] = uid
-                
-        for uid, gid in self.u2g.items():
-            if self._get_message_timestamp(uid) > three_days_ago:
-                new_u2g[uid] = gid
-
-        # Логируем результат очистки
-        removed_g2u = len(self.g2u) - len(new_g2u)
-        removed_u2g = len(self.u2g) - len(new_u2g)
-        
-        if removed_g2u > 0 or removed_u2g > 0:
-            logging.info(f"🧹 Очистка storage: удалено {removed_g2u} g2u и {removed_u2g} u2g записей")
-
-        # Заменяем старые данные новыми
-        self.g2u = new_g2u
-        self.u2g = new_u2g
-
-    def _get_message_timestamp(self, message_id: int) -> float:
-        """Примерная временная метка сообщения на основе его ID."""
-        try:
-            # Базовое время (можно настроить под вашу дату начала проекта)
-            base_time = 1700000000  # Пример: 14 ноября 2023
-            return base_time + (int(message_id) / 1000)  # Преобразуем в int для безопасности
-        except (ValueError, TypeError):
-            # Если message_id некорректный, возвращаем текущее время
-            return time.time()
+        """Удаляет корзины связей старше срока хранения и устаревшую историю личных чатов."""
+        # Активность нужна только открытым темам
+        stale = [tid for tid in self.last_activity if tid not in self.topic_users]
+        for tid in stale:
+            del self.last_activity[tid]
+
+        now = time.time()
+        buckets, links = self.links.expire(now)
+        chat_expired = self._expire_chat_messages(now)
+        if buckets or stale or chat_expired:
+            self.dirty = True
+        if chat_expired:
+            logging.info(f"🧹 Очистка storage: забыто сообщений личных чатов старше 48 ч: {chat_expired}")
+        if links:
+            logging.info(f"🧹 Очистка storage: удалено связей {links} (часовых корзин: {buckets})")
+
+    def sizes(self) -> dict[str, int]:
+        return {
+            "topics": len(self.user_topics),
+            "tickets": len(self.tickets),
+            "g2u": len(self.links.g2u),
+            "u2g": len(self.links.u2g),
+            "link_buckets": len(self.links.buckets),
+            "chat_histories": len(self.chat_messages),
+        }
 
     # -------- Сохранение / загрузка --------
     def save(self):
-        """Сохраняет данные в JSON-файл с резервной копией."""
+        self.save_requests += 1
+        self.dirty = True
+        if self.flush_interval > 0:
+            return
         try:
-            data = {
-                "user_topics": self.user_topics,
-                "g2u": self.g2u,
-                "u2g": self.u2g,
-                "last_activity": self.last_activity,
-            }
-
-            # Создание резервной копии
-            if os.path.exists(STORAGE_FILE):
-                os.replace(STORAGE_FILE, STORAGE_FILE + ".bak")
-
-            with open(STORAGE_FILE, "w", encoding="utf-8") as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._write()
+            return
+        self._track(loop.create_task(self.flush_async()))
+
+    def flush(self):
+        if self.dirty:
+            self._write()
+
+    async def flush_async(self) -> bool:
+        """Пишет изменения в фоновом потоке, не блокируя event loop."""
+        if not self.dirty:
+            return False
+        async with self._write_lock:
+            if not self.dirty:
+                return False
+            generation, data = self._take_snapshot()
+            self.dirty = False
+            self.writes += 1
+            try:
+                await asyncio.to_thread(self._write_file, data, generation)
+                return True
+            except Exception as e:
+                self.dirty = True
+                logging.error(f"⚠️ Ошибка сохранения {self.snapshot_path}: {e}")
+                return False
+
+    async def _stop_tasks(self):
+        # Отмена не прерывает запись в потоке — сначала дожидаемся её под блокировкой
+        async with self._write_lock:
+            for task in self._tasks:
+                task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _take_snapshot(self) -> tuple[int, dict]:
+        self._generation += 1
+        return self._generation, self._snapshot_data()
+
+    def _snapshot_data(self) -> dict:
+        """Согласованная копия состояния для записи в файл."""
+        return {
+            "user_topics": dict(self.user_topics),
+            "links": self.links.copy(),
+            "last_activity": dict(self.last_activity),
+            "tickets": {
+                tid: ticket.to_list() if isinstance(ticket, Ticket) else ticket
+                for tid, ticket in self.tickets.items()
+            },
+            "chat_messages": {uid: list(history) for uid, history in self.chat_messages.items()},
+        }
+
+    def _apply_data(self, data: dict):
+        """Восстанавливает состояние из прочитанного файла."""
+        self.user_topics = data.get("user_topics", {})
+        # Ключи JSON-объектов — строки, а ищем по int
+        self.last_activity = {int(tid): ts for tid, ts in data.get("last_activity", {}).items()}
+        self.tickets = dict(data.get("tickets", {}))
+        # Старый формат: только ID уведомлений, без карточек
+        for tid, gid in data.get("topic_notifications", {}).items():
+            self.tickets.setdefault(tid, ["", "", 0.0, int(gid)])
+        # Старый формат: только ID, без времени — считаем их отправленными при загрузке
+        loaded_at = int(time.time())
+        self.chat_messages = {
+            uid: deque(
+                (tuple(item) if isinstance(item, list) else (item, loaded_at) for item in history),
+                maxlen=CHAT_HISTORY_LIMIT,
+            )
+            for uid, history in data.get("chat_messages", {}).items()
+        }
+        self._rebuild_indexes()
+
+        self.links = MessageLinks(self.links.retention, self.links.width)
+        self.links.restore(data.get("links", []))
+        if "g2u" in data:
+            self._apply_legacy_links(data)
+
+    def _write(self) -> bool:
+        """Синхронно сохраняет данные (запуск, остановка бота)."""
+        self.dirty = False
+        self.writes += 1
+        try:
+            generation, data = self._take_snapshot()
+            self._write_file(data, generation)
+            return True
         except Exception as e:
-            logging.error(f"⚠️ Ошибка сохранения {STORAGE_FILE}: {e}")
+            self.dirty = True
+            logging.error(f"⚠️ Ошибка сохранения {self.snapshot_path}: {e}")
+            return False
+
+    def _write_file(self, data: dict, generation: int):
+        """Сериализует снимок и атомарно заменяет файл хранилища."""
+        with self._file_lock:
+            if generation < self._written_generation:
+                # Пока ждали, записан более новый снимок
+                return
+            started = time.perf_counter()
+            payload = snapshot.encode(data) if self.binary else snapshot.encode_json(data)
+            atomic_write(self.snapshot_path, payload)
+            self._written_generation = generation
+            self._record_save(time.perf_counter() - started, len(payload))
 
     def load(self):
-        """Загружает данные из JSON-файла."""
-        if not os.path.exists(STORAGE_FILE):
-            logging.warning(f"📁 Файл хранилища не найден — будет создан: {STORAGE_FILE}")
-            self.save()
+        """
+        Загружает снимок (бинарный или JSON). Если рядом лежат оба файла
+        (STORAGE_FORMAT меняли), берётся более новый: после смены формата
+        туда и обратно старый файл другого формата не подменяет свежие данные.
+        """
+        candidates = {self.snapshot_path, self.path, os.path.splitext(self.path)[0] + ".snap"}
+        existing = [p for p in candidates if os.path.exists(p)]
+        if not existing:
+            logging.warning(f"📁 Файл хранилища не найден — будет создан: {self.snapshot_path}")
+            self._write()
             return
+        # При равном времени — файл текущего формата
+        path = max(existing, key=lambda p: (os.path.getmtime(p), p == self.snapshot_path))
+        if path != self.snapshot_path and os.path.exists(self.snapshot_path):
+            logging.warning(f"⚠️ {path} новее {self.snapshot_path} — загружаются данные из него")
 
         try:
-            with open(STORAGE_FILE, "r", encoding="utf-8") as f:
-                raw = f.read().strip()
-                if not raw:
-                    raise ValueError("Файл пуст")
-
-                data = json.loads(raw)
-
-            self.user_topics = data.get("user_topics", {})
-            self.g2u = data.get("g2u", {})
-            self.u2g = data.get("u2g", {})
-            self.last_activity = data.get("last_activity", {})
+            self._apply_data(snapshot.read(path))
             self.loaded = True
 
-            # Очищаем старые данные при загрузке
+            # Корзины, истёкшие, пока бот был остановлен
             self.cleanup_old_data()
 
+            if path != self.snapshot_path:
+                logging.info(f"📦 {path} импортирован в {self.snapshot_path}")
+                self._write()
+
         except Exception as e:
-            logging.error(f"⚠️ Ошибка загрузки {STORAGE_FILE}: {e}")
-            self.save()
+            logging.error(f"⚠️ Ошибка загрузки {path}: {e}")
+            self._write()
+
+
+def create_storage() -> BaseStorage:
+    """Создаёт хранилище выбранного в конфиге типа (STORAGE_BACKEND)."""
+    if STORAGE_BACKEND == "journal":
+        from bot.utils.journal import JournaledStorage
+        return JournaledStorage()
+    if STORAGE_BACKEND == "sqlite":
+        from bot.utils.sqlite_storage import SQLiteStorage
+        if BOT_MODE == "worker":
+            return SQLiteStorage(shard=(SHARD_INDEX, SHARD_COUNT))
+        return SQLiteStorage(read_through=BOT_MODE == "sharded")
+    return MemoryStorage()
 
 
-storage = MemoryStorage()
\ No newline at end of file
+storage = create_storage()
\ No newline at end of file
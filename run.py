@@ -5,24 +5,27 @@ sys.dont_write_bytecode = True
 
 import asyncio
 import logging
+from bot.config import LOG_LEVEL, LOG_FORMAT, LOG_SAMPLE
+from bot.utils.logs import setup_logging
 from bot.main import main
 
-# Базовая настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s | %(levelname)-8s | %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S"
-)
+# Логи пишет отдельный поток через очередь — event loop не ждёт stdout
+listener = setup_logging(LOG_LEVEL, LOG_FORMAT, LOG_SAMPLE)
 
 # Отключаем логирование aiogram
 logging.getLogger("aiogram").setLevel(logging.WARNING)
 logging.getLogger("aiohttp").setLevel(logging.WARNING)
 
 if __name__ == "__main__":
-    print()  # Пустая строка перед запуском
+    if LOG_FORMAT == "text":
+        print()  # Пустая строка перед запуском
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
         # Сообщение о ручной остановке уже выводится в main.py
         pass
-    print()  # Пустая строка после остановки
\ No newline at end of file
+    finally:
+        # Дописываем очередь логов до выхода
+        listener.stop()
+    if LOG_FORMAT == "text":
+        print()  # Пустая строка после остановки